@@ -0,0 +1,7 @@
+"""Timing helper shared by the benchmarks."""
+import timeit
+
+def bench(label, f, number):
+    """Prints the best time per call of f over 3 runs of number calls."""
+    t = min(timeit.repeat(f, number=number, repeat=3)) / number
+    print("{0:<22} {1:>12.3f} ms".format(label, t * 1000))
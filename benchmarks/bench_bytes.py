@@ -0,0 +1,47 @@
+"""bytes slicing: memoryview views vs. copies.
+
+To run:
+  $ PYTHONPATH=. python benchmarks/bench_bytes.py [n]
+
+Parses a buffer of n bytes made up of length-prefixed records, slicing off
+each record and the remainder of the buffer as a + pattern does, either by
+copying (as slicing a Python bytes object does) or by taking memoryview
+views (as slicing a typy ibytes value does):
+
+  copy    slices of bytes objects
+  view    slices of memoryviews
+"""
+import struct
+import sys
+
+from _bench import bench
+
+def make_buffer(n, record_size=16):
+    record = struct.pack(">H", record_size) + b"x" * record_size
+    return record * (n // len(record))
+
+def parse_copy(buf):
+    count = 0
+    while len(buf) >= 2:
+        size = (buf[0] << 8) | buf[1]
+        record, buf = buf[2:2 + size], buf[2 + size:]
+        count += 1
+    return count
+
+def parse_view(buf):
+    buf = memoryview(buf)
+    count = 0
+    while len(buf) >= 2:
+        size = (buf[0] << 8) | buf[1]
+        record, buf = buf[2:2 + size], buf[2 + size:]
+        count += 1
+    return count
+
+def main(n):
+    print("n = {0}".format(n))
+    buf = make_buffer(n)
+    bench("copy", lambda: parse_copy(buf), 1)
+    bench("view", lambda: parse_view(buf), 1)
+
+if __name__ == "__main__":
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else 1000000)
@@ -0,0 +1,67 @@
+"""idict representation: HAMTs vs. copy-on-update dicts.
+
+To run:
+  $ PYTHONPATH=. python benchmarks/bench_idict.py [n]
+
+Compares the hash array mapped tries that represent idict values against
+immutable maps represented as dicts that are copied on every update, as
+{**d, k: v} does, on maps of n entries:
+
+  update  applies n functional updates to a map of n entries, keeping
+          every version
+  build   builds the map one functional insertion at a time
+  lookup  reads every entry by key
+"""
+import sys
+
+from typy.std._hamt import hamt
+
+from _bench import bench
+
+def update_dict(d, n):
+    versions = [ ]
+    for i in range(n):
+        d = dict(d)
+        d[i] = -i
+        versions.append(d)
+    return versions
+
+def update_hamt(m, n):
+    versions = [ ]
+    for i in range(n):
+        m = m.set(i, -i)
+        versions.append(m)
+    return versions
+
+def build_dict(n):
+    d = { }
+    for i in range(n):
+        d = dict(d)
+        d[i] = i
+    return d
+
+def build_hamt(n):
+    m = hamt()
+    for i in range(n):
+        m = m.set(i, i)
+    return m
+
+def lookup(m, n):
+    total = 0
+    for i in range(n):
+        total += m[i]
+    return total
+
+def main(n):
+    print("n = {0}".format(n))
+    d = dict((i, i) for i in range(n))
+    m = hamt(d.items())
+    bench("update  dict", lambda: update_dict(d, n), 1)
+    bench("update  hamt", lambda: update_hamt(m, n), 1)
+    bench("build   dict", lambda: build_dict(n), 1)
+    bench("build   hamt", lambda: build_hamt(n), 1)
+    bench("lookup  dict", lambda: lookup(d, n), 10)
+    bench("lookup  hamt", lambda: lookup(m, n), 10)
+
+if __name__ == "__main__":
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else 10000)
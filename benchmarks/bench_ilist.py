@@ -0,0 +1,57 @@
+"""ilist representation: persistent vectors vs. tuples.
+
+To run:
+  $ PYTHONPATH=. python benchmarks/bench_ilist.py [n]
+
+Compares the persistent vectors that represent ilist values against
+immutable lists represented as tuples, on lists of n elements:
+
+  append  builds the list one functional append at a time
+  index   reads every element by index
+  slice   walks the list by repeatedly taking all but the first element,
+          as [x] + rest patterns do
+"""
+import sys
+
+from typy.std._pvector import pvector
+
+from _bench import bench
+
+def append_tuple(n):
+    xs = ()
+    for i in range(n):
+        xs = xs + (i,)
+    return xs
+
+def append_pvector(n):
+    xs = pvector()
+    for i in range(n):
+        xs = xs.append(i)
+    return xs
+
+def index(xs):
+    total = 0
+    for i in range(len(xs)):
+        total += xs[i]
+    return total
+
+def slice_walk(xs):
+    total = 0
+    while len(xs) > 0:
+        total += xs[0]
+        xs = xs[1:]
+    return total
+
+def main(n):
+    print("n = {0}".format(n))
+    xs_tuple = tuple(range(n))
+    xs_pvector = pvector(range(n))
+    bench("append  tuple", lambda: append_tuple(n), 3)
+    bench("append  pvector", lambda: append_pvector(n), 3)
+    bench("index   tuple", lambda: index(xs_tuple), 10)
+    bench("index   pvector", lambda: index(xs_pvector), 10)
+    bench("slice   tuple", lambda: slice_walk(xs_tuple), 3)
+    bench("slice   pvector", lambda: slice_walk(xs_pvector), 3)
+
+if __name__ == "__main__":
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else 10000)
@@ -0,0 +1,114 @@
+"""json and msgpack codecs: generated vs. reflective conversion.
+
+To run:
+  $ PYTHONPATH=. python benchmarks/bench_json.py [n]
+
+Converts a list of n documents, each a record nested 6 levels deep with a
+variant at every level, to and from JSON values, with the json codec
+generated for the type and with a converter that walks a schema of the
+type for every value, as a generic serializer would; and to and from
+msgpack bytes with the generated msgpack codec (and pickle, for scale):
+
+  to json      converts every document to its JSON value
+  from json    converts every JSON value back, validating it
+  msgpack      encodes, then decodes, every document
+"""
+import pickle
+import sys
+
+from typy import component
+from typy.std import record, variant, string, num, ieee, boolean
+from typy.std import codecs
+from typy.std.codecs import _canonical
+
+from _bench import bench
+
+@component
+def Docs():
+    Leaf [type] = record[id : num, name : string, score : ieee, ok : boolean]
+    Status [type] = variant[Active(num), Archived(string), Deleted]
+    L1 [type] = record[item : Leaf, status : Status, weight : ieee]
+    L2 [type] = record[item : L1, status : Status, weight : ieee]
+    L3 [type] = record[item : L2, status : Status, weight : ieee]
+    L4 [type] = record[item : L3, status : Status, weight : ieee]
+    Doc [type] = record[item : L4, status : Status, weight : ieee]
+
+def make_docs(n):
+    statuses = [("Active", 3), ("Archived", "2016"), ("Deleted",)]
+    docs = [ ]
+    for i in range(n):
+        # record values are tuples of their fields, sorted by label
+        v = (i, "leaf " + str(i), i % 2 == 0, i * 0.5)
+        for level in range(5):
+            v = (v, statuses[(i + level) % 3], level * 1.5)
+        docs.append(v)
+    return docs
+
+def schema(ty):
+    """Resolves ty once, as a generic serializer's schema would be."""
+    ty = _canonical(ty)
+    fragment = ty.fragment
+    if fragment is record:
+        lbls = sorted(ty.idx.keys())
+        return (record, [(lbl, schema(ty.idx[lbl])) for lbl in lbls])
+    elif fragment is variant:
+        return (variant, dict(
+            (tag, [schema(arg_ty) for arg_ty in args])
+            for tag, args in ty.idx.items()))
+    return (fragment, None)
+
+def to_json(s, v):
+    fragment, fields = s
+    if fragment is record:
+        return dict((lbl, to_json(field_s, x))
+                    for (lbl, field_s), x in zip(fields, v))
+    elif fragment is variant:
+        tag = v[0]
+        return {tag: [to_json(arg_s, x)
+                      for arg_s, x in zip(fields[tag], v[1:])]}
+    return v
+
+_classes = {num: int, ieee: float, string: str, boolean: bool}
+
+def from_json(s, v):
+    fragment, fields = s
+    if fragment is record:
+        if not isinstance(v, dict):
+            raise ValueError("Expected record.")
+        return tuple(from_json(field_s, v[lbl]) for lbl, field_s in fields)
+    elif fragment is variant:
+        (tag, args), = v.items()
+        arg_ss = fields[tag]
+        if len(args) != len(arg_ss):
+            raise ValueError("Wrong number of arguments.")
+        return (tag,) + tuple(
+            from_json(arg_s, x) for arg_s, x in zip(arg_ss, args))
+    if v.__class__ is not _classes[fragment]:
+        raise ValueError("Expected " + fragment.__name__ + ".")
+    return v
+
+def main(n):
+    print("n = {0}".format(n))
+    docs = make_docs(n)
+    json = codecs.json_codec(Docs, "Doc")
+    msgpack = codecs.msgpack_codec(Docs, "Doc")
+    s = schema(json.ty)
+    values = [json.encode(v) for v in docs]
+    assert values == [to_json(s, v) for v in docs]
+    assert [json.decode(x) for x in values] == docs
+    assert [from_json(s, x) for x in values] == docs
+    packed = [msgpack.encode(v) for v in docs]
+    assert [msgpack.decode(b) for b in packed] == docs
+    bench("to json    generated", lambda: [json.encode(v) for v in docs], 3)
+    bench("to json    reflective", lambda: [to_json(s, v) for v in docs], 3)
+    bench("from json  generated", lambda: [json.decode(x) for x in values], 3)
+    bench("from json  reflective", 
+          lambda: [from_json(s, x) for x in values], 3)
+    bench("msgpack    encode", lambda: [msgpack.encode(v) for v in docs], 3)
+    bench("msgpack    decode", lambda: [msgpack.decode(b) for b in packed], 3)
+    bench("pickle     dumps", lambda: [pickle.dumps(v) for v in docs], 3)
+    pickled = [pickle.dumps(v) for v in docs]
+    bench("pickle     loads", lambda: [pickle.loads(b) for b in pickled], 3)
+
+if __name__ == "__main__":
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else 10000)
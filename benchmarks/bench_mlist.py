@@ -0,0 +1,57 @@
+"""mlist representation: arrays vs. lists.
+
+To run:
+  $ PYTHONPATH=. python benchmarks/bench_mlist.py [n]
+
+Compares the arrays of unboxed machine integers that represent mlist[num]
+values against Python lists of boxed ints, on lists of n elements:
+
+  memory  the memory allocated to hold the list
+  append  builds the list one append at a time
+  sum     iterates over the list, summing its elements
+"""
+import array
+import sys
+import tracemalloc
+
+from _bench import bench
+
+def build_list(n):
+    xs = [ ]
+    for i in range(n):
+        xs.append(i * 1000)
+    return xs
+
+def build_array(n):
+    xs = array.array('q', [ ])
+    for i in range(n):
+        xs.append(i * 1000)
+    return xs
+
+def memory(f, n):
+    tracemalloc.start()
+    xs = f(n)
+    size, _ = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return size
+
+def total(xs):
+    s = 0
+    for x in xs:
+        s += x
+    return s
+
+def main(n):
+    print("n = {0}".format(n))
+    print("{0:<22} {1:>12} bytes".format(
+        "memory  list", memory(build_list, n)))
+    print("{0:<22} {1:>12} bytes".format(
+        "memory  array", memory(build_array, n)))
+    bench("append  list", lambda: build_list(n), 3)
+    bench("append  array", lambda: build_array(n), 3)
+    xs_list, xs_array = build_list(n), build_array(n)
+    bench("sum     list", lambda: total(xs_list), 10)
+    bench("sum     array", lambda: total(xs_array), 10)
+
+if __name__ == "__main__":
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else 100000)
@@ -0,0 +1,113 @@
+"""proto codecs: generated vs. interpreted encoders, and pickle.
+
+To run:
+  $ PYTHONPATH=. python benchmarks/bench_proto.py [n]
+
+Encodes and decodes a list of n orders, each a record containing a nested
+record and variant, with the proto codec generated for the type, with an
+encoder of the same wire format that walks a schema of the type for every
+value, and with pickle:
+
+  encode     time to encode every order
+  decode     time to decode every order
+  size       total size of the encoded orders
+"""
+import pickle
+import sys
+
+from typy import component
+from typy.std import record, variant, string, num, ieee, boolean
+from typy.std import codecs
+from typy.std.codecs import _canonical, _lbl_number, _varint, _pack_d
+
+from _bench import bench
+
+@component
+def Orders():
+    Customer [type] = record[id : num, name : string, vip : boolean]
+    Payment [type] = variant[Card(string, num), Cash, Credit(ieee)]
+    Order [type] = record[
+        id : num, customer : Customer, payment : Payment, total : ieee]
+
+def make_orders(n):
+    payments = [("Card", "4111", 1225), ("Cash",), ("Credit", 12.5)]
+    # record values are tuples of their fields, sorted by label
+    return [((i * 7, "customer " + str(i), i % 3 == 0), i,
+             payments[i % 3], i * 1.25) for i in range(n)]
+
+def schema(ty):
+    """Resolves ty once, as a generic serializer's schema would be."""
+    ty = _canonical(ty)
+    fragment = ty.fragment
+    if fragment is record:
+        return (record, [(_lbl_number(lbl), schema(ty.idx[lbl]))
+                         for lbl in sorted(ty.idx.keys())])
+    elif fragment is variant:
+        return (variant, dict(
+            (tag, (_lbl_number(tag), [
+                (n + 1, schema(arg_ty)) for n, arg_ty in enumerate(args)]))
+            for tag, args in ty.idx.items()))
+    return (fragment, None)
+
+def encode_interpreted(s, v, out):
+    """Encodes v by walking its schema, s."""
+    fragment, fields = s
+    if fragment is variant:
+        number, fields = fields[v[0]]
+        p = bytearray()
+        for (arg_number, arg_s), x in zip(fields, v[1:]):
+            encode_field(arg_number, arg_s, x, p)
+        out += _varint((number << 3) | 2)
+        out += _varint(len(p))
+        out += p
+    else:
+        for (number, field_s), x in zip(fields, v):
+            encode_field(number, field_s, x, out)
+
+def encode_field(number, s, x, out):
+    fragment = s[0]
+    if fragment is num:
+        out += _varint(number << 3)
+        out += _varint(x << 1 if x >= 0 else (x << 1) ^ -1)
+    elif fragment is boolean:
+        out += _varint(number << 3)
+        out.append(1 if x else 0)
+    elif fragment is ieee:
+        out += _varint((number << 3) | 1)
+        out += _pack_d(x)
+    else:
+        if fragment is string:
+            b = x.encode()
+        else:
+            b = bytearray()
+            encode_interpreted(s, x, b)
+        out += _varint((number << 3) | 2)
+        out += _varint(len(b))
+        out += b
+
+def main(n):
+    print("n = {0}".format(n))
+    orders = make_orders(n)
+    codec = codecs.proto_codec(Orders, "Order")
+    s = schema(codec.ty)
+    def interpreted(v):
+        out = bytearray()
+        encode_interpreted(s, v, out)
+        return bytes(out)
+    encoded = [codec.encode(v) for v in orders]
+    assert encoded == [interpreted(v) for v in orders]
+    pickled = [pickle.dumps(v, pickle.HIGHEST_PROTOCOL) for v in orders]
+    assert [codec.decode(b) for b in encoded] == orders
+    bench("encode  generated", lambda: [codec.encode(v) for v in orders], 3)
+    bench("encode  interpreted", lambda: [interpreted(v) for v in orders], 3)
+    bench("encode  pickle", lambda: [
+        pickle.dumps(v, pickle.HIGHEST_PROTOCOL) for v in orders], 3)
+    bench("decode  generated", lambda: [codec.decode(b) for b in encoded], 3)
+    bench("decode  pickle", lambda: [pickle.loads(b) for b in pickled], 3)
+    print("{0:<22} {1:>12} bytes".format(
+        "size    proto", sum(len(b) for b in encoded)))
+    print("{0:<22} {1:>12} bytes".format(
+        "size    pickle", sum(len(b) for b in pickled)))
+
+if __name__ == "__main__":
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else 10000)
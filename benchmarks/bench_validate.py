@@ -0,0 +1,55 @@
+"""validators: one row at a time vs. a column at a time.
+
+To run:
+  $ PYTHONPATH=. python benchmarks/bench_validate.py [n]
+
+Checks and converts a list of n rows, Python dicts with num, ieee and
+string fields (some ieee fields given as ints), into record values:
+
+  reflective  walks a schema of the type for every row
+  validate    calls the generated validate on every row
+  rows        calls the generated validate_rows on the list
+"""
+import sys
+
+from typy import component
+from typy.std import record, string, num, ieee
+from typy.std import codecs
+
+from _bench import bench
+
+@component
+def Rows():
+    Trade [type] = record[
+        id : num, symbol : string, qty : num, price : ieee, fee : ieee]
+
+def make_rows(n):
+    return [{"id": i, "symbol": "S" + str(i % 100), "qty": i % 1000,
+             "price": i * 0.25, "fee": i % 3} for i in range(n)]
+
+_classes = {num: (int,), ieee: (int, float), string: (str,)}
+
+def validate_reflective(fields, row):
+    values = [ ]
+    for lbl, fragment in fields:
+        x = row[lbl]
+        if x.__class__ not in _classes[fragment]:
+            raise ValueError("Expected " + fragment.__name__ + ".")
+        values.append(float(x) if fragment is ieee else x)
+    return tuple(values)
+
+def main(n):
+    print("n = {0}".format(n))
+    rows = make_rows(n)
+    v = codecs.validator(Rows, "Trade")
+    fields = [(lbl, v.ty.idx[lbl].fragment) for lbl in sorted(v.ty.idx)]
+    expected = [validate_reflective(fields, row) for row in rows]
+    assert [v.validate(row) for row in rows] == expected
+    assert v.validate_rows(rows) == expected
+    bench("reflective", 
+          lambda: [validate_reflective(fields, row) for row in rows], 1)
+    bench("validate", lambda: [v.validate(row) for row in rows], 1)
+    bench("rows", lambda: v.validate_rows(rows), 1)
+
+if __name__ == "__main__":
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else 1000000)
@@ -8,6 +8,7 @@ import ast
 
 import typy
 from typy import component
+from typy.std import record, string, num, ieee
 
 g = 0
 a = 0
@@ -122,3 +123,270 @@ def test_too_many_val_assigns():
             t [: unit] = t2 = unit
 
 
+
+def test_component_module():
+    @component
+    def c():
+        t [type] = unit
+        x [: t] = ()
+
+    assert c.name == "c"
+    assert c._module.__name__ == __name__ + ".c"
+    # only names referenced by the translation are brought into the module
+    assert 'pytest' not in c._module.__dict__
+    assert 'g' not in c._module.__dict__
+
+    # and they are referenced in the defining environment, not copied
+    ys = [1]
+    @component
+    def d():
+        v = ys
+    assert d._module.v is ys
+    assert 'ys' not in d._module.__dict__
+
+def test_scope_stack():
+    from typy.util import ScopeStack
+    s = ScopeStack({'x': 0})
+    s.push({'x': 1, 'y': 2})
+    assert s['x'] == 1 and s['y'] == 2
+    cp = s.checkpoint()
+    s.push()
+    s['y'] = 3
+    s['y'] = 4
+    assert s['y'] == 4
+    s.pop()
+    assert s['y'] == 2
+    s.push({'z': 5})
+    s.rollback(cp)
+    assert 'z' not in s
+    s.pop()
+    assert s['x'] == 0
+    assert 'y' not in s
+    with pytest.raises(KeyError):
+        s['y']
+
+def test_component_sealed():
+    @component(sealed=True)
+    def A():
+        Name [type] = string
+        Account [type] = record[name : Name, balance : num]
+        test_acct [: Account] = {name: "Harry", balance: 100}
+
+    assert A.tree is None and A.ctx is None and A._members is None
+    assert A._module.test_acct == (100, "Harry")
+    # nothing in the export interface refers back to the dropped Context
+    assert isinstance(A.kind_of('Account').ty.idx['name'], 
+                      typy._ty_exprs.TyExprPrj)
+
+    @component
+    def B():
+        acct [: A.Account] = A.test_acct
+        name [: A.Name] = "Harry"
+    assert B._module.acct == (100, "Harry")
+
+    c = A.unsealed()
+    assert c._translation is not None
+
+    # components sealed after the fact can be unsealed too
+    B.seal()
+    assert B.unsealed()._translation is not None
+
+    # unsealed copies are checked with the options of the original
+    @component(sealed=True, fused=True, optimize=True)
+    def D():
+        n [: num] = 1
+    d = D.unsealed()
+    assert d.fused and d.optimize and d.ctx.optimize
+
+    # a component that was not defined by a function cannot be
+    c.seal()
+    with pytest.raises(typy.UsageError):
+        c.unsealed()
+
+def test_component_interface(monkeypatch):
+    @component(sealed=True)
+    def IfaceA():
+        Name [type] = string
+        Account [type] = record[name : Name, balance : num]
+        test_acct [: Account] = {name: "Harry", balance: 100}
+    # the interface imports its implementation from this module by name
+    monkeypatch.setitem(globals(), "IfaceA", IfaceA)
+
+    iface = typy.loads_interface(typy.dumps_interface(IfaceA))
+    assert isinstance(iface, typy.ComponentInterface)
+    assert iface.qualname == IfaceA.qualname
+    assert iface.kind_of('Account').ty.fragment is record
+    assert iface.kind_of('Account').ty.idx['name'].path_val is iface
+    assert typy.dumps_interface(iface) == typy.dumps_interface(IfaceA)
+
+    @component
+    def B():
+        acct [: iface.Account] = {name: "Sally", balance: 5}
+        acct2 [: iface.Account] = iface.test_acct
+    assert B._module.acct == (5, "Sally")
+    assert B._module.acct2 == (100, "Harry")
+
+def test_component_recheck():
+    def v1():
+        def c():
+            t [type] = num
+            x [: t] = 1
+            y [: t] = x + 1
+            z [: num] = 3
+        return c
+    def v2():
+        def c():
+            t [type] = num
+            x [: t] = 1
+            y [: t] = x + 2
+            z [: num] = 3
+        return c
+    def v3():
+        def c():
+            t [type] = ieee
+            x [: t] = 1.5
+            y [: t] = x + 2
+            z [: num] = 3
+        return c
+    c = component(v1())
+    assert [m.id for m in c.recheck(v2())] == ['y']
+    assert c._module.y == 3 and c._module.z == 3
+    assert [m.id for m in c.recheck(v3())] == ['t', 'x', 'y']
+    assert c._module.y == 3.5
+    def v4():
+        def c():
+            t [type] = ieee
+            x [: t] = 1.5
+            y [: t] = "oops"
+            z [: num] = 3
+        return c
+    with pytest.raises(typy.TyError):
+        c.recheck(v4())
+    # a failed recheck leaves the component as it was
+    assert [m.id for m in c.recheck(v2())] == ['t', 'x', 'y']
+    assert c._module.y == 3
+
+def test_component_recheck_append():
+    def v1():
+        def c():
+            x [: num] = 1
+        return c
+    def v2():
+        def c():
+            x [: num] = 1
+            y [: num] = x + 1
+        return c
+    c = component(v1())
+    assert [m.id for m in c.recheck(v1())] == [ ]
+    assert [m.id for m in c.recheck(v2())] == ['y']
+    assert c._module.y == 2
+    assert [m.id for m in c.recheck(v2())] == [ ]
+    assert c._module.y == 2
+
+def test_component_recheck_static_env():
+    from typy.std import ieee
+    def v(T):
+        def c():
+            x [: T] = 1
+            y [: num] = 2
+        return c
+    c = component(v(num))
+    assert [m.id for m in c.recheck(v(num))] == [ ]
+    assert [m.id for m in c.recheck(v(ieee))] == ['x']
+    assert c._module.x == 1
+
+def test_component_recheck_order():
+    def v1():
+        def c():
+            t [type] = num
+            x [: t] = 1
+        return c
+    def v2():
+        def c():
+            x [: t] = 1
+            t [type] = num
+        return c
+    c = component(v1())
+    # x is unchanged but now refers to t before it is defined
+    with pytest.raises(typy.KindError):
+        c.recheck(v2())
+    assert [m.id for m in c.recheck(v1())] == [ ]
+    assert c._module.x == 1
+
+def test_component_recheck_evaluate():
+    def v1():
+        def c():
+            x [: num] = 1
+            y [: num] = x + 1
+        return c
+    def v2():
+        def c():
+            x [: num] = 0
+            y [: num] = 1 // x
+        return c
+    c = component(v1())
+    module = c._module
+    with pytest.raises(ZeroDivisionError):
+        c.recheck(v2())
+    # a recheck that fails to evaluate leaves the component as it was
+    assert c._module is module
+    assert [m.id for m in c.recheck(v1())] == [ ]
+
+def test_component_fused():
+    import astunparse
+    from typy.std import fn, boolean
+    def c():
+        Account [type] = record[name : string, balance : num]
+        test_acct [: Account] = {name: "Harry", balance: 100}
+
+        @fn
+        def deposit(acct : Account, amount : num) -> Account:
+            {name: acct.name, balance: acct.balance + amount}
+
+        @fn
+        def classify(n : num) -> string:
+            [n].match
+            with 0: "zero"
+            with _: "many"
+
+        y = deposit(test_acct, 5)
+        @fn
+        def inc(x : num) -> num:
+            x + 1
+
+        b [: boolean] = True if inc(y.balance) > 100 else False
+    two_phase = component(c)
+    fused = component(fused=True)(c)
+    assert fused.ctx.fused
+    assert (astunparse.unparse(fused._translation) == 
+            astunparse.unparse(two_phase._translation))
+    assert fused._module.y == (105, "Harry")
+
+def test_trivial_types():
+    from typy.std import num_ty, string_ty
+    from typy._ty_exprs import UTyExpr, trivial_ty
+    @component
+    def c():
+        x [: num] = 1
+        y [: string] = "test"
+    assert c._val_exports['x'].ty is num_ty
+    assert c._val_exports['y'].ty is string_ty
+    assert trivial_ty(record) is None
+    e = ast.parse("num").body[0].value
+    assert UTyExpr.parse(e) is UTyExpr.parse(e)
+
+def test_as_type_cache():
+    from typy._contexts import Context
+    from typy._static_envs import StaticEnv
+    from typy._ty_exprs import SingletonKind
+    from typy.std import num_ty, string_ty
+    ctx = Context(StaticEnv({ }, {'record': record}))
+    ctx.push_uty_expr_binding(ast.Name(id='t'), SingletonKind(num_ty))
+    ann = lambda: ast.parse("record[a : t]").body[0].value
+    ty = ctx.as_type(ann())
+    assert ctx.as_type(ann()) is ty
+    # rebinding t invalidates the cached type
+    ctx.push_uty_expr_binding(ast.Name(id='t'), SingletonKind(string_ty))
+    ty2 = ctx.as_type(ann())
+    assert ty2 is not ty
+    assert ctx.canonicalize(ty2.idx['a']) is string_ty
@@ -10,7 +10,9 @@ from typy.util.testing import ast_eq, trans_str, trans_truth
 
 import typy
 from typy._ty_exprs import CanonicalTy
-from typy.std import boolean, unit, num, ieee, record, string, py, fn, variant, tpl
+from typy.std import (
+    boolean, unit, num, ieee, record, string, py, fn, variant, tpl, ilist, 
+    idict, mlist, ibytes, string_in, codecs)
 from typy._components import component # TODO
 
 # 
@@ -1006,3 +1008,639 @@ def test_module_value_access():
     def m2():
         y = m1.x
 
+
+def test_optimize():
+    @component
+    def A():
+        @fn
+        def double(x : num) -> num:
+            x + x
+
+    @component(optimize=True)
+    def B():
+        @fn
+        def incr(x : num) -> num:
+            x + 1
+
+        y = A.double(3)
+        z = incr(3)
+
+        @fn
+        def f(x : num) -> num:
+            A.double(incr(x))
+
+    translation = trans_str(B._translation)
+    assert "_ref_A = A._module" in translation
+    assert "_ref_A_double = _ref_A.double" in translation
+    assert "_ref_A_double(3)" in translation
+    assert "= (3 + 1)" in translation
+    assert B._module.y == 6
+    assert B._module.z == 4
+    assert B._module.f(2) == 6
+
+def test_optimize_refs():
+    @component
+    def A():
+        n [: num] = 2
+        s [: py] = [ ]
+
+    @component(optimize=True)
+    def B():
+        @fn
+        def f(x : num) -> num:
+            x + A.n
+        s = A.s
+
+    translation = trans_str(B._translation)
+    assert "_ref_A_n = _ref_A.n" in translation
+    assert "(_x_1 + _ref_A_n)" in translation
+    assert "s = _ref_A.s" in translation
+    assert B._module.f(1) == 3
+    assert B._module.s is A._module.s
+
+def test_optimize_locals():
+    @component(optimize=True)
+    def c():
+        n [: num] = 10
+        [n].match
+        with 10: n
+        with y: y
+
+        @fn
+        def f(x : num) -> num:
+            x + n
+        m = f(n)
+
+    translation = trans_str(c._translation)
+    assert "def _typy_component_body():" in translation
+    assert "(n, f, m) = _typy_component_body()" in translation
+    module = c._module
+    assert module.n == 10
+    assert module.f(1) == 11
+    assert module.m == 20
+    assert not hasattr(module, "_typy_component_body")
+    assert not hasattr(module, "__typy_scrutinee__")
+    assert module.f.__qualname__ == "f"
+
+def test_optimize_locals_read_before_bound():
+    g = 5
+    def c():
+        y = g
+        g [: num] = 1
+
+        @fn
+        def f(x : num) -> num:
+            x + g
+    for optimize in [False, True]:
+        module = component(optimize=optimize)(c)._module
+        assert (module.y, module.g, module.f(1)) == (5, 1, 2)
+
+def test_fn_tail_calls():
+    @component
+    def c():
+        @fn
+        def count(n : num, acc : num) -> num:
+            [n].match
+            with 0: acc
+            with m: count(m - 1, acc + 1)
+
+        @fn
+        def fact(n : num) -> num:
+            [n].match
+            with 0: 1
+            with m: m * fact(m - 1)
+
+        @fn
+        def outer(n : num) -> num:
+            @fn
+            def loop(k : num) -> num:
+                [k].match
+                with 0: n
+                with j: loop(j - 1)
+            loop(n)
+
+    translation = trans_str(c._translation)
+    assert "while True:" in translation
+    assert "continue" in translation
+    assert c._module.count(100000, 0) == 100000
+    assert c._module.fact(5) == 120
+    assert c._module.outer(100000) == 100000
+
+def test_ilist():
+    @component
+    def c():
+        xs [: ilist[num]] = [1, 2, 3]
+        empty [: ilist[num]] = []
+        ys = xs + [4, 5]
+        zs [: ilist[num]] = [x * 2 for x in ys if x > 2]
+        first = xs[0]
+        rest = ys[1:]
+        same = (xs == [1, 2, 3])
+
+        @fn
+        def total(xs : ilist[num], acc : num) -> num:
+            [xs].match
+            with []: acc
+            with [x] + rest: total(rest, acc + x)
+
+        @fn
+        def second_last(xs : ilist[num]) -> num:
+            [xs].match
+            with [x, y]: x
+            with _ + [x, _]: x
+            with _: 0
+
+    module = c._module
+    assert list(module.xs) == [1, 2, 3]
+    assert list(module.empty) == []
+    assert list(module.ys) == [1, 2, 3, 4, 5]
+    assert list(module.zs) == [6, 8, 10]
+    assert module.first == 1
+    assert list(module.rest) == [2, 3, 4, 5]
+    assert module.same is True
+    assert module.total(module.ys, 0) == 15
+    assert module.second_last(module.ys) == 4
+    assert module.second_last(module.empty) == 0
+
+def test_ilist_invalid():
+    with pytest.raises(typy.TyError):
+        @component
+        def c():
+            xs [: ilist[num]] = [1, "two"]
+    with pytest.raises(typy.TyError):
+        @component
+        def d():
+            xs [: ilist[num]] = [1]
+            ys [: ilist[string]] = ["a"]
+            zs = xs + ys
+
+def test_idict():
+    @component
+    def c():
+        d [: idict[string, num]] = {"a": 1, "b": 2}
+        empty [: idict[string, num]] = {}
+        d2 [: idict[string, num]] = {**d, "c": 3}
+        d3 [: idict[string, num]] = {**d2, "a": 10, "d": 4}
+        x = d2["c"]
+        has_a = "a" in d
+        same = (d == {"b": 2, "a": 1})
+
+        @fn
+        def f(d : idict[string, num]) -> num:
+            [d].match
+            with {"a": 1, "b": y}: y
+            with {"a": x, **rest}: x
+            with _: 0
+
+        @fn
+        def g(d : idict[string, num]) -> idict[string, num]:
+            [d].match
+            with {"a": _, **rest}: rest
+            with _: d
+
+    module = c._module
+    assert len(module.empty) == 0
+    assert dict(module.d2.items()) == {"a": 1, "b": 2, "c": 3}
+    assert dict(module.d3.items()) == {"a": 10, "b": 2, "c": 3, "d": 4}
+    assert dict(module.d.items()) == {"a": 1, "b": 2}
+    assert module.x == 3
+    assert module.has_a is True
+    assert module.same is True
+    assert module.f(module.d) == 2
+    assert module.f(module.d3) == 10
+    assert module.f(module.empty) == 0
+    assert dict(module.g(module.d3).items()) == {"b": 2, "c": 3, "d": 4}
+
+def test_idict_invalid():
+    with pytest.raises(typy.TyError):
+        @component
+        def c():
+            d [: idict[string, num]] = {"a": "b"}
+    with pytest.raises(typy.TyError):
+        @component
+        def d():
+            d [: idict[string, num]] = {"a": 1}
+            x = d[1]
+
+def test_mlist():
+    @component
+    def c():
+        xs [: mlist[num]] = [1, 2, 3]
+        ws [: mlist[ieee]] = [0.5, 1.5]
+        ss [: mlist[string]] = ["a", "b"]
+        ys [: mlist[num]] = [x * 2 for x in xs]
+        first = xs[0]
+
+        @fn
+        def fill(xs : mlist[num], n : num) -> num:
+            xs.append(n)
+            xs.extend(ys)
+            xs[0] = 10
+            acc [: mlist[num]] = [0]
+            for x in xs:
+                acc[0] = acc[0] + x
+            acc[0]
+
+        @fn
+        def last(xs : mlist[num]) -> num:
+            xs.pop()
+
+    import array
+    module = c._module
+    assert isinstance(module.xs, array.array)
+    assert module.xs.typecode == 'q'
+    assert module.ws.typecode == 'd'
+    assert module.ss == ["a", "b"]
+    assert list(module.ys) == [2, 4, 6]
+    assert module.first == 1
+    assert module.fill(module.xs, 4) == 10 + 2 + 3 + 4 + 12
+    assert list(module.xs) == [10, 2, 3, 4, 2, 4, 6]
+    assert module.last(module.xs) == 6
+    assert list(module.xs[1:3]) == [2, 3]
+
+def test_mlist_slice_and_unit_methods():
+    @component
+    def c():
+        xs [: mlist[num]] = [1, 2, 3, 4]
+        # slices of mlists are mlists
+        ys [: mlist[num]] = xs[1:3]
+
+        @fn
+        def add(xs : mlist[num], ys : mlist[num]) -> unit:
+            xs.append(5)
+            xs.extend(ys)
+
+        appended = add(ys, xs)
+        push = xs.append
+        pushed = push(6)
+
+    import array
+    module = c._module
+    assert isinstance(module.ys, array.array)
+    assert list(module.ys) == [2, 3, 5, 1, 2, 3, 4]
+    assert module.appended == ()
+    assert list(module.xs) == [1, 2, 3, 4, 6] and module.pushed == ()
+    # calls go directly to the backing storage's methods
+    translation = trans_str(c._translation)
+    assert ".append(5) or ())" in translation
+    assert ".extend(" in translation and "_mlist" not in translation
+    with pytest.raises(typy.TyError):
+        @component
+        def d():
+            xs [: mlist[num]] = [1, 2, 3, 4]
+            zs [: ilist[num]] = xs[1:3]
+
+def test_mlist_invalid():
+    with pytest.raises(typy.TyError):
+        @component
+        def c():
+            xs [: mlist[num]] = [1, "two"]
+    with pytest.raises(typy.TyError):
+        @component
+        def d():
+            xs [: mlist[num]] = [1]
+
+            @fn
+            def f(ys : mlist[num]):
+                ys.append("a")
+
+def test_bytes():
+    @component
+    def c():
+        hello [: ibytes] = b"hello"
+        hello_world = hello + b", " + b"world"
+        h = hello[0]
+        ell = hello[1:4]
+        same = (ell == b"ell")
+
+        @fn
+        def path(request : ibytes) -> ibytes:
+            [request].match
+            with b"GET " + rest: 
+                [rest].match
+                with path + b" HTTP/1.1": path
+                with _: rest
+            with b"": b"/"
+            with _: request
+
+        @fn
+        def to_py(b : ibytes) -> py:
+            b.py
+
+    module = c._module
+    assert module.hello_world == b"hello, world"
+    assert module.h == 104
+    assert isinstance(module.ell, memoryview)
+    assert module.same is True
+    request = b"GET /index.html HTTP/1.1"
+    path = module.path(request)
+    assert isinstance(path, memoryview) and path.obj is request
+    assert path == b"/index.html"
+    assert module.path(b"GET /") == b"/"
+    assert module.path(b"") == b"/"
+    assert module.path(b"PUT") == b"PUT"
+    assert module.to_py(path) == b"/index.html"
+    assert type(module.to_py(path)) is type(b"")
+    assert module.to_py(request) is request
+
+def test_bytes_invalid():
+    with pytest.raises(typy.TyError):
+        @component
+        def c():
+            b [: ibytes] = b"abc"
+            s = b + "def"
+    with pytest.raises(typy.TyError):
+        @component
+        def d():
+            b [: ibytes] = b"abc"
+            lt = b < b"abd"
+
+def test_string_in():
+    @component
+    def c():
+        Email [type] = string_in[r"(?P<user>\w+)@(?P<host>\w+(\.\w+)*)"]
+        admin [: Email] = "admin@example.com"
+
+        @fn
+        def parse(s : string) -> Email:
+            Email(s)
+
+        @fn
+        def host(e : Email) -> string:
+            [e.groups].match
+            with (user, host, _): host
+
+        @fn
+        def is_admin(e : Email) -> boolean:
+            [e].match
+            with "admin@example.com": True
+            with _: False
+
+    module = c._module
+    assert module.admin == "admin@example.com"
+    assert module.parse("bob@example.org") == "bob@example.org"
+    with pytest.raises(ValueError):
+        module.parse("bob")
+    assert module.host(module.admin) == "example.com"
+    assert module.is_admin(module.admin) is True
+    assert module.is_admin("bob@example.org") is False
+    # the regex is compiled once, at import
+    compiled = [
+        stmt for stmt in c._translation.body
+        if isinstance(stmt, ast.Assign) and 
+        stmt.targets[0].id.startswith("_string_in_re")]
+    assert len(compiled) == 1
+
+def test_string_in_invalid():
+    with pytest.raises(typy.TyError):
+        @component
+        def c():
+            x [: string_in[r"\d+"]] = "abc"
+    with pytest.raises(typy.TypeValidationError):
+        @component
+        def d():
+            x [: string_in[r"("]] = "("
+
+def test_match_dispatch():
+    @component
+    def c():
+        @fn
+        def cmd(s : string) -> num:
+            [s].match
+            with "get": 1
+            with "put": 2
+            with "del": 3
+            with "get": 4
+            with "list": 5
+            with "stat": 6
+            with "head": 7
+            with "move": 8
+            with _: 0
+
+        @fn
+        def f(x : py) -> py:
+            [x].match
+            with 1: "one"
+            with 1.0: "one point oh"
+            with 2: "two"
+            with "s": "s"
+            with b"s": "b"
+            with 3: "three"
+            with 4.5: "four and a half"
+            with 5j: "five i"
+            with _: "other"
+
+    class Two(object):
+        def __eq__(self, other):
+            return other == 2
+        __hash__ = None
+
+    module = c._module
+    assert [module.cmd(s) for s in ("get", "put", "list", "move", "")] \
+        == [1, 2, 5, 8, 0]
+    # rules shadow each other as they would with ==
+    assert [module.f(x) for x in (1, 1.0, True, 2, "s", b"s", 5j, 4.5)] \
+        == ["one", "one", "one", "two", "s", "b", "five i", "four and a half"]
+    assert [module.f(x) for x in (3.0, [1], Two(), None)] \
+        == ["three", "other", "two", "other"]
+    translation = ast.dump(c._translation)
+    assert "_typy_dispatch" in translation
+    assert "_typy_dispatch_types" in translation
+
+def test_match_regex_dispatch():
+    @component
+    def c():
+        @fn
+        def route(s : string) -> string:
+            [s].match
+            with f"/api/users/{rest}": "users " + rest
+            with f"/api/items/{rest}": "items " + rest
+            with "/api/health": "health"
+            with f"/api/{rest}": "api " + rest
+            with f"/static/{path}.css": "css " + path
+            with f"/static/{_}": "static"
+            with f"{_}.ico": "icon"
+            with f"/api/users/{_}/x": "unreachable"
+            with "/": "root"
+            with _: "not found"
+
+    module = c._module
+    assert [module.route(s) for s in (
+        "/api/users/bob", "/api/items/1", "/api/health", "/api/", 
+        "/static/a.css", "/static/a.png", "/a.ico", "/api/users/x/x", "/", 
+        "", "/api/users\n/x")] == [
+        "users bob", "items 1", "health", "api ", 
+        "css a", "static", "icon", "users x/x", "root", 
+        "not found", "api users\n/x"]
+    assert "_typy_pat_re" in ast.dump(c._translation)
+
+def test_py_dict_pattern():
+    @component
+    def c():
+        @fn
+        def kind(msg : py) -> py:
+            [msg].match
+            with {"type": "ping"}: "ping"
+            with {"type": t, "id": i}: t
+            with {"id": i, "type": t, "body": _}: i
+            with {}: "empty"
+            with _: "other"
+
+    module = c._module
+    assert module.kind({"type": "ping"}) == "ping"
+    assert module.kind({"type": "ack", "id": 1}) == "ack"
+    assert module.kind({"type": "ack", "id": 1, "body": None}) == 1
+    assert module.kind({}) == "empty"
+    assert module.kind({"type": "ping", "x": 1}) == "other"
+    assert module.kind({"id": 1, "x": 1}) == "other"
+    assert module.kind(["type"]) == "other"
+    # the key sets are hoisted frozensets
+    translation = ast.dump(c._translation)
+    assert "_typy_dict_keys" in translation
+    assert "Set(" not in translation
+
+def test_proto_codec():
+    @component
+    def c():
+        Account [type] = record[name : string, balance : num, vip : boolean]
+        Event [type] = variant[
+            Opened(Account), Deposit(num, ieee), Note(ibytes), Closed]
+        Log [type] = tpl[num, Event, unit]
+
+    @component
+    def c2():
+        Account [type] = record[
+            name : string, balance : num, vip : boolean, email : string]
+        Event [type] = variant[
+            Opened(Account), Deposit(num, ieee), Note(ibytes), Closed, Frozen]
+        Log [type] = tpl[num, Event, unit, string]
+
+    log = codecs.proto_codec(c, "Log")
+    assert codecs.proto_codec(c, "Log") is log
+    values = [
+        (0, ("Opened", (-2 ** 70, "Zoë", True)), ()),
+        (1, ("Deposit", 300, 0.5), ()),
+        (2, ("Note", b"\x00\xff"), ()),
+        (-3, ("Closed",), ())]
+    for v in values:
+        assert log.decode(log.encode(v)) == v
+    assert log.decode(memoryview(log.encode(values[0]))) == values[0]
+
+    # fields and cases that a decoder does not know are skipped
+    log2 = codecs.proto_codec(c2, "Log")
+    v2 = (0, ("Opened", (-1, "a@b.c", "a", False)), (), "new")
+    assert log.decode(log2.encode(v2)) == (0, ("Opened", (-1, "a", False)), ())
+    with pytest.raises(ValueError):
+        log.decode(log2.encode((0, ("Frozen",), (), "")))
+    with pytest.raises(ValueError):
+        log2.decode(log.encode(values[0]))
+    with pytest.raises(ValueError):
+        log.decode(log.encode(values[0])[:-1])
+
+    n = codecs.proto_codec(c2, "Account")
+    assert n.decode(n.encode((1, "e", "n", True))) == (1, "e", "n", True)
+    with pytest.raises(typy.UsageError):
+        codecs.proto_codec(c, "Missing")
+
+def test_json_codec():
+    @component
+    def c():
+        Account [type] = record[name : string, balance : num, rate : ieee]
+        Event [type] = variant[Opened(Account), Moved(num, num), Closed]
+        Log [type] = tpl[num, Event, unit, boolean]
+
+    log = codecs.json_codec(c, "Log")
+    assert codecs.json_codec(c, "Log") is log
+    v = (1, ("Opened", (10, "Zoë", 0.5)), (), True)
+    assert log.encode(v) == [
+        1, {"Opened": [{"name": "Zoë", "balance": 10, "rate": 0.5}]}, None,
+        True]
+    import json
+    for v in [v, (2, ("Moved", -1, 2 ** 70), (), False), 
+              (3, ("Closed",), (), True)]:
+        assert log.decode(json.loads(json.dumps(log.encode(v)))) == v
+    # ints are accepted as ieee values, and unknown fields are ignored
+    assert log.decode([1, {"Opened": [
+        {"name": "a", "balance": 1, "rate": 1, "x": None}]}, None, False]) \
+        == (1, ("Opened", (1, "a", 1.0)), (), False)
+    for bad in [
+            [1.0, {"Closed": []}, None, True],
+            [1, {"Closed": []}, None, 1],
+            [1, {"Closed": []}, None],
+            [1, {"Closed": [], "Moved": [1, 2]}, None, True],
+            [1, {"Open": []}, None, True],
+            [1, {"Moved": [1]}, None, True],
+            [1, {"Opened": [{"name": "a", "rate": 1.0}]}, None, True]]:
+        with pytest.raises(ValueError):
+            log.decode(bad)
+
+def test_msgpack_codec():
+    @component
+    def c():
+        Account [type] = record[name : string, balance : num, rate : ieee]
+        Event [type] = variant[Opened(Account), Note(ibytes), Closed]
+        Log [type] = tpl[num, Event, unit, boolean]
+
+    log = codecs.msgpack_codec(c, "Log")
+    v = (1, ("Opened", (-300, "Zoë", 0.5)), (), True)
+    assert log.encode(v) == (
+        b"\x94\x01\x81\xa6Opened\x91\x83\xa7balance\xd1\xfe\xd4"
+        b"\xa4name\xa4Zo\xc3\xab\xa4rate\xcb?\xe0\x00\x00\x00\x00\x00\x00"
+        b"\xc0\xc3")
+    for v in [v, (2 ** 63 - 1, ("Note", b"\x00" * 300), (), False),
+              (-2 ** 63, ("Closed",), (), True),
+              (0, ("Opened", (2 ** 40, "x" * 70000, -1.5)), (), False)]:
+        assert log.decode(log.encode(v)) == v
+    with pytest.raises(ValueError):
+        log.encode((2 ** 64, ("Closed",), (), True))
+    encoded = log.encode(v)
+    with pytest.raises(ValueError):
+        log.decode(encoded[:-1])
+    with pytest.raises(ValueError):
+        log.decode(encoded + b"\xc0")
+    # unknown fields are skipped
+    assert log.decode(
+        b"\x94\x01\x81\xa6Opened\x91\x84\xa1x\x92\xc0\xa3abc"
+        b"\xa7balance\x01\xa4name\xa0\xa4rate\x01\xc0\xc2") \
+        == (1, ("Opened", (1, "", 1.0)), (), False)
+    with pytest.raises(typy.UsageError):
+        codecs.json_codec(c, "Log")
+
+def test_validator():
+    @component
+    def c():
+        Id [type] = num
+        Status [type] = variant[Active(num), Closed]
+        Trade [type] = record[
+            id : num, symbol : string, price : ieee, status : Status,
+            legs : tpl[num, boolean], note : unit]
+
+    v = codecs.validator(c, "Trade")
+    assert codecs.validator(c, "Trade") is v
+    row = {"id": 1, "symbol": "A", "price": 2, "status": {"Active": (3,)},
+           "legs": [4, True], "note": None, "extra": 0}
+    assert v.validate(row) == (1, (4, True), (), 2.0, ("Active", 3), "A")
+    rows = [row, dict(row, price=2.5, status={"Closed": []}, legs=(0, False))]
+    expected = [v.validate(r) for r in rows]
+    assert v.validate_rows(rows) == expected
+    assert v.validate_rows(iter(rows)) == expected
+    assert v.validate_rows([]) == []
+    # rows are checked a column at a time, but errors name the first bad row
+    for bad in [dict(row, id=True), dict(row, price="2"),
+                dict(row, legs=[1]), dict(row, status={"Active": []}),
+                dict(row, note=0), [1, 2]]:
+        with pytest.raises(ValueError):
+            v.validate(bad)
+        with pytest.raises(ValueError) as e:
+            v.validate_rows(rows + [bad, bad])
+        assert str(e.value).startswith("Row 2: ")
+    missing = dict(row)
+    del missing["symbol"]
+    with pytest.raises(ValueError) as e:
+        v.validate_rows([missing])
+    assert str(e.value) == "Row 0: Missing field: symbol"
+
+    # a column that passes unchanged is not returned as the caller's list
+    ids = [1, 2, 3]
+    validated = codecs.validator(c, "Id").validate_rows(ids)
+    assert validated == ids and validated is not ids
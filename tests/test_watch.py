@@ -0,0 +1,148 @@
+"""Watch mode tests.
+
+To run:
+  $ py.test test_watch.py
+"""
+import os
+
+from typy.watch import Watcher
+
+source = '''
+from typy import component
+from typy.std import num, ieee
+
+@component
+def A():
+    x [: num] = {x}
+
+@component
+def B():
+    y [: num] = A.x + 1
+
+@component
+def C():
+    z [: ieee] = 1.5
+'''
+
+def _write(path, src, mtime):
+    with open(path, "w") as f:
+        f.write(src)
+    os.utime(path, ns=(mtime, mtime))
+
+def test_watch(tmpdir):
+    path = str(tmpdir.join("m.py"))
+    _write(path, source.format(x=1), 1000)
+    watcher = Watcher([str(tmpdir)])
+    reports = watcher.poll()
+    assert reports == [{"file": path, "diagnostics": []}]
+    f = watcher.files[path]
+    a, c = f.components['A'], f.components['C']
+    assert f.components['B']._module.y == 2
+    assert watcher.poll() == [ ]
+
+    # only A is re-checked in place; B, which refers to A, is rebuilt
+    _write(path, source.format(x=2), 2000)
+    assert watcher.poll() == [{"file": path, "diagnostics": []}]
+    assert f.components['A'] is a and f.components['C'] is c
+    assert f.components['B']._module.y == 3
+
+    _write(path, source.format(x='"oops"'), 3000)
+    diagnostics = watcher.poll()[0]["diagnostics"]
+    assert len(diagnostics) == 1
+    assert diagnostics[0]["component"] == "A"
+    assert diagnostics[0]["line"] == 7
+
+dep_source = '''
+from typy import component
+from typy.std import num, string
+
+@component(sealed={sealed})
+def D():
+    d [: {ty}] = {d}
+'''
+
+user_source = '''
+from typy import component
+from typy.std import num
+from dep import D
+
+@component
+def U():
+    u [: num] = D.d + 1
+
+@component
+def V():
+    v [: num] = 0
+'''
+
+def test_watch_imports(tmpdir):
+    dep_path = str(tmpdir.join("dep.py"))
+    user_path = str(tmpdir.join("a_user.py"))
+    _write(dep_path, dep_source.format(sealed=False, ty="num", d=1), 1000)
+    _write(user_path, user_source, 1000)
+    watcher = Watcher([str(tmpdir)])
+    try:
+        reports = watcher.poll()
+        assert sorted(r["file"] for r in reports) == [user_path, dep_path]
+        assert all(r["diagnostics"] == [] for r in reports)
+        dep, user = watcher.files[dep_path], watcher.files[user_path]
+        # the importing file sees the watched component, not a copy
+        assert user.namespace['D'] is dep.components['D']
+        assert user.components['U']._module.u == 2
+        v = user.components['V']
+
+        # files that import a changed file are re-checked, and only the
+        # components that refer to the imported names are rebuilt
+        _write(dep_path, dep_source.format(sealed=False, ty="num", d=2),
+               2000)
+        assert watcher.poll() == [{"file": dep_path, "diagnostics": []},
+                                  {"file": user_path, "diagnostics": []}]
+        assert user.namespace['D'] is dep.components['D']
+        assert user.components['U']._module.u == 3
+        assert user.components['V'] is v
+
+        _write(dep_path, dep_source.format(sealed=False, ty="string",
+                                           d='"oops"'), 3000)
+        reports = watcher.poll()
+        assert reports[0] == {"file": dep_path, "diagnostics": []}
+        assert reports[1]["file"] == user_path
+        assert [d["component"] for d in reports[1]["diagnostics"]] == ['U']
+
+        # decorator arguments are passed through
+        _write(dep_path, dep_source.format(sealed=True, ty="num", d=1),
+               4000)
+        assert watcher.poll() == [{"file": dep_path, "diagnostics": []},
+                                  {"file": user_path, "diagnostics": []}]
+        assert dep.components['D']._sealed
+        assert user.namespace['D'] is dep.components['D']
+        assert user.components['U']._module.u == 2
+    finally:
+        import sys
+        sys.modules.pop('dep', None)
+        sys.modules.pop('a_user', None)
+
+def test_watch_module_names(tmpdir):
+    import json, sys
+    paths = [str(tmpdir.join("a", "util.py")),
+             str(tmpdir.join("b", "util.py")),
+             str(tmpdir.join("json.py"))]
+    tmpdir.mkdir("a")
+    tmpdir.mkdir("b")
+    for path in paths:
+        _write(path, "X = 1\n", 1000)
+    watcher = Watcher([str(tmpdir)])
+    try:
+        reports = watcher.poll()
+        assert [watcher.files[path].name for path in paths] == [
+            "a.util", "b.util", "json"]
+        assert sys.modules["a.util"] is watcher.files[paths[0]].module
+        assert sys.modules["b.util"] is watcher.files[paths[1]].module
+        # a watched file does not replace a module that is not watched
+        assert sys.modules["json"] is json
+        assert [r["diagnostics"] for r in reports if r["file"] == paths[2]] \
+            == [[{"component": None, "line": None, "col": None,
+                  "message": "ImportError: module name 'json' is already "
+                             "in use"}]]
+    finally:
+        sys.modules.pop("a.util", None)
+        sys.modules.pop("b.util", None)
@@ -4,3 +4,6 @@ from ._errors import *
 from ._components import component, Component, is_component
 from ._fragments import Fragment
 
+from ._interfaces import (
+    ComponentInterface, dump_interface, dumps_interface, 
+    load_interface, loads_interface)
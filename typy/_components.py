@@ -3,24 +3,39 @@
 import ast
 import inspect
 import textwrap
+import types
 
 import astunparse
 
 from .util import astx as _astx
-from ._errors import ComponentFormationError, InternalError
+from ._errors import ComponentFormationError, InternalError, UsageError, TyError
 from ._fragments import Fragment
 from ._static_envs import StaticEnv
 from ._contexts import Context, BlockTransMechanism
-from ._ty_exprs import UTyExpr, UName, TypeKind, SingletonKind
+from . import std
+from ._ty_exprs import (
+    UTyExpr, UName, TypeKind, SingletonKind, TyExprVar, TyExprPrj, 
+    map_ty_exprs)
 from . import _terms
 
 __all__ = ('component', 'Component', 'is_component')
 
-def component(f):
-    """Decorator that transforms Python function definitions into Components."""
+def component(f=None, sealed=False, fused=False, optimize=False):
+    """Decorator that transforms Python function definitions into Components.
+
+    Use @component(sealed=True) to release the checker state after 
+    evaluation (see Component.seal), @component(fused=True) to translate 
+    members while they are checked (see Context._fuse) and 
+    @component(optimize=True) to enable optimizing translations.
+    """
+    if f is None:
+        return lambda f: component(f, sealed, fused, optimize)
     (tree, static_env) = _reflect_func(f)
-    c = Component(tree, static_env)
+    c = Component(tree, static_env, fused, optimize)
+    c._func = f
     c._evaluate()
+    if sealed:
+        c.seal()
     return c
 
 def _reflect_func(f):
@@ -32,14 +47,20 @@ def _reflect_func(f):
 
 class Component(object):
     """Top-level components."""
-    def __init__(self, tree, static_env):
+    def __init__(self, tree, static_env, fused=False, optimize=False):
         """Called by component."""
         self.tree = tree
+        self.name = tree.name
         self.static_env = static_env
+        self.fused = fused
+        self.optimize = optimize
         self._parsed = False
         self._checked = False
         self._translated = False
         self._evaluated = False
+        self._sealed = False
+        self._func = None
+        self._member_translations = { }
 
     def _parse(self):
         if self._parsed: return
@@ -78,11 +99,15 @@ class Component(object):
                         raise ComponentFormationError(
                             "Invalid statement form in component definition.", stmt)
         members = self._members = tuple(_parse_members())
+        self._member_keys = [_member_key(member) for member in members]
+        self._member_refs = [_member_refs(member) for member in members]
+        self._determine_exports()
+        self._parsed = True
 
-        # determine exports
+    def _determine_exports(self):
         ty_expr_exports = self._ty_expr_exports = { }
         val_exports = self._val_exports = { }
-        for member in members:
+        for member in self._members:
             if isinstance(member, TypeMember):
                 exports = ty_expr_exports
             elif isinstance(member, ValueMember):
@@ -95,50 +120,321 @@ class Component(object):
                     "Duplicate component member: " + lbl, member.tree)
             exports[lbl] = member
 
-        self._parsed = True
-
     def _check(self):
         if self._checked: return
         self._parse()
-        ctx = self.ctx = Context(self.static_env)
+        ctx = self.ctx = Context(self.static_env, self.fused, self.optimize)
         ctx.default_fragments.append(component_singleton)
+        # the bindings made by each member are recorded so that recheck
+        # can roll back to any member and replay the unchanged ones
+        self._checkpoints = [ ]
+        self._member_bindings = [ ]
         for member in self._members:
-            try:
-                print("checking " + member.id)
-            except: pass
-            member.check(ctx)
+            self._check_member(ctx, member)
         self._checked = True
 
+    def _check_member(self, ctx, member):
+        checkpoint = ctx.checkpoint()
+        member.check(ctx)
+        self._checkpoints.append(checkpoint)
+        self._member_bindings.append(ctx.bindings_since(checkpoint))
+        if ctx.fused:
+            self._member_translations[member] = member.translate(ctx)
+
     def _translate(self):
         if self._translated: return
         self._check()
-        _members = self._members
         body = [ ]
+        translations = self._member_translations
         for member in self._members:
-            translation = member.translate(self.ctx)
+            try:
+                translation = translations[member]
+            except KeyError:
+                translation = translations[member] = \
+                    member.translate(self.ctx)
             body.extend(translation)
+        if self.optimize and body:
+            body = self._local_body(body)
+        prelude = [ ]
         imports = self.ctx.imports
-        for name in sorted(imports.keys()):
+        for name in sorted(imports.keys(), reverse=True):
             asname = imports[name]
-            body.insert(0, 
+            prelude.append(
                 ast.Import(names=[ast.alias(name=name, asname=asname)],
                            lineno=0, col_offset=0))
+        # hoisted bindings are only emitted if the translation still uses 
+        # them (members that used others may have been re-checked)
+        hoisted = self.ctx.hoisted
+        used_ids = _astx.referenced_ids(ast.Module(body=body))
+        for name in reversed(hoisted):
+            if name in used_ids:
+                used_ids.update(_astx.referenced_ids(hoisted[name]))
+        for name, value in hoisted.items():
+            if name in used_ids:
+                prelude.append(ast.fix_missing_locations(ast.Assign(
+                    targets=[ast.Name(id=name, ctx=_astx.store_ctx)],
+                    value=value,
+                    lineno=0, col_offset=0)))
         self._translation = ast.Module(
-            body=body,
+            body=prelude + body,
             lineno=0, col_offset=0) # TODO
         self._translated = True
 
+    _body_name = "_typy_component_body"
+
+    def _local_body(self, body):
+        """Wraps body in a function, so that the variables it uses are fast 
+        locals rather than module globals, and returns statements that call 
+        it and bind only the value members in the module. Variables that
+        the body may read before binding them stay module globals, so that
+        such reads still see the static environment."""
+        body_name = self._body_name
+        global_ids = _read_before_bound(body)
+        exports = [ast.Name(id=member.id, ctx=_astx.store_ctx)
+                   for member in self._members
+                   if isinstance(member, ValueMember)
+                   and member.id not in global_ids]
+        if global_ids:
+            body = [ast.Global(names=sorted(global_ids))] + body
+        func = ast.FunctionDef(
+            name=body_name,
+            args=ast.arguments(
+                args=[], vararg=None, kwonlyargs=[], kw_defaults=[],
+                kwarg=None, defaults=[]),
+            body=body + [ast.Return(value=ast.Tuple(
+                elts=[ast.Name(id=name.id, ctx=_astx.load_ctx) 
+                      for name in exports],
+                ctx=_astx.load_ctx))],
+            decorator_list=[],
+            returns=None,
+            lineno=0, col_offset=0)
+        call = ast.Call(
+            func=ast.Name(id=body_name, ctx=_astx.load_ctx),
+            args=[], keywords=[])
+        if exports:
+            bind = ast.Assign(
+                targets=[ast.Tuple(elts=exports, ctx=_astx.store_ctx)],
+                value=call)
+        else:
+            bind = ast.Expr(value=call)
+        delete = ast.Delete(
+            targets=[ast.Name(id=body_name, ctx=ast.Del())])
+        return [ast.fix_missing_locations(stmt) 
+                for stmt in (func, bind, delete)]
+
     def _evaluate(self):
         if self._evaluated: return
         self._translate()
         _translation = self._translation
         try:
-            self._module = self.static_env.eval_module_ast(_translation)
+            self._module = self.static_env.eval_module_ast(
+                _translation, self.qualname)
         except Exception as e:
             print("Broken code: ", astunparse.unparse(_translation))
             raise e
+        if self.optimize:
+            # functions and classes defined in the body function are named
+            # as if they had been defined in the module
+            prefix = self._body_name + ".<locals>."
+            for value in self._module.__dict__.values():
+                if (isinstance(value, (types.FunctionType, type)) and
+                        value.__qualname__.startswith(prefix)):
+                    value.__qualname__ = value.__qualname__[len(prefix):]
         self._evaluated = True
 
+    def seal(self):
+        """Releases everything but the module and the export interface.
+
+        The AST, the members, the Context and the translation are dropped.
+        Exported types are rewritten so that references to this component's
+        type members become projections onto the component itself, so that 
+        nothing refers back to the Context. Other components can still be 
+        checked against a sealed component.
+        """
+        if self._sealed: return
+        self._evaluate()
+        self._ty_expr_exports, self._val_exports = self._sealed_exports()
+        self.tree = self._members = self.ctx = self._translation = None
+        self._member_keys = self._member_refs = None
+        self._checkpoints = self._member_bindings = None
+        self._member_translations = None
+        self._sealed = True
+
+    def recheck(self, f):
+        """Updates this component to the new definition f incrementally.
+
+        Members are compared with the previous definition by their AST. 
+        Only changed members, members that refer by name to the ids 
+        defined by changed members (transitively) and members that now 
+        come before a member they refer to are re-checked. The
+        bindings and cached translations of all other members are reused.
+        The component is then re-evaluated. Returns the list of members 
+        that were re-checked. If checking or evaluation fails, the component
+        is left as it was before the call.
+        """
+        if self._sealed:
+            raise UsageError("Sealed components cannot be re-checked.")
+        (tree, static_env) = _reflect_func(f)
+        rechecked = self._recheck(tree, static_env)
+        self._func = f
+        return rechecked
+
+    def _recheck(self, tree, static_env):
+        self._check()
+        new = Component(tree, static_env)
+        new._parse()
+        old_members, old_keys = self._members, self._member_keys
+        new_members, new_keys = new._members, new._member_keys
+
+        # static names that members refer to and that now resolve to 
+        # something else are dirty
+        member_ids = set()
+        for member in new_members:
+            member_ids.update(_member_ids(member))
+        static_dirty = set(
+            id for refs in new._member_refs for id in refs
+            if id not in member_ids 
+            and _lookup(self.static_env, id) is not _lookup(static_env, id))
+
+        # a member can only be reused if the members it refers to are
+        # still defined before it
+        defined = set()
+        def _in_order(j):
+            refs = new._member_refs[j] & member_ids
+            return refs.difference(_member_ids(new_members[j])) <= defined
+
+        # members in the common prefix are left alone
+        n = 0
+        n_common = min(len(old_keys), len(new_keys))
+        while (n < n_common and old_keys[n] == new_keys[n] and
+               new._member_refs[n].isdisjoint(static_dirty) and
+               _in_order(n)):
+            defined.update(_member_ids(new_members[n]))
+            n += 1
+        old_suffix_keys, new_suffix_keys = set(old_keys[n:]), set(new_keys[n:])
+
+        # ids defined by removed, added or changed members are dirty
+        dirty = set(static_dirty)
+        for member, key in zip(old_members[n:], old_keys[n:]):
+            if key not in new_suffix_keys:
+                dirty.update(_member_ids(member))
+        for member, key in zip(new_members[n:], new_keys[n:]):
+            if key not in old_suffix_keys:
+                dirty.update(_member_ids(member))
+
+        reusable = { }
+        for i in range(n, len(old_members)):
+            reusable.setdefault(old_keys[i], []).append(i)
+
+        ctx = self.ctx
+        # when every old member is kept, the rollback point is the end
+        if n < len(self._checkpoints):
+            base = self._checkpoints[n]
+        else:
+            base = ctx.checkpoint()
+        old_state = dict(
+            (attr, getattr(self, attr, None)) for attr in _recheck_state)
+        def _restore():
+            for attr, value in old_state.items():
+                setattr(self, attr, value)
+            ctx.static_env = self.static_env
+            ctx.rollback(base)
+            for bindings in self._member_bindings[n:]:
+                ctx.replay(bindings)
+
+        ctx.static_env = static_env
+        ctx.rollback(base)
+        members = list(old_members[:n])
+        checkpoints = self._checkpoints[:n]
+        member_bindings = self._member_bindings[:n]
+        translations = dict(self._member_translations)
+        rechecked = [ ]
+        try:
+            for j in range(n, len(new_members)):
+                checkpoint = ctx.checkpoint()
+                candidates = reusable.get(new_keys[j])
+                if (candidates and new._member_refs[j].isdisjoint(dirty)
+                        and _in_order(j)):
+                    i = candidates.pop(0)
+                    member = old_members[i]
+                    bindings = self._member_bindings[i]
+                    ctx.replay(bindings)
+                else:
+                    member = new_members[j]
+                    member.check(ctx)
+                    bindings = ctx.bindings_since(checkpoint)
+                    if ctx.fused:
+                        translations[member] = member.translate(ctx)
+                    dirty.update(_member_ids(member))
+                    rechecked.append(member)
+                defined.update(_member_ids(member))
+                members.append(member)
+                checkpoints.append(checkpoint)
+                member_bindings.append(bindings)
+        except:
+            _restore()
+            raise
+
+        # the new state is only kept if the component evaluates
+        self.tree = tree
+        self.static_env = static_env
+        self._members = tuple(members)
+        self._member_keys = new_keys
+        self._member_refs = new._member_refs
+        self._checkpoints = checkpoints
+        self._member_bindings = member_bindings
+        self._member_translations = dict(
+            (member, translations[member]) 
+            for member in members if member in translations)
+        self._translated = self._evaluated = False
+        try:
+            self._determine_exports()
+            self._evaluate()
+        except:
+            _restore()
+            raise
+        return rechecked
+
+    def _sealed_exports(self):
+        """Returns stripped copies of the type and value exports."""
+        if self._sealed:
+            return self._ty_expr_exports, self._val_exports
+        self._check()
+        ctx = self.ctx
+        path_ast = ast.Name(id=self.name, ctx=_astx.load_ctx)
+        def _project(ty):
+            if isinstance(ty, TyExprVar) and ty.ctx is ctx:
+                return TyExprPrj(path_ast, self, ty.name_ast.id)
+            return ty
+        ty_expr_exports = dict(
+            (lbl, member.sealed(_project))
+            for lbl, member in self._ty_expr_exports.items())
+        val_exports = dict(
+            (lbl, member.sealed(_project))
+            for lbl, member in self._val_exports.items())
+        return ty_expr_exports, val_exports
+
+    def unsealed(self):
+        """Regenerates a checked and translated copy of a sealed component 
+        from its source, for debugging. The copy is not evaluated."""
+        if not self._sealed:
+            return self
+        if self._func is None:
+            raise UsageError(
+                "Component has no source function to regenerate from.")
+        (tree, static_env) = _reflect_func(self._func)
+        c = Component(tree, static_env, self.fused, self.optimize)
+        c._translate()
+        return c
+
+    @property
+    def qualname(self):
+        """The name of the component, qualified by its defining module."""
+        module_name = self.static_env.globals.get('__name__')
+        if module_name is None:
+            return self.name
+        return module_name + "." + self.name
+
     def kind_of(self, lbl):
         exports = self._ty_expr_exports
         if lbl in exports:
@@ -149,11 +445,100 @@ class Component(object):
 def is_component(x):
     return isinstance(x, Component)
 
+def _member_trees(member):
+    if isinstance(member, StmtMember):
+        stmt = member.stmt
+        if isinstance(stmt, _terms.MatchStatementExpression):
+            return [stmt.scrutinizer] + [rule.stmt for rule in stmt.rules]
+        return [stmt]
+    return [member.tree]
+
+def _member_key(member):
+    """The key used to detect changed members, which ignores locations."""
+    return "\n".join(ast.dump(tree) for tree in _member_trees(member))
+
+def _member_refs(member):
+    refs = set()
+    for tree in _member_trees(member):
+        refs.update(_astx.referenced_ids(tree))
+    return refs
+
+_missing = object()
+
+# the attributes that _recheck restores if the new definition fails
+_recheck_state = (
+    'tree', 'static_env', '_members', '_member_keys', '_member_refs',
+    '_checkpoints', '_member_bindings', '_ty_expr_exports', '_val_exports',
+    '_member_translations', '_translation', '_translated', '_evaluated')
+
+def _lookup(static_env, id):
+    try:
+        return static_env[id]
+    except KeyError:
+        return _missing
+
+_scope_nodes = (
+    ast.FunctionDef, ast.AsyncFunctionDef, ast.ClassDef, ast.Lambda,
+    ast.ListComp, ast.SetComp, ast.DictComp, ast.GeneratorExp)
+
+def _bound_ids(tree):
+    """Returns the ids that tree binds in its enclosing scope."""
+    ids = set()
+    def _visit(node):
+        if isinstance(node, ast.Name):
+            if isinstance(node.ctx, ast.Store):
+                ids.add(node.id)
+        elif isinstance(node, (ast.Import, ast.ImportFrom)):
+            for alias in node.names:
+                ids.add(alias.asname or alias.name.split(".")[0])
+        elif isinstance(node, ast.ExceptHandler) and node.name is not None:
+            ids.add(node.name)
+        if isinstance(node, _scope_nodes):
+            if not isinstance(node, ast.Lambda) and hasattr(node, 'name'):
+                ids.add(node.name)
+            return
+        for child in ast.iter_child_nodes(node):
+            _visit(child)
+    _visit(tree)
+    return ids
+
+def _read_ids(tree):
+    """Returns the ids that tree reads, including in nested scopes."""
+    ids = set()
+    for node in ast.walk(tree):
+        if isinstance(node, ast.Name) and not isinstance(node.ctx, ast.Store):
+            ids.add(node.id)
+        elif (isinstance(node, ast.AugAssign) and 
+              isinstance(node.target, ast.Name)):
+            ids.add(node.target.id)
+    return ids
+
+def _read_before_bound(body):
+    """Returns the ids that the statements in body bind and that they may
+    read before binding them. Reads in nested functions count as reads at
+    the point of definition, except for a function's own name."""
+    bound, early = set(), set()
+    for stmt in body:
+        reads = _read_ids(stmt)
+        if isinstance(stmt, (ast.FunctionDef, ast.AsyncFunctionDef)):
+            reads.discard(stmt.name)
+        early.update(reads - bound)
+        bound.update(_bound_ids(stmt))
+    return early & bound
+
+def _member_ids(member):
+    if isinstance(member, (TypeMember, ValueMember)):
+        return (member.id,)
+    return ()
+
 class ComponentMember(object):
     """Base class for component members."""
+    __slots__ = ()
 
 class TypeMember(ComponentMember):
     """Type members."""
+    __slots__ = ('id', 'name_ast', 'uty_expr', 'tree', 'ty', 'kind')
+
     def __init__(self, id, name_ast, uty_expr, tree):
         self.id = id
         self.name_ast = name_ast
@@ -187,8 +572,16 @@ class TypeMember(ComponentMember):
     def translate(self, ctx): 
         return []
 
+    def sealed(self, f):
+        member = TypeMember(self.id, None, None, None)
+        kind = member.kind = SingletonKind(map_ty_exprs(f, self.kind.ty))
+        member.ty = kind.ty
+        return member
+
 class ValueMember(ComponentMember):
     """Value members."""
+    __slots__ = ('id', 'uty', 'tree', 'ty', 'translation')
+
     def __init__(self, id, uty, tree):
         self.id = id
         self.uty = uty
@@ -248,8 +641,15 @@ class ValueMember(ComponentMember):
         elif isinstance(tree, ast.FunctionDef):
             return ctx.trans(tree)
 
+    def sealed(self, f):
+        member = ValueMember(self.id, None, None)
+        member.ty = map_ty_exprs(f, self.ty)
+        return member
+
 class StmtMember(ComponentMember):
     """Statement members (not exported)."""
+    __slots__ = ('stmt',)
+
     def __init__(self, stmt):
         self.stmt = stmt
 
@@ -276,6 +676,8 @@ class StmtMember(ComponentMember):
         return ctx.trans(self.stmt)
 
 class component_singleton(Fragment):
+    fusable = True
+
     @classmethod
     def syn_Attribute(cls, ctx, e, idx):
         try:
@@ -289,9 +691,20 @@ class component_singleton(Fragment):
 
     @classmethod
     def trans_Attribute(cls, ctx, e, idx):
+        value_tr = ctx.trans(e.value)
+        if ctx.optimize:
+            member = idx._val_exports[e.attr]
+            if ctx.canonicalize(member.ty).fragment is not std.py:
+                # values of other types cannot be rebound, so they are 
+                # bound once, when the module is imported
+                name = ctx.add_hoisted(
+                    "_ref_" + idx.name + "_" + e.attr,
+                    _astx.make_Attribute(value_tr, e.attr))
+                return ast.copy_location(
+                    ast.Name(id=name, ctx=_astx.load_ctx), e)
         return ast.fix_missing_locations(ast.copy_location(
             ast.Attribute(
-                value=ctx.trans(e.value),
+                value=value_tr,
                 attr=e.attr,
                 ctx=ast.Load()),
             e))
@@ -306,12 +719,19 @@ class component_singleton(Fragment):
 
     @classmethod
     def trans_component_ref(cls, ctx, e, idx):
-        return ast.fix_missing_locations(ast.copy_location(
+        module_ref = ast.fix_missing_locations(ast.copy_location(
             ast.Attribute(
-                value=e,
+                value=ast.Name(id=e.id, ctx=_astx.load_ctx),
                 attr="_module",
                 ctx=_astx.load_ctx),
             e))
+        if ctx.optimize:
+            # py members may be mutated or rebound through the module, so 
+            # they are still accessed as attributes of this binding
+            name = ctx.add_hoisted("_ref_" + idx.name, module_ref)
+            return ast.copy_location(
+                ast.Name(id=name, ctx=_astx.load_ctx), e)
+        return module_ref
         
     @classmethod
     def check_Pass(cls, ctx, stmt):
@@ -1,12 +1,16 @@
 """typy contexts"""
 
 import ast
+import os
+import re
+from collections import OrderedDict
+
 from . import util as _util
 from .util import astx as _astx
 from ._ty_exprs import (
     TyExprVar, TypeKind, SingletonKind, UName, 
     CanonicalTy, UCanonicalTy, UTyExpr, UProjection, 
-    TyExprPrj)
+    TyExprPrj, trivial_ty)
 from ._errors import UsageError, KindError, TyError
 from ._fragments import is_fragment, Fragment
 from . import _components
@@ -22,20 +26,116 @@ class BlockTransMechanism:
         def __init__(self, target):
             self.target = target
 
+# sentinel for names that are bound neither to a type nor a static value
+_unbound = object()
+
+# the classes of scrutinees that literal dispatch looks up directly, which
+# are hashable and hash consistently with == against literals
+_dispatch_type_names = ("str", "bytes", "int", "float", "complex", "bool")
+
+def _literal_eq_operand(condition, scrutinee_var):
+    """Returns the literal in a pattern condition of the form 
+    scrutinee == literal, or None if the condition is not of that form."""
+    if (isinstance(condition, ast.Compare) and 
+            condition.left is scrutinee_var and 
+            len(condition.ops) == 1 and 
+            isinstance(condition.ops[0], ast.Eq)):
+        literal = condition.comparators[0]
+        if isinstance(literal, (ast.Str, ast.Bytes, ast.Num)):
+            return literal
+    return None
+
+def _literal_value(literal):
+    if isinstance(literal, ast.Num):
+        return literal.n
+    return literal.s
+
+def _search(rule_var, leaves):
+    """Returns a binary search on the variable rule_var for the leaf, a list 
+    of statements, with the greatest key less than or equal to it. leaves 
+    is a list of (key, leaf) sorted by key."""
+    if len(leaves) == 1:
+        return leaves[0][1]
+    mid = len(leaves) // 2
+    return [ast.If(
+        test=ast.Compare(
+            left=ast.Name(id=rule_var, ctx=_astx.load_ctx),
+            ops=[ast.Lt()],
+            comparators=[ast.Num(n=leaves[mid][0])]),
+        body=_search(rule_var, leaves[:mid]),
+        orelse=_search(rule_var, leaves[mid:]))]
+
+def _string_pats_regex(string_parts):
+    """Returns the source of a regex that fully matches a string if one of 
+    the string patterns described by string_parts (see 
+    Fragment.string_pat_parts) does, and the group numbers of each pattern 
+    as (binder group, end group). When the regex matches, the end group of 
+    the first pattern that matches is the last group matched.
+
+    Patterns are factored into a trie on their prefixes. Patterns with 
+    different next characters match disjoint sets of strings, so they can 
+    be reordered. A pattern whose prefix ends at a node of the trie may 
+    overlap with any other pattern below that node, so the patterns before 
+    and after it stay on either side of it."""
+    groups = [None] * len(string_parts)
+    last_group = [0]
+    def next_group():
+        last_group[0] += 1
+        return last_group[0]
+    def alternatives(entries, depth):
+        # entries are rule indices, in order, whose prefixes agree up to 
+        # depth
+        alts = [ ]
+        buckets = OrderedDict()
+        def flush():
+            for bucket in buckets.values():
+                prefixes = [string_parts[i][0][depth:] for i in bucket]
+                common = os.path.commonprefix(prefixes)
+                alts.append(re.escape(common) + 
+                            group(alternatives(bucket, depth + len(common))))
+            buckets.clear()
+        for i in entries:
+            prefix, binder, suffix = string_parts[i]
+            if len(prefix) == depth:
+                flush()
+                if binder is None:
+                    groups[i] = (None, next_group())
+                    alts.append("()")
+                else:
+                    binder_group = next_group()
+                    groups[i] = (binder_group, next_group())
+                    alts.append("(.*)" + re.escape(suffix) + "()")
+            else:
+                buckets.setdefault(prefix[depth], [ ]).append(i)
+        flush()
+        return alts
+    def group(alts):
+        if len(alts) == 1:
+            return alts[0]
+        return "(?:" + "|".join(alts) + ")"
+    source = "(?s)" + group(alternatives(range(len(string_parts)), 0))
+    return source, groups
+
 from . import std
 class Context(object):
-    def __init__(self, static_env):
+    def __init__(self, static_env, fused=False, optimize=False):
         self.static_env = static_env
+        # in fused mode, expressions are translated as soon as they are 
+        # checked (see _fuse)
+        self.fused = fused
+        # enables optimizing translations, e.g. binding references to 
+        # other components at import time and inlining small functions
+        self.optimize = optimize
         self.default_fragments = []
         
-        # stack of maps from id to TyExprVar
-        self.ty_ids = _util.DictStack([{}])         
-        # stack of maps from uniq_id to kind 
-        self.ty_vars = _util.DictStack([{}]) 
-        # stack of maps from id to uniq_id
-        self.exp_ids = _util.DictStack([{}]) 
-        # map from uniq_id to ty
-        self.exp_vars = _util.DictStack([{}]) 
+        # scopes mapping id to TyExprVar
+        self.ty_ids = _util.ScopeStack()
+        # scopes mapping uniq_id to kind 
+        self.ty_vars = _util.ScopeStack() 
+        # scopes mapping id to uniq_id
+        self.exp_ids = _util.ScopeStack() 
+        # scopes mapping uniq_id to ty
+        self.exp_vars = _util.ScopeStack() 
         self.last_ty_var = 0
         self.last_exp_var = 0
 
@@ -43,8 +143,18 @@ class Context(object):
         self.imports = { 'builtins': '__builtins__' }
         self.last_import_var = 0
 
+        # map from name to value of module-level bindings that are emitted
+        # after the imports, see add_hoisted
+        self.hoisted = OrderedDict()
+
+        # map from uniq_id to statically known function definitions
+        self.static_defs = { }
+
         # py type for python values
-        self.py_type = CanonicalTy(std.py, ())
+        self.py_type = std.py_type
+
+        # map from annotation structure to (guard, ty), see as_type
+        self._ty_cache = { }
 
     #
     # Bindings
@@ -57,8 +167,8 @@ class Context(object):
         self.last_ty_var += 1
 
     def push_var_bindings(self, bindings):
-        self.exp_ids.push({ })
-        self.exp_vars.push({ })
+        self.exp_ids.push()
+        self.exp_vars.push()
         return self.add_bindings(bindings)
 
     def pop_var_bindings(self):
@@ -90,6 +200,46 @@ class Context(object):
         uniq_id = self.exp_ids[id]
         return uniq_id, self.exp_vars[uniq_id]
 
+    def add_hoisted(self, name, value):
+        """Binds name to the expression value once, at the top of the 
+        translated module. Returns the name actually used, which differs 
+        from name if name is already bound to a different expression."""
+        hoisted = self.hoisted
+        key = ast.dump(value)
+        candidate, n = name, 0
+        while candidate in hoisted:
+            if ast.dump(hoisted[candidate]) == key:
+                return candidate
+            n += 1
+            candidate = name + "_" + str(n)
+        hoisted[candidate] = value
+        return candidate
+
+    def _scopes(self):
+        return (self.ty_ids, self.ty_vars, self.exp_ids, self.exp_vars)
+
+    def checkpoint(self):
+        """Returns a checkpoint of the current bindings."""
+        return tuple(scopes.checkpoint() for scopes in self._scopes())
+
+    def bindings_since(self, checkpoint):
+        """Returns the bindings made since checkpoint, for replay."""
+        return tuple(
+            scopes.bindings_since(cp) 
+            for scopes, cp in zip(self._scopes(), checkpoint))
+
+    def rollback(self, checkpoint):
+        """Undoes all bindings made since checkpoint. The uniq_id counters 
+        are not rolled back, so fresh variables never clash with 
+        replayed ones."""
+        for scopes, cp in zip(self._scopes(), checkpoint):
+            scopes.rollback(cp)
+
+    def replay(self, bindings):
+        """Re-establishes bindings returned by bindings_since."""
+        for scopes, b in zip(self._scopes(), bindings):
+            scopes.replay(b)
+
     def add_import(self, name):
         imports = self.imports
         if name in imports:
@@ -229,6 +379,9 @@ class Context(object):
             except IndexError: raise TyError("No default fragment.", stmt)
             tree._default_fragment = default_fragment
             default_fragment.integrate_static_FunctionDef(self, tree)
+            self.static_defs[tree.uniq_id] = tree
+        elif self.fused:
+            self._fuse(tree)
 
     def syn(self, tree):
         if hasattr(tree, "ty"): return tree.ty
@@ -258,8 +411,7 @@ class Context(object):
             ty = self.syn(tree.value)
             delegate = delegate_idx = translation_method_name = None
         elif _terms.is_ascription(tree):
-            uty = UTyExpr.parse(tree.ascription)
-            ty = self.ana_uty_expr(uty, TypeKind)
+            ty = self.as_type(tree.ascription)
             self.ana(tree.value, ty)
             delegate = None
             delegate_idx = None
@@ -361,8 +513,31 @@ class Context(object):
             except IndexError: raise TyError("No default fragment.", stmt)
             tree._default_fragment = default_fragment
             default_fragment.integrate_static_FunctionDef(self, tree)
+            self.static_defs[tree.uniq_id] = tree
+        elif self.fused:
+            self._fuse(tree)
         return ty
 
+    def _fuse(self, tree):
+        """Translates a just-checked expression. The translations of its
+        children have been incorporated, so they are dropped. Expressions
+        delegated to fragments that are not fusable, and their ancestors,
+        are left for the translation phase."""
+        if not isinstance(tree, ast.expr): 
+            return
+        delegate = tree.delegate
+        children = tuple(ast.iter_child_nodes(tree))
+        if ((delegate is not None and not delegate.fusable) 
+                or any(hasattr(child, '_unfused') for child in children)):
+            tree._unfused = True
+            return
+        self.trans(tree)
+        for child in children:
+            try:
+                del child.translation
+            except AttributeError:
+                pass
+
     def _do_binary(self, left, right, tree):
         class_name = tree.__class__.__name__
         try:
@@ -438,6 +613,17 @@ class Context(object):
         last_stmt = segmented_stmts[-1] # TODO insert error check for if its not a stmt expression
         return self.syn(last_stmt)
 
+    def check_block(self, block):
+        """Checks every statement in a block whose value is not used, 
+        e.g. the body of a loop."""
+        block.segmented_stmts = segmented_stmts = \
+            tuple(self._segment(block.stmts))
+        if len(segmented_stmts) == 0:
+            raise TyError("Empty block", None)
+
+        for stmt in segmented_stmts:
+            self.check(stmt)
+
     def trans_block(self, block, mechanism):
         translation = [ ]
         segmented_stmts = block.segmented_stmts
@@ -482,6 +668,11 @@ class Context(object):
                 cur_rules)
 
     def trans(self, tree, mechanism=BlockTransMechanism.Statement):
+        if self.fused and isinstance(tree, ast.expr):
+            try:
+                return tree.translation
+            except AttributeError:
+                pass
         if hasattr(tree, 'delegate') and tree.delegate is not None:
             delegate = tree.delegate
             idx = tree.delegate_idx
@@ -544,21 +735,26 @@ class Context(object):
                 ast.Name(id="__typy_scrutinee__", ctx=_astx.store_ctx), 
                 scrutinee)
             rules = tree.rules
-            rule_stmts = [ ]
             conditions = [ ]
             branches = [ ]
+            blocks = [ ]
+            literals = [ ]
+            string_parts = [ ]
             for rule in rules:
-                rule_stmts.append(rule.stmt)
                 pat = rule.pat
                 condition, binding_translations = self.trans_pat(pat, scrutinee_var)
                 conditions.append(condition)
+                literals.append(_literal_eq_operand(condition, scrutinee_var))
+                string_parts.append(self._string_pat_parts(pat))
+                block = self.trans_block(rule.block, mechanism)
+                blocks.append(block)
                 branch = _astx.assignments_from_dict(
                     dict(
                         (uniq_id, (binding_translations[id], pat))
                         for id, (uniq_id, _) in pat.var_bindings.items()
                     )
                 )
-                branch.extend(self.trans_block(rule.block, mechanism))
+                branch.extend(block)
                 branches.append(branch)
 
             translation = [
@@ -566,8 +762,10 @@ class Context(object):
                     ast.Assign(targets=[scrutinee_var_store], value=scrutinee_trans),
                     scrutinee)
             ]
-            translation.extend(_astx.conditionals(
-                conditions, branches, rule_stmts, 
+            scrutinee_fragment = self.canonicalize(scrutinee.ty).fragment
+            translation.extend(self._match_conditionals(
+                scrutinee_var, scrutinee_fragment.builtin_values, rules, 
+                conditions, branches, literals, string_parts, blocks, 
                 [_astx.standard_raise_str('Exception', 
                                          'typy match failure', scrutinee)]))
         else:
@@ -580,6 +778,225 @@ class Context(object):
         tree.translation = translation
         return translation
 
+    # runs of at least this many literal rules are dispatched on
+    _dispatch_threshold = 8
+
+    def _string_pat_parts(self, pat):
+        delegate = getattr(pat, 'delegate', None)
+        if delegate is None:
+            return None
+        return delegate.string_pat_parts(self, pat, pat.delegate_idx)
+
+    def _match_conditionals(self, scrutinee_var, builtin_values, rules, 
+                            conditions, branches, literals, string_parts, 
+                            blocks, orelse):
+        """Translates the rules of a match to conditionals. Runs of rules 
+        are dispatched on rather than tested one at a time:
+        
+        - literals[i] is the literal that rule i's pattern tests the 
+          scrutinee for equality with, if it is that simple. Runs of such 
+          rules are translated to a single dict lookup of the rule index.
+        - string_parts[i] is the result of string_pat_parts for rule i's 
+          pattern. Runs of such rules that bind part of the scrutinee are 
+          translated to a single match against a regex.
+        """
+        rule_stmts = [rule.stmt for rule in rules]
+        threshold = self._dispatch_threshold
+        n_rules = len(rules)
+        runs = [ ] # (start, stop, is_regex_run)
+        start = 0
+        while start < n_rules:
+            stop = start
+            while stop < n_rules and string_parts[stop] is not None:
+                stop += 1
+            if (stop - start >= threshold and 
+                    any(string_parts[i][1] is not None 
+                        for i in range(start, stop))):
+                runs.append((start, stop, True))
+                start = stop
+                continue
+            stop = start
+            while stop < n_rules and literals[stop] is not None:
+                stop += 1
+            if stop - start >= threshold:
+                runs.append((start, stop, False))
+                start = stop
+                continue
+            start += 1
+        # build from the last rule up
+        translation = orelse
+        stop = n_rules
+        for run_start, run_stop, is_regex_run in reversed(
+                [(0, 0, False)] + runs):
+            translation = _astx.conditionals(
+                conditions[run_stop:stop], branches[run_stop:stop], 
+                rule_stmts[run_stop:stop], translation)
+            if is_regex_run:
+                translation = self._dispatch_regex(
+                    scrutinee_var, builtin_values, 
+                    rules[run_start:run_stop], 
+                    string_parts[run_start:run_stop],
+                    blocks[run_start:run_stop], translation)
+            elif run_start != run_stop:
+                translation = self._dispatch(
+                    scrutinee_var, builtin_values, 
+                    literals[run_start:run_stop],
+                    branches[run_start:run_stop], 
+                    rule_stmts[run_start], translation)
+            stop = run_start
+        return translation
+
+    def _dispatch(self, scrutinee_var, builtin_values, literals, branches, 
+                  loc_source, orelse):
+        # __typy_rule__ = table.get(s, n)
+        # followed by a binary search on __typy_rule__, where n selects 
+        # orelse. table maps each literal to the index of the first rule 
+        # with an equal literal, so rules shadow each other as they would 
+        # with ==, e.g. for 1, 1.0 and True.
+        table = { }
+        table_keys = [ ]
+        for i, literal in enumerate(literals):
+            value = _literal_value(literal)
+            if value not in table:
+                table[value] = i
+                table_keys.append(literal)
+        n = len(literals)
+        table_name = self.add_hoisted("_typy_dispatch", ast.Dict(
+            keys=[_astx.copy_node(key) for key in table_keys],
+            values=[ast.Num(n=table[_literal_value(key)]) 
+                    for key in table_keys]))
+        get_name = self.add_hoisted("_typy_dispatch_get", ast.Attribute(
+            value=ast.Name(id=table_name, ctx=_astx.load_ctx),
+            attr="get",
+            ctx=_astx.load_ctx))
+        def name(id, ctx=_astx.load_ctx):
+            return ast.Name(id=id, ctx=ctx)
+        rule_var = "__typy_rule__"
+        lookup = ast.Call(
+            func=name(get_name), 
+            args=[scrutinee_var, ast.Num(n=n)], 
+            keywords=[])
+        if not builtin_values:
+            lookup = self._guard_dispatch(scrutinee_var, lookup, literals)
+        translation = [
+            ast.Assign(
+                targets=[name(rule_var, _astx.store_ctx)],
+                value=lookup)]
+        translation.extend(_search(
+            rule_var, list(enumerate(branches)) + [(n, orelse)]))
+        return [
+            ast.fix_missing_locations(ast.copy_location(stmt, loc_source))
+            for stmt in translation]
+
+    def _dispatch_regex(self, scrutinee_var, builtin_values, rules, 
+                        string_parts, blocks, orelse):
+        # __typy_match__ = regex.fullmatch(s)
+        # __typy_rule__ = (__typy_match__.lastindex 
+        #                  if __typy_match__ is not None else 0)
+        # followed by a binary search on __typy_rule__, which is the group 
+        # that marks the end of the rule that matched, or 0 for orelse.
+        #
+        # regex is the alternation of the rules, with common prefixes 
+        # factored out (see _string_pats_regex), so that its cost depends 
+        # on the length of the scrutinee rather than the number of rules
+        source, groups = _string_pats_regex(string_parts)
+        re_id = self.add_import("re")
+        regex_name = self.add_hoisted("_typy_pat_re", _astx.make_simple_Call(
+            _astx.make_Attribute(
+                ast.Name(id=re_id, ctx=_astx.load_ctx), "compile"),
+            [ast.Str(s=source)]))
+        def name(id, ctx=_astx.load_ctx):
+            return ast.Name(id=id, ctx=ctx)
+        match_var, rule_var = "__typy_match__", "__typy_rule__"
+        match = _astx.method_call(
+            name(regex_name), "fullmatch", [scrutinee_var])
+        if not builtin_values:
+            # string patterns only match strings
+            match = ast.IfExp(
+                test=_astx.builtin_call('isinstance', [
+                    scrutinee_var, 
+                    _astx.make_Attribute(name("__builtins__"), "str")]),
+                body=match,
+                orelse=ast.NameConstant(value=None))
+        leaves = [(0, orelse)]
+        for rule, block, (binder_group, end_group) in zip(
+                rules, blocks, groups):
+            pat = rule.pat
+            branch = _astx.assignments_from_dict(dict(
+                (uniq_id, (
+                    _astx.method_call(
+                        name(match_var), "group", [ast.Num(n=binder_group)]),
+                    pat))
+                for id, (uniq_id, _) in pat.var_bindings.items()))
+            branch.extend(block)
+            leaves.append((end_group, branch))
+        leaves.sort(key=lambda leaf: leaf[0])
+        translation = [
+            ast.Assign(
+                targets=[name(match_var, _astx.store_ctx)],
+                value=match),
+            ast.Assign(
+                targets=[name(rule_var, _astx.store_ctx)],
+                value=ast.IfExp(
+                    test=ast.Compare(
+                        left=name(match_var),
+                        ops=[ast.IsNot()],
+                        comparators=[ast.NameConstant(value=None)]),
+                    body=_astx.make_Attribute(name(match_var), "lastindex"),
+                    orelse=ast.Num(n=0)))]
+        translation.extend(_search(rule_var, leaves))
+        return [
+            ast.fix_missing_locations(ast.copy_location(stmt, rules[0].stmt))
+            for stmt in translation]
+
+    def _guard_dispatch(self, scrutinee_var, lookup, literals):
+        # lookup if s.__class__ in types 
+        # else next((i for i, k in enumerate(keys) if s == k), n)
+        #
+        # scrutinees of other classes may be unhashable or hash 
+        # inconsistently with ==, so they are compared against each 
+        # literal in turn
+        keys_name = self.add_hoisted("_typy_dispatch_keys", ast.Tuple(
+            elts=[_astx.copy_node(literal) for literal in literals],
+            ctx=_astx.load_ctx))
+        types_name = self.add_hoisted("_typy_dispatch_types", 
+            _astx.builtin_call('frozenset', [ast.Tuple(
+                elts=[
+                    ast.Attribute(
+                        value=ast.Name(id="__builtins__", ctx=_astx.load_ctx),
+                        attr=type_name,
+                        ctx=_astx.load_ctx)
+                    for type_name in _dispatch_type_names],
+                ctx=_astx.load_ctx)]))
+        def name(id, ctx=_astx.load_ctx):
+            return ast.Name(id=id, ctx=ctx)
+        n = len(literals)
+        return ast.IfExp(
+            test=ast.Compare(
+                left=ast.Attribute(
+                    value=scrutinee_var,
+                    attr="__class__",
+                    ctx=_astx.load_ctx),
+                ops=[ast.In()],
+                comparators=[name(types_name)]),
+            body=lookup,
+            orelse=_astx.builtin_call('next', [
+                ast.GeneratorExp(
+                    elt=name("__typy_i__"),
+                    generators=[ast.comprehension(
+                        target=ast.Tuple(
+                            elts=[name("__typy_i__", _astx.store_ctx), 
+                                  name("__typy_k__", _astx.store_ctx)],
+                            ctx=_astx.store_ctx),
+                        iter=_astx.builtin_call(
+                            'enumerate', [name(keys_name)]),
+                        ifs=[ast.Compare(
+                            left=scrutinee_var,
+                            ops=[ast.Eq()],
+                            comparators=[name("__typy_k__")])],
+                        is_async=0)]),
+                ast.Num(n=n)]))
+
     # def trans_FunctionDef(self, stmt, id):
     #     if isinstance(stmt, ast.FunctionDef):
     #         delegate = stmt.delegate
@@ -729,6 +1146,9 @@ class Context(object):
             elif id in static_env:
                 static_val = self.static_env[id]
                 if is_fragment(static_val):
+                    ty = trivial_ty(static_val)
+                    if ty is not None and k is TypeKind:
+                        return ty
                     ty = CanonicalTy.new(self, static_val, 
                                          ast.Index(
                                              value=_astx.empty_tuple_ast))
@@ -776,6 +1196,9 @@ class Context(object):
                         "Invalid projection.", path_ast)
                 else:
                     if is_fragment(fragment):
+                        ty = trivial_ty(fragment)
+                        if ty is not None and k is TypeKind:
+                            return ty
                         ty = CanonicalTy.new(self, fragment, 
                                              ast.Index(
                                                  value=_astx.empty_tuple_ast))
@@ -789,6 +1212,36 @@ class Context(object):
                 "Invalid type expression: " + repr(uty_expr), uty_expr)
 
     def as_type(self, expr):
-        uty_expr = UTyExpr.parse(expr)
-        return self.ana_uty_expr(uty_expr, TypeKind)
+        """Returns the type denoted by the annotation expr.
+
+        Results are cached by the structure of expr. Each entry is guarded
+        by what the names in expr resolved to, so an entry is not reused
+        after a type member or static value it depends on is rebound.
+        """
+        if isinstance(expr, ast.Name):
+            return self.ana_uty_expr(UTyExpr.parse(expr), TypeKind)
+        key = ast.dump(expr)
+        try:
+            guard, ty = self._ty_cache[key]
+        except KeyError:
+            pass
+        else:
+            resolve = self._resolve_ty_name
+            if all(resolve(id) is val for id, val in guard):
+                return ty
+        ty = self.ana_uty_expr(UTyExpr.parse(expr), TypeKind)
+        guard = tuple(
+            (id, self._resolve_ty_name(id)) 
+            for id in _astx.referenced_ids(expr))
+        self._ty_cache[key] = (guard, ty)
+        return ty
+
+    def _resolve_ty_name(self, id):
+        ty_ids = self.ty_ids
+        if id in ty_ids:
+            return ty_ids[id]
+        try:
+            return self.static_env[id]
+        except KeyError:
+            return _unbound
 
@@ -20,6 +20,17 @@ class Fragment(object):
 
     precedence = set()
 
+    # Fragments whose expression translations depend only on the 
+    # annotations left by checking can be translated during checking when
+    # a Context is in fused mode.
+    fusable = False
+
+    # Fragments whose values are always represented as objects of the
+    # builtin classes str, bytes, int, float, complex or bool. Matches on
+    # these values against many literals are dispatched on by dict lookup 
+    # without first checking the class of the scrutinee.
+    builtin_values = False
+
     ## 
     ## intro expression forms
     ## 
@@ -164,6 +175,12 @@ class Fragment(object):
     def trans_Call(cls, ctx, e, idx):
         raise FragmentError(cls.__name__ + " missing translation method: trans_Call", cls)
 
+    @classmethod
+    def trans_method_Call(cls, ctx, e, idx):
+        # called by fn.trans_Call when e.func is an attribute of a value of 
+        # this type; returning None translates e as an ordinary call
+        return None
+
     @classmethod
     def syn_Attribute(cls, ctx, e, idx):
         raise TyError(cls.__name__ + " does not support attribute expressions.", cls)
@@ -189,6 +206,17 @@ class Fragment(object):
     def trans_BinOp(cls, ctx, e):
         raise FragmentError(cls.__name__ + " missing translation method: trans_BinOp.", cls)
 
+    # Patterns
+    @classmethod
+    def string_pat_parts(cls, ctx, pat, idx):
+        """Returns (prefix, binder, suffix) if pat, a checked pattern, 
+        matches exactly the strings that start with prefix and end with 
+        suffix, binding binder (a name, "_", or None if there is nothing 
+        between prefix and suffix) to the rest. Otherwise, returns None. 
+        Matches on many such patterns are translated to a single regex 
+        match."""
+        return None
+
 def is_fragment(x):
     return inspect.isclass(x) and issubclass(x, Fragment)
 
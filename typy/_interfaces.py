@@ -0,0 +1,205 @@
+"""typy component interfaces (for separate compilation)
+
+An interface records the canonical types of a component's exports, so that
+downstream components can be checked against it without importing or
+re-checking the upstream implementation. Interfaces are stored as JSON:
+
+    {"typy_interface": 1,
+     "module": "pkg.mod", "name": "Listing1",
+     "types": {"Account": <ty>, ...},
+     "values": {"test_acct": <ty>, ...}}
+
+Types are encoded as {"ty": "module:fragment", "idx": <idx>}, projections
+onto type members as {"prj": <component ref>, "lbl": lbl} and component
+references as {"component": [module, name]}. Index values are encoded
+structurally: tuples as {"tuple": [...]}, dicts and OrderedDicts as
+{"dict": [[k, v], ...]} and {"odict": [[k, v], ...]}; JSON scalars and lists
+are stored as is.
+"""
+
+import ast
+import importlib
+import json
+from collections import OrderedDict
+
+from .util import astx as _astx
+from ._errors import UsageError
+from ._fragments import is_fragment
+from ._components import Component, TypeMember, ValueMember
+from ._ty_exprs import CanonicalTy, TyExprPrj, TyExprVar, SingletonKind
+
+__all__ = ('ComponentInterface', 'dump_interface', 'dumps_interface',
+           'load_interface', 'loads_interface')
+
+format_version = 1
+
+class ComponentInterface(Component):
+    """A sealed component whose exports were loaded from an interface.
+
+    The implementation module is only imported if _module is accessed, i.e.
+    when a component that refers to this one is evaluated.
+    """
+    def __init__(self, module_name, name):
+        self.name = name
+        self.module_name = module_name
+        self.static_env = None
+        self.tree = self._members = self.ctx = self._translation = None
+        self._ty_expr_exports = { }
+        self._val_exports = { }
+        self._parsed = self._checked = True
+        self._translated = self._evaluated = True
+        self._sealed = True
+        self._impl_module = None
+
+    @property
+    def qualname(self):
+        return self.module_name + "." + self.name
+
+    @property
+    def _module(self):
+        impl_module = self._impl_module
+        if impl_module is None:
+            c = getattr(importlib.import_module(self.module_name), self.name)
+            impl_module = self._impl_module = c._module
+        return impl_module
+
+    def unsealed(self):
+        raise UsageError(
+            "Component interfaces cannot be unsealed: " + self.qualname)
+
+def _component_ref(c):
+    if isinstance(c, ComponentInterface):
+        return [c.module_name, c.name]
+    module_name = c.static_env.globals.get('__name__')
+    if module_name is None:
+        raise UsageError("Component is not defined in a module: " + c.name)
+    return [module_name, c.name]
+
+def _fragment_ref(fragment):
+    return fragment.__module__ + ":" + fragment.__qualname__
+
+def _encode(x):
+    if isinstance(x, CanonicalTy):
+        return {"ty": _fragment_ref(x.fragment), "idx": _encode(x.idx)}
+    elif isinstance(x, TyExprPrj):
+        return {"prj": _component_ref(x.path_val), "lbl": x.lbl}
+    elif isinstance(x, TyExprVar):
+        raise UsageError(
+            "Cannot write an interface referring to the type variable " +
+            x.name_ast.id + ".")
+    elif isinstance(x, Component):
+        return {"component": _component_ref(x)}
+    elif is_fragment(x):
+        return {"fragment": _fragment_ref(x)}
+    elif isinstance(x, OrderedDict):
+        return {"odict": [[_encode(k), _encode(v)] for k, v in x.items()]}
+    elif isinstance(x, dict):
+        return {"dict": [[_encode(k), _encode(v)] for k, v in x.items()]}
+    elif type(x) is tuple:
+        return {"tuple": [_encode(v) for v in x]}
+    elif isinstance(x, list):
+        return [_encode(v) for v in x]
+    elif x is None or isinstance(x, (bool, int, float, str)):
+        return x
+    else:
+        raise UsageError(
+            "Cannot write an interface containing " + repr(x) + ".")
+
+def dumps_interface(c):
+    """Returns the interface of component c as a JSON string."""
+    ty_expr_exports, val_exports = c._sealed_exports()
+    module_name, name = _component_ref(c)
+    return json.dumps({
+        "typy_interface": format_version,
+        "module": module_name,
+        "name": name,
+        "types": dict(
+            (lbl, _encode(member.kind.ty))
+            for lbl, member in ty_expr_exports.items()),
+        "values": dict(
+            (lbl, _encode(member.ty))
+            for lbl, member in val_exports.items())
+    }, sort_keys=True)
+
+def dump_interface(c, fp):
+    """Writes the interface of component c to the file object fp."""
+    fp.write(dumps_interface(c))
+
+def _resolve_fragment(ref):
+    module_name, qualname = ref.split(":")
+    x = importlib.import_module(module_name)
+    for attr in qualname.split("."):
+        x = getattr(x, attr)
+    if not is_fragment(x):
+        raise UsageError("Not a fragment: " + ref)
+    return x
+
+class _Decoder(object):
+    def __init__(self, iface, components):
+        self.iface = iface
+        self.components = components
+
+    def component(self, ref):
+        module_name, name = ref
+        iface = self.iface
+        if module_name == iface.module_name and name == iface.name:
+            return iface
+        qualname = module_name + "." + name
+        components = self.components
+        if components is not None and qualname in components:
+            return components[qualname]
+        return getattr(importlib.import_module(module_name), name)
+
+    def decode(self, x):
+        if isinstance(x, dict):
+            if "ty" in x:
+                return CanonicalTy(_resolve_fragment(x["ty"]),
+                                   self.decode(x["idx"]))
+            elif "prj" in x:
+                c = self.component(x["prj"])
+                path_ast = ast.Name(id=c.name, ctx=_astx.load_ctx)
+                return TyExprPrj(path_ast, c, x["lbl"])
+            elif "component" in x:
+                return self.component(x["component"])
+            elif "fragment" in x:
+                return _resolve_fragment(x["fragment"])
+            elif "odict" in x:
+                return OrderedDict(
+                    (self.decode(k), self.decode(v)) for k, v in x["odict"])
+            elif "dict" in x:
+                return dict(
+                    (self.decode(k), self.decode(v)) for k, v in x["dict"])
+            elif "tuple" in x:
+                return tuple(self.decode(v) for v in x["tuple"])
+            raise UsageError("Malformed interface value: " + repr(x))
+        elif isinstance(x, list):
+            return [self.decode(v) for v in x]
+        else:
+            return x
+
+def loads_interface(s, components=None):
+    """Returns the ComponentInterface stored in the JSON string s.
+
+    Other components that the interface projects from are looked up in
+    components, a dict from qualified names to components or interfaces,
+    and are otherwise imported.
+    """
+    d = json.loads(s)
+    if d.get("typy_interface") != format_version:
+        raise UsageError("Unsupported interface format.")
+    iface = ComponentInterface(d["module"], d["name"])
+    decoder = _Decoder(iface, components)
+    for lbl, ty in d["types"].items():
+        member = TypeMember(lbl, None, None, None)
+        kind = member.kind = SingletonKind(decoder.decode(ty))
+        member.ty = kind.ty
+        iface._ty_expr_exports[lbl] = member
+    for lbl, ty in d["values"].items():
+        member = ValueMember(lbl, None, None)
+        member.ty = decoder.decode(ty)
+        iface._val_exports[lbl] = member
+    return iface
+
+def load_interface(fp, components=None):
+    """Returns the ComponentInterface stored in the file object fp."""
+    return loads_interface(fp.read(), components)
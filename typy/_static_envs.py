@@ -4,6 +4,8 @@ import ast
 import types
 import builtins
 
+from .util import astx as _astx
+
 __all__ = ("StaticEnv",)
 
 _builtins_dict = builtins.__dict__
@@ -61,13 +63,36 @@ class StaticEnv(object):
         code = compile(expr, "<eval_expr_ast>", "eval")
         return eval(code, self.globals, self.closure)
 
-    def eval_module_ast(self, module_ast):
-        print(ast.dump(module_ast, include_attributes=True))
-        code = compile(module_ast, "<eval_module_ast>", "exec")
-        _module = types.ModuleType("TestModule", "Module test") # TODO properly name them
+    def eval_module_ast(self, module_ast, name="<eval_module_ast>"):
+        _module = types.ModuleType(name)
         _module_dict = _module.__dict__
-        _module_dict.update(self.globals)
-        _module_dict.update(self.closure)
+        # names that the translation refers to but never binds become 
+        # explicit references into the defining environment, e.g.
+        # _typy_static_globals['x'], rather than copies in the module;
+        # names that it also binds are copied, since it may read them first
+        closure, env_globals = self.closure, self.globals
+        bound = _astx.bound_ids(module_ast)
+        substitution = { }
+        for ident in _astx.referenced_ids(module_ast):
+            if ident in closure:
+                env_id, env = "_typy_static_closure", closure
+            elif ident in env_globals:
+                env_id, env = "_typy_static_globals", env_globals
+            else:
+                continue
+            if ident in bound:
+                _module_dict[ident] = env[ident]
+            else:
+                substitution[ident] = ast.Subscript(
+                    value=ast.Name(id=env_id, ctx=_astx.load_ctx),
+                    slice=ast.Index(value=ast.Str(s=ident)),
+                    ctx=_astx.load_ctx)
+        if substitution:
+            module_ast = ast.fix_missing_locations(
+                _astx.substitute_ids(module_ast, substitution))
+            _module_dict["_typy_static_closure"] = closure
+            _module_dict["_typy_static_globals"] = env_globals
+        code = compile(module_ast, name, "exec")
         exec(code, _module_dict)
         return _module
 
@@ -24,15 +24,21 @@ def is_stmt_expression(tree):
             isinstance(tree, (ast.If, ast.Raise, ast.Try, ast.Expr, ast.Pass, ast.FunctionDef)))
 
 class StatementExpression(object):
-    pass
+    __slots__ = ()
 
 class MatchStatementExpression(StatementExpression):
+    __slots__ = ('scrutinizer', 'scrutinee', 'rules', 
+                 'ty', 'delegate', 'delegate_idx', 
+                 'translation_method_name', 'translation')
+
     def __init__(self, scrutinizer, rules):
         self.scrutinizer = scrutinizer
         self.scrutinee = scrutinizer.value.value.elts[0]
         self.rules = rules
 
 class MatchRule(object):
+    __slots__ = ('stmt', 'pat', 'branch', 'block')
+
     def __init__(self, stmt, pat, branch):
         self.stmt = stmt
         self.pat = pat
@@ -224,6 +230,8 @@ unsupported_expr_forms = (
     ast.YieldFrom)
 
 class Block(object):
+    __slots__ = ('stmts', 'segmented_stmts')
+
     def __init__(self, stmts):
         self.stmts = stmts
 
@@ -5,36 +5,53 @@ import ast
 from ._errors import TypeFormationError
 
 class UTyExpr(object):
+    __slots__ = ()
+
     @classmethod
     def parse(cls, expr):
+        # parse results are cached on the annotation's AST node
+        try:
+            return expr._uty_expr
+        except AttributeError:
+            pass
         if isinstance(expr, ast.Name):
-            return UName(expr)
+            uty_expr = UName(expr)
         elif isinstance(expr, ast.Subscript):
-            return UCanonicalTy(expr.value, expr.slice)
+            uty_expr = UCanonicalTy(expr.value, expr.slice)
         elif isinstance(expr, ast.Attribute):
-            return UProjection(expr.value, expr.attr)
+            uty_expr = UProjection(expr.value, expr.attr)
         else:
             raise TypeFormationError("Malformed type.", expr)
+        expr._uty_expr = uty_expr
+        return uty_expr
 
 class UCanonicalTy(UTyExpr):
+    __slots__ = ('fragment_ast', 'idx_ast')
+
     def __init__(self, fragment_ast, idx_ast):
         self.fragment_ast = fragment_ast
         self.idx_ast = idx_ast
 
 class UName(UTyExpr):
+    __slots__ = ('name_ast', 'id')
+
     def __init__(self, name_ast):
         self.name_ast = name_ast
         self.id = name_ast.id
 
 class UProjection(UTyExpr):
+    __slots__ = ('path_ast', 'lbl')
+
     def __init__(self, path_ast, lbl):
         self.path_ast = path_ast
         self.lbl = lbl
 
 class TyExpr(object):
-    pass
+    __slots__ = ()
 
 class CanonicalTy(TyExpr):
+    __slots__ = ('fragment', 'idx')
+
     def __init__(self, fragment, idx):
         self.fragment = fragment
         self.idx = idx
@@ -43,6 +60,14 @@ class CanonicalTy(TyExpr):
     def new(cls, ctx, fragment, idx_ast):
         return cls(fragment, fragment.init_idx(ctx, idx_ast))
 
+    @classmethod
+    def register_trivial(cls, fragment):
+        """Returns the canonical type of a fragment whose only index is (), 
+        registering it so that bare references to the fragment resolve to 
+        it without re-validating the index (see trivial_ty)."""
+        ty = _trivial_tys[fragment] = cls(fragment, ())
+        return ty
+
     def __str__(self):
         return self.fragment.__name__ + "[" + str(self.idx) + "]"
 
@@ -59,7 +84,14 @@ class CanonicalTy(TyExpr):
     def __ne__(self, other):
         return not self.__eq__(other)
 
+_trivial_tys = { }
+def trivial_ty(fragment):
+    """Returns the registered trivial type of fragment, or None."""
+    return _trivial_tys.get(fragment)
+
 class TyExprVar(TyExpr):
+    __slots__ = ('ctx', 'name_ast', 'uniq_id')
+
     def __init__(self, ctx, name_ast, uniq_id):
         self.ctx = ctx
         self.name_ast = name_ast
@@ -75,12 +107,42 @@ class TyExprVar(TyExpr):
         return not self.__eq__(other)
 
 class TyExprPrj(TyExpr):
+    __slots__ = ('path_ast', 'path_val', 'lbl')
+
     def __init__(self, path_ast, path_val, lbl):
         self.path_ast = path_ast
         self.path_val = path_val
         self.lbl = lbl
 
+    def __eq__(self, other):
+        if isinstance(other, TyExprPrj):
+            return self.path_val is other.path_val and self.lbl == other.lbl
+        else:
+            return False
+
+    def __ne__(self, other):
+        return not self.__eq__(other)
+
+def map_ty_exprs(f, x):
+    """Rebuilds the type expression (or index) x, replacing each type 
+    variable and projection c within it by f(c)."""
+    if isinstance(x, CanonicalTy):
+        return CanonicalTy(x.fragment, map_ty_exprs(f, x.idx))
+    elif isinstance(x, (TyExprVar, TyExprPrj)):
+        return f(x)
+    elif isinstance(x, dict):
+        return x.__class__(
+            (k, map_ty_exprs(f, v)) for k, v in x.items())
+    elif isinstance(x, list):
+        return [map_ty_exprs(f, v) for v in x]
+    elif type(x) is tuple:
+        return tuple(map_ty_exprs(f, v) for v in x)
+    else:
+        return x
+
 class Kind(object):
+    __slots__ = ()
+
     @classmethod
     def parse(cls, expr):
         if isinstance(expr, ast.Name) and expr.id == "type":
@@ -89,6 +151,8 @@ class Kind(object):
             return None
 
 class TypeKind(Kind):
+    __slots__ = ()
+
     def __init__(self):
         Kind.__init__(self)
 
@@ -100,6 +164,8 @@ class TypeKind(Kind):
 TypeKind = TypeKind()
 
 class SingletonKind(Kind):
+    __slots__ = ('ty',)
+
     def __init__(self, ty):
         self.ty = ty
 
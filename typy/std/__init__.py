@@ -1,5 +1,6 @@
 """typy standard library"""
 import ast
+import re
 from collections import OrderedDict
 
 from .. import util as _util 
@@ -16,6 +17,8 @@ except NameError:
     integer_types = (int,)
 
 class unit(Fragment):
+    fusable = True
+
     @classmethod
     def init_idx(cls, ctx, idx_ast):
         return _check_trivial_idx_ast(idx_ast)
@@ -63,9 +66,11 @@ class unit(Fragment):
                 ops = e.ops,
                 comparators = comp_trs), e)
 
-unit_ty = CanonicalTy(unit, ())
+unit_ty = CanonicalTy.register_trivial(unit)
 
 class boolean(Fragment):
+    fusable = True
+
     @classmethod
     def init_idx(cls, ctx, idx_ast):
         return _check_trivial_idx_ast(idx_ast)
@@ -194,9 +199,12 @@ class boolean(Fragment):
                 body=ctx.trans(e.body),
                 orelse=ctx.trans(e.orelse)), e)
 
-boolean_ty = CanonicalTy(boolean, ())
+boolean_ty = CanonicalTy.register_trivial(boolean)
 
 class string(Fragment):
+    fusable = True
+    builtin_values = True
+
     @classmethod
     def init_idx(cls, ctx, idx_ast):
         return _check_trivial_idx_ast(idx_ast)
@@ -381,6 +389,20 @@ class string(Fragment):
         return cls.trans_pat_JoinedStr(ctx, pat.pretend_pat, idx, 
                                        scrutinee_trans)
 
+    @classmethod
+    def string_pat_parts(cls, ctx, pat, idx):
+        if isinstance(pat, ast.Str):
+            return (pat.s, None, "")
+        elif isinstance(pat, ast.FormattedValue):
+            pat = pat.pretend_pat
+        elif not isinstance(pat, ast.JoinedStr):
+            return None
+        formatted_pat = pat.formatted_pat
+        if (not isinstance(formatted_pat, ast.Name) or 
+                _terms.is_intro_form(formatted_pat)):
+            return None
+        return (pat.before_str or "", formatted_pat.id, pat.after_str or "")
+
     @classmethod
     def ana_pat_BinOp(cls, ctx, pat, idx):
         op = pat.op
@@ -524,9 +546,12 @@ class string(Fragment):
                     for comparator in e.comparators]),
             e))
 
-string_ty = CanonicalTy(string, ())
+string_ty = CanonicalTy.register_trivial(string)
 
 class num(Fragment):
+    fusable = True
+    builtin_values = True
+
     @classmethod
     def init_idx(cls, ctx, idx_ast):
         return _check_trivial_idx_ast(idx_ast)
@@ -687,9 +712,12 @@ class num(Fragment):
                     ctx.trans(comparator)
                     for comparator in e.comparators]), e)
 
-num_ty = CanonicalTy(num, ())
+num_ty = CanonicalTy.register_trivial(num)
 
 class ieee(Fragment):
+    fusable = True
+    builtin_values = True
+
     @classmethod
     def init_idx(cls, ctx, idx_ast):
         return _check_trivial_idx_ast(idx_ast)
@@ -886,7 +914,7 @@ class ieee(Fragment):
                     ctx.trans(comparator)
                     for comparator in e.comparators]), e)
     
-ieee_ty = CanonicalTy(ieee, ())
+ieee_ty = CanonicalTy.register_trivial(ieee)
 
 class cplx(Fragment):
     # TODO init_idx
@@ -903,6 +931,8 @@ def _update_name_bindings_disjoint(bindings, new_bindings):
         bindings[name_ast] = ty
 
 class record(Fragment):
+    fusable = True
+
     @classmethod
     def init_idx(cls, ctx, idx_ast):
         if isinstance(idx_ast, ast.Slice):
@@ -1070,6 +1100,8 @@ class record(Fragment):
             e))
 
 class tpl(Fragment):
+    fusable = True
+
     @classmethod
     def init_idx(cls, ctx, idx_ast):
         if isinstance(idx_ast, ast.Slice):
@@ -1336,6 +1368,8 @@ class tpl(Fragment):
             e))
 
 class variant(Fragment):
+    fusable = True
+
     @classmethod
     def init_idx(cls, ctx, idx_ast):
         if isinstance(idx_ast, ast.Index):
@@ -1503,6 +1537,8 @@ class variant(Fragment):
         return condition, binding_translations
 
 class fn(Fragment):
+    fusable = True
+
     @classmethod
     def init_idx(cls, ctx, idx_ast):
         if isinstance(idx_ast, ast.Index):
@@ -1615,7 +1651,10 @@ class fn(Fragment):
                 ast.Name(id=stmt.name),
                 stmt)
             self_ty = CanonicalTy(cls, (arg_types, rty))
-            ctx.push_var_bindings({self_name : self_ty})  
+            stmt.self_uniq_id = ctx.push_var_bindings(
+                {self_name : self_ty})[stmt.name][0]
+        else:
+            stmt.self_uniq_id = None
         stmt.uniq_arg_sig = ctx.push_var_bindings(dict(arg_sig))
 
         # process docstring
@@ -1643,6 +1682,11 @@ class fn(Fragment):
         else:
             ctx.ana_block(proper_body_block, rty)
 
+        # bindings
+        ctx.pop_var_bindings()
+        if stmt.self_uniq_id is not None:
+            ctx.pop_var_bindings()
+
         # return canonical type
         return CanonicalTy(fn, (arg_types, rty))
 
@@ -1726,7 +1770,8 @@ class fn(Fragment):
             ast.Name(id=stmt.name),
             stmt)
         self_ty = CanonicalTy(cls, (arg_types, rty))
-        ctx.push_var_bindings({self_name : self_ty})  
+        stmt.self_uniq_id = ctx.push_var_bindings(
+            {self_name : self_ty})[stmt.name][0]
         stmt.uniq_arg_sig = ctx.push_var_bindings(dict(arg_sig))
 
         # process docstring
@@ -1753,6 +1798,7 @@ class fn(Fragment):
 
         # bindings
         ctx.pop_var_bindings()
+        ctx.pop_var_bindings()
 
     @classmethod
     def trans_FunctionDef(cls, ctx, stmt, idx, mechanism):
@@ -1777,6 +1823,15 @@ class fn(Fragment):
         # translate body
         body_tr = ctx.trans_block(stmt.proper_body_block, 
                                   BlockTransMechanism.Return)
+        self_uniq_id = stmt.self_uniq_id
+        if self_uniq_id is not None:
+            body_tr = cls._eliminate_tail_calls(
+                self_uniq_id, 
+                [arg.arg for arg in arguments_tr.args], 
+                body_tr)
+            # recursive references are to the translated definition
+            body_tr = astx.substitute_ids(body_tr, {
+                self_uniq_id: ast.Name(id=uniq_id, ctx=astx.load_ctx)})
 
         return [ast.copy_location(
             ast.FunctionDef(
@@ -1787,6 +1842,68 @@ class fn(Fragment):
                 returns=None), 
             stmt)]
 
+    # forms that prevent rebinding the arguments in a loop: closures could 
+    # observe the rebinding, and continue cannot appear in finally clauses
+    _tco_excluded_forms = (
+        ast.Lambda, ast.FunctionDef, ast.AsyncFunctionDef, ast.ClassDef, 
+        ast.GeneratorExp, ast.Yield, ast.YieldFrom, ast.Try)
+
+    @classmethod
+    def _eliminate_tail_calls(cls, self_uniq_id, arg_ids, body_tr):
+        """Rewrites self tail calls in the translated body into rebinding 
+        the arguments and continuing a while True loop around the body.
+        Returns body_tr unchanged if there are none."""
+        for node in ast.walk(ast.Module(body=body_tr)):
+            if isinstance(node, cls._tco_excluded_forms):
+                return body_tr
+        n_tail_calls = [0]
+        def _is_self_call(e):
+            return (isinstance(e, ast.Call)
+                    and isinstance(e.func, ast.Name)
+                    and e.func.id == self_uniq_id
+                    and len(e.args) == len(arg_ids)
+                    and not e.keywords)
+        def _rewrite(stmts):
+            # only returns directly in the body or in if arms are rewritten;
+            # in loops, continue would refer to the inner loop
+            new_stmts = [ ]
+            for stmt in stmts:
+                if isinstance(stmt, ast.Return) and _is_self_call(stmt.value):
+                    n_tail_calls[0] += 1
+                    args = stmt.value.args
+                    if len(arg_ids) == 1:
+                        new_stmts.append(ast.copy_location(ast.Assign(
+                            targets=[ast.Name(id=arg_ids[0], 
+                                              ctx=astx.store_ctx)],
+                            value=args[0]), stmt))
+                    elif len(arg_ids) > 1:
+                        new_stmts.append(ast.copy_location(ast.Assign(
+                            targets=[ast.Tuple(
+                                elts=[ast.Name(id=arg_id, 
+                                               ctx=astx.store_ctx)
+                                      for arg_id in arg_ids],
+                                ctx=astx.store_ctx)],
+                            value=ast.Tuple(elts=args, ctx=astx.load_ctx)),
+                            stmt))
+                    new_stmts.append(ast.copy_location(ast.Continue(), stmt))
+                elif isinstance(stmt, ast.If):
+                    new_stmts.append(ast.copy_location(ast.If(
+                        test=stmt.test,
+                        body=_rewrite(stmt.body),
+                        orelse=_rewrite(stmt.orelse)), stmt))
+                else:
+                    new_stmts.append(stmt)
+            return new_stmts
+        loop_body = _rewrite(body_tr)
+        if n_tail_calls[0] == 0:
+            return body_tr
+        # falling off the end of the body returns None, as before
+        loop_body.append(ast.Break())
+        return [ast.fix_missing_locations(ast.copy_location(ast.While(
+            test=ast.NameConstant(value=True),
+            body=loop_body,
+            orelse=[]), body_tr[0]))]
+
     @classmethod
     def ana_Lambda(cls, ctx, e, idx):
         # process args
@@ -1873,15 +1990,66 @@ class fn(Fragment):
 
     @classmethod
     def trans_Call(cls, ctx, e, idx):
+        func = e.func
+        if isinstance(func, ast.Attribute) and \
+                getattr(func, 'delegate', None) is not None:
+            translation = func.delegate.trans_method_Call(
+                ctx, e, func.delegate_idx)
+            if translation is not None:
+                return translation
+        func_tr = ctx.trans(func)
+        args_tr = [ctx.trans(arg) for arg in e.args]
+        if ctx.optimize and isinstance(func_tr, ast.Name):
+            inlined = cls._inline_call(ctx, func_tr.id, args_tr)
+            if inlined is not None:
+                return ast.copy_location(inlined, e)
         return ast.copy_location(
             ast.Call(
-                func=ctx.trans(e.func),
-                args=[
-                    ctx.trans(arg)
-                    for arg in e.args],
+                func=func_tr,
+                args=args_tr,
                 keywords=[]),
             e)
 
+    # maximum number of nodes in the translation of an inlined body
+    inline_max_size = 40
+
+    _inline_arg_forms = (ast.Name, ast.Num, ast.Str, ast.NameConstant)
+    _inline_excluded_forms = (
+        ast.Lambda, ast.ListComp, ast.SetComp, ast.DictComp, 
+        ast.GeneratorExp, ast.Yield, ast.YieldFrom, ast.Await)
+
+    @classmethod
+    def _inline_call(cls, ctx, uniq_id, args_tr):
+        """Returns the body of the statically known function uniq_id with 
+        its arguments substituted by args_tr, or None if the call should 
+        not be inlined."""
+        stmt = ctx.static_defs.get(uniq_id, None)
+        if stmt is None or stmt.delegate is not cls:
+            return None
+        proper_body = stmt.proper_body
+        if len(proper_body) != 1 or not isinstance(proper_body[0], ast.Expr):
+            return None
+        for arg_tr in args_tr:
+            if not isinstance(arg_tr, cls._inline_arg_forms):
+                return None
+        body = proper_body[0].value
+        for node in ast.walk(body):
+            if isinstance(node, ast.Name) and node.id == stmt.name:
+                return None # recursive
+        body_tr = ctx.trans(body)
+        size = 0
+        for node in ast.walk(body_tr):
+            if isinstance(node, cls._inline_excluded_forms):
+                return None
+            size += 1
+        if size > cls.inline_max_size:
+            return None
+        uniq_arg_sig = stmt.uniq_arg_sig
+        substitution = dict(
+            (uniq_arg_sig[arg.arg][0], arg_tr)
+            for arg, arg_tr in zip(stmt.args.args, args_tr))
+        return astx.substitute_ids(body_tr, substitution)
+
     @classmethod
     def check_Assign(cls, ctx, stmt):
         targets = stmt.targets
@@ -1938,6 +2106,8 @@ class fn(Fragment):
                 stmt))
 
 class py(Fragment):
+    fusable = True
+
     @classmethod
     def init_idx(cls, ctx, idx_ast):
         return _check_trivial_idx_ast(idx_ast)
@@ -2232,6 +2402,14 @@ class py(Fragment):
         return cls.trans_pat_JoinedStr(ctx, pat.pretend_pat, idx, 
                                        scrutinee_trans)
 
+    @classmethod
+    def string_pat_parts(cls, ctx, pat, idx):
+        # string literal patterns also match non-strings that are == to 
+        # the literal, so they are not included
+        if isinstance(pat, (ast.JoinedStr, ast.FormattedValue)):
+            return string.string_pat_parts(ctx, pat, idx)
+        return None
+
     @classmethod
     def ana_NameConstant(cls, ctx, e, idx):
         return
@@ -2333,32 +2511,33 @@ class py(Fragment):
 
     @classmethod
     def trans_pat_Dict(cls, ctx, pat, idx, scrutinee_trans):
-        # ('a', 'b', 'c') == tuple(scrutinee_trans.keys())
+        # isinstance(scrutinee_trans, dict) and len(scrutinee_trans) == n 
+        # and scrutinee_trans.keys() == keys, where keys is a hoisted 
+        # frozenset, so no set is built per match attempt and dicts of the 
+        # wrong size are rejected before their keys are compared
         dict_condition = ast.fix_missing_locations(ast.copy_location(
             astx.isinstance_builtin_id(scrutinee_trans, 'dict'),
             pat))
-        keys_condition = ast.fix_missing_locations(ast.copy_location(
+        n_keys = len(pat.keys)
+        length_condition = ast.fix_missing_locations(ast.copy_location(
             ast.Compare(
-                left=ast.Set(
-                    elts=[
-                        ast.Str(s=key.id)
-                        for key in pat.keys
-                    ]),
+                left=astx.builtin_call('len', [scrutinee_trans]),
                 ops=[ast.Eq()],
-                comparators=[
-                    astx.builtin_call(
-                        'set',
-                        [
-                            ast.Call(
-                                func=ast.Attribute(
-                                    value=scrutinee_trans,
-                                    attr='keys',
-                                    ctx=astx.load_ctx),
-                                args=[],
-                                keywords=[])]),
-                ]),
+                comparators=[ast.Num(n=n_keys)]),
             pat))
-        conditions = [dict_condition, keys_condition]
+        conditions = [dict_condition, length_condition]
+        if n_keys > 0:
+            keys = ctx.add_hoisted("_typy_dict_keys", astx.builtin_call(
+                'frozenset', 
+                [ast.Tuple(
+                    elts=[ast.Str(s=key.id) for key in pat.keys],
+                    ctx=astx.load_ctx)]))
+            conditions.append(ast.fix_missing_locations(ast.copy_location(
+                ast.Compare(
+                    left=astx.method_call(scrutinee_trans, 'keys', []),
+                    ops=[ast.Eq()],
+                    comparators=[ast.Name(id=keys, ctx=astx.load_ctx)]),
+                pat)))
         binding_translations = { }
         for key, value in zip(pat.keys, pat.values):
             cur_scrutinee_tr = ast.fix_missing_locations(ast.copy_location(
@@ -3349,7 +3528,7 @@ class py(Fragment):
                         for dim in slice.dims]),
                 slice)
 
-py_type = CanonicalTy(py, ())
+py_type = CanonicalTy.register_trivial(py)
 
 def _check_trivial_idx_ast(idx_ast):
     if (isinstance(idx_ast, ast.Index) and 
@@ -3360,16 +3539,1040 @@ def _check_trivial_idx_ast(idx_ast):
         raise TypeValidationError(
             "unit type can only have trivial index.", idx_ast)
 
-# TODO bytes
-# TODO ilist
-# TODO dict
-# TODO mlist
+class ibytes(Fragment):
+    """Byte strings. Slices are memoryview views of the underlying buffer 
+    rather than copies, so values are represented as either bytes or 
+    memoryview objects. b.py converts a value to a Python bytes object, 
+    copying it only if it is a view."""
+    fusable = True
+
+    @classmethod
+    def init_idx(cls, ctx, idx_ast):
+        return _check_trivial_idx_ast(idx_ast)
+
+    @classmethod
+    def _memoryview(cls, value):
+        return astx.builtin_call('memoryview', [value])
+
+    @classmethod
+    def _len(cls, value):
+        return astx.builtin_call('len', [value])
+
+    @classmethod
+    def ana_Bytes(cls, ctx, e, idx):
+        return
+
+    @classmethod
+    def trans_Bytes(cls, ctx, e, idx):
+        return astx.copy_node(e)
+
+    @classmethod
+    def ana_pat_Bytes(cls, ctx, pat, idx):
+        return {}
+
+    @classmethod
+    def trans_pat_Bytes(cls, ctx, pat, idx, scrutinee_trans):
+        condition = ast.copy_location(
+            ast.Compare(
+                left=scrutinee_trans,
+                ops=[ast.Eq()],
+                comparators=[ast.copy_location(
+                    ast.Bytes(s=pat.s),
+                    pat)]),
+            pat)
+        return condition, {}
+
+    @classmethod
+    def ana_pat_BinOp(cls, ctx, pat, idx):
+        op = pat.op
+        if isinstance(op, ast.Add):
+            left, right = pat.left, pat.right
+            if isinstance(left, ast.Bytes):
+                literal, rest = left, right
+            elif isinstance(right, ast.Bytes):
+                literal, rest = right, left
+            else:
+                raise TyError("One side of + pattern must be a literal.", pat)
+            if literal.s == b"":
+                raise TyError(
+                    "Literal pattern in + pattern must be non-empty.", 
+                    literal)
+            return ctx.ana_pat(rest, ibytes_ty)
+        else:
+            raise TyError("Invalid pattern operator on bytes.", pat)
+
+    @classmethod
+    def trans_pat_BinOp(cls, ctx, pat, idx, scrutinee_trans):
+        # len(s) >= n and s[:n] == literal, with the rest matched against 
+        # memoryview(s)[n:] (and symmetrically for suffixes)
+        left, right = pat.left, pat.right
+        if isinstance(left, ast.Bytes):
+            literal, rest = left, right
+            n = len(literal.s)
+            literal_slice = ast.Slice(None, ast.Num(n=n), None)
+            rest_slice = ast.Slice(ast.Num(n=n), None, None)
+        else:
+            literal, rest = right, left
+            n = len(literal.s)
+            literal_slice = ast.Slice(ast.Num(n=-n), None, None)
+            rest_slice = ast.Slice(None, ast.Num(n=-n), None)
+        length_condition = ast.Compare(
+            left=cls._len(scrutinee_trans),
+            ops=[ast.GtE()],
+            comparators=[ast.Num(n=n)])
+        literal_condition = ast.Compare(
+            left=ast.Subscript(
+                value=scrutinee_trans,
+                slice=literal_slice,
+                ctx=astx.load_ctx),
+            ops=[ast.Eq()],
+            comparators=[ast.Bytes(s=literal.s)])
+        remainder = ast.fix_missing_locations(ast.copy_location(
+            ast.Subscript(
+                value=cls._memoryview(scrutinee_trans),
+                slice=rest_slice,
+                ctx=astx.load_ctx),
+            pat))
+        rest_condition, binding_translations = ctx.trans_pat(rest, remainder)
+        condition = ast.fix_missing_locations(_conjunction(
+            pat, 
+            [ast.copy_location(length_condition, pat), 
+             ast.copy_location(literal_condition, pat), 
+             rest_condition]))
+        return condition, binding_translations
+
+    @classmethod
+    def syn_BinOp(cls, ctx, e):
+        if isinstance(e.op, ast.Add):
+            ctx.ana(e.left, ibytes_ty)
+            ctx.ana(e.right, ibytes_ty)
+            return ibytes_ty
+        else:
+            raise TyError("Invalid bytes operator.", e)
+
+    @classmethod
+    def _concat_operands(cls, e):
+        if (isinstance(e, ast.BinOp) and isinstance(e.op, ast.Add) and 
+                getattr(e, 'delegate', None) is cls):
+            return (cls._concat_operands(e.left) + 
+                    cls._concat_operands(e.right))
+        return [e]
+
+    @classmethod
+    def trans_BinOp(cls, ctx, e):
+        # b"".join((x, y, ...)), which accepts views and copies each 
+        # operand once
+        return ast.fix_missing_locations(ast.copy_location(
+            astx.method_call(
+                ast.Bytes(s=b""),
+                "join",
+                [ast.Tuple(
+                    elts=[ctx.trans(operand) 
+                          for operand in cls._concat_operands(e)],
+                    ctx=astx.load_ctx)]),
+            e))
+
+    @classmethod
+    def syn_Subscript(cls, ctx, e, idx):
+        slice = e.slice
+        if isinstance(slice, ast.Index):
+            ctx.ana(slice.value, num_ty)
+            return num_ty
+        elif isinstance(slice, ast.Slice):
+            for bound in (slice.lower, slice.upper, slice.step):
+                if bound is not None:
+                    ctx.ana(bound, num_ty)
+            return ibytes_ty
+        else:
+            raise TyError("Invalid bytes subscript.", e)
+
+    @classmethod
+    def trans_Subscript(cls, ctx, e, idx):
+        slice = e.slice
+        value_tr = ctx.trans(e.value)
+        if isinstance(slice, ast.Index):
+            slice_tr = ast.copy_location(
+                ast.Index(value=ctx.trans(slice.value)),
+                slice)
+        else:
+            lower, upper, step = slice.lower, slice.upper, slice.step
+            lower_tr = ctx.trans(lower) if lower is not None else None
+            upper_tr = ctx.trans(upper) if upper is not None else None
+            step_tr = ctx.trans(step) if step is not None else None
+            slice_tr = ast.copy_location(
+                ast.Slice(lower_tr, upper_tr, step_tr),
+                slice)
+            value_tr = cls._memoryview(value_tr)
+        return ast.fix_missing_locations(ast.copy_location(
+            ast.Subscript(
+                value=value_tr,
+                slice=slice_tr,
+                ctx=e.ctx), 
+            e))
+
+    @classmethod
+    def syn_Compare(cls, ctx, e):
+        left, ops, comparators = e.left, e.ops, e.comparators
+        ctx.ana(left, ibytes_ty)
+        for op, comparator in zip(ops, comparators):
+            if not isinstance(op, (ast.Eq, ast.NotEq)):
+                raise TyError("Invalid comparison operator for bytes.",
+                              comparator)
+            ctx.ana(comparator, ibytes_ty)
+        return boolean_ty
+
+    @classmethod
+    def trans_Compare(cls, ctx, e):
+        return ast.fix_missing_locations(ast.copy_location(
+            ast.Compare(
+                left=ctx.trans(e.left),
+                ops=e.ops,
+                comparators=[
+                    ctx.trans(comparator) 
+                    for comparator in e.comparators]),
+            e))
+
+    @classmethod
+    def syn_Attribute(cls, ctx, e, idx):
+        if e.attr == "py":
+            return py_type
+        else:
+            raise TyError("Invalid bytes attribute: " + e.attr, e)
+
+    @classmethod
+    def trans_Attribute(cls, ctx, e, idx):
+        # bytes(b) returns b itself if it is already a bytes object
+        return ast.fix_missing_locations(ast.copy_location(
+            astx.builtin_call('bytes', [ctx.trans(e.value)]),
+            e))
+
+ibytes_ty = CanonicalTy.register_trivial(ibytes)
+
+
+def _syn_seq_Subscript(fragment, ctx, e, idx):
+    """Indices of sequences with elements of type idx are nums, and slices
+    are sequences of the same fragment."""
+    slice = e.slice
+    if isinstance(slice, ast.Index):
+        ctx.ana(slice.value, num_ty)
+        return idx
+    elif isinstance(slice, ast.Slice):
+        for bound in (slice.lower, slice.upper, slice.step):
+            if bound is not None:
+                ctx.ana(bound, num_ty)
+        return CanonicalTy(fragment, idx)
+    else:
+        raise TyError("Invalid " + fragment.__name__ + " subscript.", e)
+
+class ilist(Fragment):
+    """Immutable lists, represented as persistent vectors (see _pvector)."""
+    fusable = True
+
+    @classmethod
+    def init_idx(cls, ctx, idx_ast):
+        if isinstance(idx_ast, ast.Index):
+            return ctx.as_type(idx_ast.value)
+        else:
+            raise TypeValidationError(
+                "Invalid ilist specification.", idx_ast)
+
+    @classmethod
+    def idx_eq(cls, ctx, idx1, idx2):
+        return ctx.ty_expr_eq(idx1, idx2, TypeKind)
+
+    @classmethod
+    def _pvector(cls, ctx, e, elts):
+        # pvector(elts)
+        return ast.fix_missing_locations(ast.copy_location(
+            astx.make_simple_Call(
+                astx.make_Attribute(
+                    ast.Name(id=ctx.add_import("typy.std._pvector"),
+                             ctx=astx.load_ctx),
+                    "pvector"),
+                [elts]),
+            e))
+
+    @classmethod
+    def ana_List(cls, ctx, e, idx):
+        for elt in e.elts:
+            ctx.ana(elt, idx)
+
+    @classmethod
+    def trans_List(cls, ctx, e, idx):
+        return cls._pvector(ctx, e, ast.Tuple(
+            elts=[ctx.trans(elt) for elt in e.elts],
+            ctx=astx.load_ctx))
+
+    @classmethod
+    def ana_ListComp(cls, ctx, e, idx):
+        generators = e.generators
+        for generator in generators:
+            iter_ty = ctx.canonicalize(ctx.syn(generator.iter))
+            if iter_ty.fragment in (ilist, mlist):
+                elt_ty = iter_ty.idx
+            elif iter_ty.fragment is py:
+                elt_ty = py_type
+            else:
+                raise TyError(
+                    "Can only iterate over ilist, mlist and py values.", 
+                    generator.iter)
+            target = generator.target
+            if not isinstance(target, ast.Name):
+                raise TyError(
+                    "Comprehension target must be a name.", target)
+            bindings = ctx.ana_pat(target, elt_ty)
+            generator.var_bindings = ctx.push_var_bindings(bindings)
+            for cond in generator.ifs:
+                ctx.ana(cond, boolean_ty)
+        ctx.ana(e.elt, idx)
+        for generator in generators:
+            ctx.pop_var_bindings()
+
+    @classmethod
+    def trans_ListComp(cls, ctx, e, idx):
+        return cls._pvector(ctx, e, cls._trans_ListComp(ctx, e))
+
+    @classmethod
+    def _trans_ListComp(cls, ctx, e):
+        def _trans_target(generator):
+            target = generator.target
+            if target.id == "_":
+                id = "_"
+            else:
+                id = generator.var_bindings[target.id][0]
+            return ast.copy_location(
+                ast.Name(id=id, ctx=astx.store_ctx), target)
+        return ast.ListComp(
+            elt=ctx.trans(e.elt),
+            generators=[
+                ast.comprehension(
+                    target=_trans_target(generator),
+                    iter=ctx.trans(generator.iter),
+                    ifs=[ctx.trans(cond) for cond in generator.ifs],
+                    is_async=0)
+                for generator in e.generators])
+
+    @classmethod
+    def syn_Subscript(cls, ctx, e, idx):
+        return _syn_seq_Subscript(cls, ctx, e, idx)
+
+    @classmethod
+    def trans_Subscript(cls, ctx, e, idx):
+        slice = e.slice
+        if isinstance(slice, ast.Index):
+            slice_tr = ast.copy_location(
+                ast.Index(value=ctx.trans(slice.value)),
+                slice)
+        else:
+            lower, upper, step = slice.lower, slice.upper, slice.step
+            lower_tr = ctx.trans(lower) if lower is not None else None
+            upper_tr = ctx.trans(upper) if upper is not None else None
+            step_tr = ctx.trans(step) if step is not None else None
+            slice_tr = ast.copy_location(
+                ast.Slice(lower_tr, upper_tr, step_tr),
+                slice)
+        return ast.fix_missing_locations(ast.copy_location(
+            ast.Subscript(
+                value=ctx.trans(e.value),
+                slice=slice_tr,
+                ctx=e.ctx), 
+            e))
+
+    @classmethod
+    def syn_BinOp(cls, ctx, e):
+        left, op, right = e.left, e.op, e.right
+        if isinstance(op, ast.Add):
+            try:
+                ty = ctx.syn(left)
+            except TyError:
+                ty = ctx.syn(right)
+            ctx.ana(left, ty)
+            ctx.ana(right, ty)
+            return ty
+        else:
+            raise TyError("Invalid ilist operator.", e)
+
+    @classmethod
+    def trans_BinOp(cls, ctx, e):
+        return ast.copy_location(
+            ast.BinOp(
+                left=ctx.trans(e.left),
+                op=e.op,
+                right=ctx.trans(e.right)),
+            e)
+
+    @classmethod
+    def syn_Compare(cls, ctx, e):
+        left, ops, comparators = e.left, e.ops, e.comparators
+        if len(ops) != 1 or not isinstance(ops[0], (ast.Eq, ast.NotEq)):
+            raise TyError("Invalid comparison operator for ilists.", e)
+        try:
+            ty = ctx.syn(left)
+        except TyError:
+            ty = ctx.syn(comparators[0])
+        ctx.ana(left, ty)
+        ctx.ana(comparators[0], ty)
+        return boolean_ty
+
+    @classmethod
+    def trans_Compare(cls, ctx, e):
+        return ast.fix_missing_locations(ast.copy_location(
+            ast.Compare(
+                left=ctx.trans(e.left),
+                ops=e.ops,
+                comparators=[ctx.trans(e.comparators[0])]),
+            e))
+
+    @classmethod
+    def check_For(cls, ctx, stmt, idx):
+        _check_For(ctx, stmt, idx)
+
+    @classmethod
+    def trans_For(cls, ctx, stmt, idx):
+        return _trans_For(ctx, stmt)
+
+    @classmethod
+    def ana_pat_List(cls, ctx, pat, idx):
+        bindings = { }
+        for elt in pat.elts:
+            new_bindings = ctx.ana_pat(elt, idx)
+            _update_name_bindings_disjoint(bindings, new_bindings)
+        return bindings
+
+    @classmethod
+    def _trans_elt_pats(cls, ctx, elts, scrutinee_trans, offset, 
+                        conditions, binding_translations):
+        for i, elt in enumerate(elts):
+            elt_scrutinee = ast.fix_missing_locations(ast.copy_location(
+                ast.Subscript(
+                    value=scrutinee_trans,
+                    slice=ast.Index(value=ast.Num(n=offset + i)),
+                    ctx=astx.load_ctx),
+                elt))
+            condition, elt_binding_translations = \
+                ctx.trans_pat(elt, elt_scrutinee)
+            conditions.append(condition)
+            binding_translations.update(elt_binding_translations)
+
+    @classmethod
+    def _length_condition(cls, pat, scrutinee_trans, op, n):
+        return ast.fix_missing_locations(ast.copy_location(
+            ast.Compare(
+                left=astx.builtin_call('len', [scrutinee_trans]),
+                ops=[op],
+                comparators=[ast.Num(n=n)]),
+            pat))
+
+    @classmethod
+    def trans_pat_List(cls, ctx, pat, idx, scrutinee_trans):
+        elts = pat.elts
+        conditions = [
+            cls._length_condition(pat, scrutinee_trans, ast.Eq(), len(elts))]
+        binding_translations = { }
+        cls._trans_elt_pats(ctx, elts, scrutinee_trans, 0, 
+                            conditions, binding_translations)
+        return _conjunction(pat, conditions), binding_translations
+
+    @classmethod
+    def ana_pat_BinOp(cls, ctx, pat, idx):
+        left, op, right = pat.left, pat.op, pat.right
+        if not isinstance(op, ast.Add):
+            raise TyError("Invalid pattern operator on ilists.", pat)
+        if isinstance(left, ast.List):
+            elts, rest = left.elts, right
+        elif isinstance(right, ast.List):
+            elts, rest = right.elts, left
+        else:
+            raise TyError("One side of + pattern must be a list pattern.", 
+                          pat)
+        bindings = { }
+        for elt in elts:
+            new_bindings = ctx.ana_pat(elt, idx)
+            _update_name_bindings_disjoint(bindings, new_bindings)
+        new_bindings = ctx.ana_pat(rest, CanonicalTy(cls, idx))
+        _update_name_bindings_disjoint(bindings, new_bindings)
+        return bindings
+
+    @classmethod
+    def trans_pat_BinOp(cls, ctx, pat, idx, scrutinee_trans):
+        left, right = pat.left, pat.right
+        if isinstance(left, ast.List):
+            # [p1, ..., pn] + rest
+            elts, rest = left.elts, right
+            offset = 0
+            rest_slice = ast.Slice(ast.Num(n=len(elts)), None, None)
+        else:
+            # rest + [p1, ..., pn]
+            elts, rest = right.elts, left
+            offset = -len(elts)
+            rest_slice = ast.Slice(None, ast.Num(n=-len(elts)), None) \
+                if len(elts) > 0 else ast.Slice(None, None, None)
+        conditions = [
+            cls._length_condition(pat, scrutinee_trans, ast.GtE(), len(elts))]
+        binding_translations = { }
+        cls._trans_elt_pats(ctx, elts, scrutinee_trans, offset, 
+                            conditions, binding_translations)
+        # the remainder is a view, so this does not copy
+        rest_scrutinee = ast.fix_missing_locations(ast.copy_location(
+            ast.Subscript(
+                value=scrutinee_trans,
+                slice=rest_slice,
+                ctx=astx.load_ctx),
+            rest))
+        condition, rest_binding_translations = \
+            ctx.trans_pat(rest, rest_scrutinee)
+        conditions.append(condition)
+        binding_translations.update(rest_binding_translations)
+        return _conjunction(pat, conditions), binding_translations
+
+def _check_For(ctx, stmt, elt_ty):
+    if len(stmt.orelse) > 0:
+        raise TyError("for loops cannot have an else clause.", stmt)
+    target = stmt.target
+    if not isinstance(target, ast.Name):
+        raise TyError("Loop target must be a name.", target)
+    bindings = ctx.ana_pat(target, elt_ty)
+    stmt.var_bindings = ctx.push_var_bindings(bindings)
+    body_block = stmt.body_block = _terms.Block(stmt.body)
+    ctx.check_block(body_block)
+    ctx.pop_var_bindings()
+
+def _trans_For(ctx, stmt):
+    target = stmt.target
+    if target.id == "_":
+        id = "_"
+    else:
+        id = stmt.var_bindings[target.id][0]
+    return [ast.fix_missing_locations(ast.copy_location(
+        ast.For(
+            target=ast.copy_location(
+                ast.Name(id=id, ctx=astx.store_ctx), target),
+            iter=ctx.trans(stmt.iter),
+            body=ctx.trans_block(stmt.body_block,
+                                 BlockTransMechanism.Statement),
+            orelse=[]),
+        stmt))]
+
+def _conjunction(pat, conditions):
+    conditions = [
+        condition for condition in conditions
+        if not (isinstance(condition, ast.NameConstant) 
+                and condition.value is True)] or conditions[:1]
+    if len(conditions) == 1:
+        return conditions[0]
+    return ast.copy_location(
+        ast.BoolOp(op=ast.And(), values=conditions), 
+        pat)
+
+class idict(Fragment):
+    """Immutable maps, represented as hash array mapped tries (see _hamt).
+
+    (Named idict because std uses the dict builtin.)
+    """
+    fusable = True
+
+    @classmethod
+    def init_idx(cls, ctx, idx_ast):
+        if (isinstance(idx_ast, ast.Index) 
+                and isinstance(idx_ast.value, ast.Tuple)
+                and len(idx_ast.value.elts) == 2):
+            key_ty_ast, value_ty_ast = idx_ast.value.elts
+            return (ctx.as_type(key_ty_ast), ctx.as_type(value_ty_ast))
+        else:
+            raise TypeValidationError(
+                "Invalid idict specification.", idx_ast)
+
+    @classmethod
+    def idx_eq(cls, ctx, idx1, idx2):
+        return (ctx.ty_expr_eq(idx1[0], idx2[0], TypeKind)
+                and ctx.ty_expr_eq(idx1[1], idx2[1], TypeKind))
+
+    @classmethod
+    def _hamt(cls, ctx):
+        return ast.Name(id=ctx.add_import("typy.std._hamt"), 
+                        ctx=astx.load_ctx)
+
+    @classmethod
+    def ana_Dict(cls, ctx, e, idx):
+        key_ty, value_ty = idx
+        for key, value in zip(e.keys, e.values):
+            if key is None: # **value
+                ctx.ana(value, CanonicalTy(cls, idx))
+            else:
+                ctx.ana(key, key_ty)
+                ctx.ana(value, value_ty)
+
+    @classmethod
+    def trans_Dict(cls, ctx, e, idx):
+        # {**d, k: v, ...} translates to d.set(k, v)..., so that the result
+        # shares structure with d
+        keys, values = e.keys, e.values
+        if len(keys) > 0 and keys[0] is None:
+            m = ctx.trans(values[0])
+            keys, values = keys[1:], values[1:]
+        else:
+            m = None
+        pairs = [ ]
+        def _flush(m):
+            if len(pairs) == 0:
+                return m
+            if m is None:
+                m = astx.make_simple_Call(
+                    astx.make_Attribute(cls._hamt(ctx), "hamt"),
+                    [ast.Tuple(elts=list(pairs), ctx=astx.load_ctx)])
+            elif len(pairs) == 1:
+                m = astx.method_call(m, "set", pairs[0].elts)
+            else:
+                m = astx.method_call(m, "update", [
+                    ast.Tuple(elts=list(pairs), ctx=astx.load_ctx)])
+            del pairs[:]
+            return m
+        for key, value in zip(keys, values):
+            if key is None:
+                m = _flush(m)
+                value_tr = ctx.trans(value)
+                if m is None:
+                    m = value_tr
+                else:
+                    m = astx.method_call(m, "update", [value_tr])
+            else:
+                pairs.append(ast.Tuple(
+                    elts=[ctx.trans(key), ctx.trans(value)],
+                    ctx=astx.load_ctx))
+        m = _flush(m)
+        if m is None:
+            m = astx.make_simple_Call(
+                astx.make_Attribute(cls._hamt(ctx), "hamt"), [])
+        return ast.fix_missing_locations(ast.copy_location(m, e))
+
+    @classmethod
+    def syn_Subscript(cls, ctx, e, idx):
+        slice = e.slice
+        if isinstance(slice, ast.Index):
+            ctx.ana(slice.value, idx[0])
+            return idx[1]
+        else:
+            raise TyError("Invalid idict subscript.", e)
+
+    @classmethod
+    def trans_Subscript(cls, ctx, e, idx):
+        return ast.fix_missing_locations(ast.copy_location(
+            ast.Subscript(
+                value=ctx.trans(e.value),
+                slice=ast.Index(value=ctx.trans(e.slice.value)),
+                ctx=e.ctx),
+            e))
+
+    @classmethod
+    def syn_Compare(cls, ctx, e):
+        left, ops, comparators = e.left, e.ops, e.comparators
+        if len(ops) != 1:
+            raise TyError("Invalid comparison for idicts.", e)
+        op, right = ops[0], comparators[0]
+        if isinstance(op, (ast.In, ast.NotIn)):
+            ty = ctx.canonicalize(ctx.syn(right))
+            ctx.ana(left, ty.idx[0])
+        elif isinstance(op, (ast.Eq, ast.NotEq)):
+            try:
+                ty = ctx.syn(left)
+            except TyError:
+                ty = ctx.syn(right)
+            ctx.ana(left, ty)
+            ctx.ana(right, ty)
+        else:
+            raise TyError("Invalid comparison operator for idicts.", e)
+        return boolean_ty
+
+    @classmethod
+    def trans_Compare(cls, ctx, e):
+        return ast.fix_missing_locations(ast.copy_location(
+            ast.Compare(
+                left=ctx.trans(e.left),
+                ops=e.ops,
+                comparators=[ctx.trans(e.comparators[0])]),
+            e))
+
+    _literal_key_forms = (ast.Num, ast.Str, ast.Bytes, ast.NameConstant)
+
+    @classmethod
+    def ana_pat_Dict(cls, ctx, pat, idx):
+        key_ty, value_ty = idx
+        bindings = { }
+        used_keys = set()
+        for key, value in zip(pat.keys, pat.values):
+            if key is None: # **rest
+                new_bindings = ctx.ana_pat(value, CanonicalTy(cls, idx))
+            else:
+                if not isinstance(key, cls._literal_key_forms):
+                    raise TyError(
+                        "Keys in idict patterns must be literals.", key)
+                ctx.ana(key, key_ty)
+                key_dump = ast.dump(key)
+                if key_dump in used_keys:
+                    raise TyError("Duplicate key.", key)
+                used_keys.add(key_dump)
+                new_bindings = ctx.ana_pat(value, value_ty)
+            _update_name_bindings_disjoint(bindings, new_bindings)
+        return bindings
+
+    @classmethod
+    def trans_pat_Dict(cls, ctx, pat, idx, scrutinee_trans):
+        # without **rest, the pattern matches maps with exactly its keys
+        rest = None
+        items = [ ]
+        for key, value in zip(pat.keys, pat.values):
+            if key is None:
+                rest = value
+            else:
+                items.append((ctx.trans(key), value))
+        conditions = [ ]
+        if rest is None:
+            conditions.append(ast.fix_missing_locations(ast.copy_location(
+                ast.Compare(
+                    left=astx.builtin_call('len', [scrutinee_trans]),
+                    ops=[ast.Eq()],
+                    comparators=[ast.Num(n=len(items))]),
+                pat)))
+        binding_translations = { }
+        for key_tr, value in items:
+            conditions.append(ast.fix_missing_locations(ast.copy_location(
+                ast.Compare(
+                    left=key_tr,
+                    ops=[ast.In()],
+                    comparators=[scrutinee_trans]),
+                value)))
+            value_scrutinee = ast.fix_missing_locations(ast.copy_location(
+                ast.Subscript(
+                    value=scrutinee_trans,
+                    slice=ast.Index(value=key_tr),
+                    ctx=astx.load_ctx),
+                value))
+            condition, value_binding_translations = \
+                ctx.trans_pat(value, value_scrutinee)
+            conditions.append(condition)
+            binding_translations.update(value_binding_translations)
+        if rest is not None:
+            rest_scrutinee = scrutinee_trans
+            for key_tr, _ in items:
+                rest_scrutinee = astx.method_call(
+                    rest_scrutinee, "delete", [key_tr])
+            condition, rest_binding_translations = ctx.trans_pat(
+                rest, 
+                ast.fix_missing_locations(
+                    ast.copy_location(rest_scrutinee, rest)))
+            conditions.append(condition)
+            binding_translations.update(rest_binding_translations)
+        if len(conditions) == 0:
+            conditions.append(ast.copy_location(
+                ast.NameConstant(value=True), pat))
+        return _conjunction(pat, conditions), binding_translations
+
+class mlist(Fragment):
+    """Mutable lists. mlist[num] and mlist[ieee] are represented as arrays 
+    of unboxed machine integers and doubles, respectively; other mlists are 
+    represented as Python lists. Storing a num outside of the signed 64-bit
+    range in an mlist[num] raises OverflowError."""
+    fusable = True
+
+    @classmethod
+    def init_idx(cls, ctx, idx_ast):
+        if isinstance(idx_ast, ast.Index):
+            return ctx.as_type(idx_ast.value)
+        else:
+            raise TypeValidationError(
+                "Invalid mlist specification.", idx_ast)
+
+    @classmethod
+    def idx_eq(cls, ctx, idx1, idx2):
+        return ctx.ty_expr_eq(idx1, idx2, TypeKind)
+
+    _typecodes = { num: 'q', ieee: 'd' }
+
+    @classmethod
+    def _typecode(cls, ctx, idx):
+        return cls._typecodes.get(ctx.canonicalize(idx).fragment, None)
+
+    @classmethod
+    def _intro(cls, ctx, e, idx, elts):
+        # array(typecode, elts) or elts, which is a list
+        typecode = cls._typecode(ctx, idx)
+        if typecode is None:
+            return ast.copy_location(elts, e)
+        return ast.fix_missing_locations(ast.copy_location(
+            astx.make_simple_Call(
+                astx.make_Attribute(
+                    ast.Name(id=ctx.add_import("array"), ctx=astx.load_ctx),
+                    "array"),
+                [ast.Str(s=typecode), elts]),
+            e))
+
+    @classmethod
+    def ana_List(cls, ctx, e, idx):
+        for elt in e.elts:
+            ctx.ana(elt, idx)
+
+    @classmethod
+    def trans_List(cls, ctx, e, idx):
+        return cls._intro(ctx, e, idx, ast.List(
+            elts=[ctx.trans(elt) for elt in e.elts],
+            ctx=astx.load_ctx))
+
+    @classmethod
+    def ana_ListComp(cls, ctx, e, idx):
+        ilist.ana_ListComp(ctx, e, idx)
+
+    @classmethod
+    def trans_ListComp(cls, ctx, e, idx):
+        return cls._intro(ctx, e, idx, ilist._trans_ListComp(ctx, e))
+
+    @classmethod
+    def syn_Subscript(cls, ctx, e, idx):
+        return _syn_seq_Subscript(cls, ctx, e, idx)
+
+    @classmethod
+    def trans_Subscript(cls, ctx, e, idx):
+        return ilist.trans_Subscript(ctx, e, idx)
+
+    @classmethod
+    def check_Assign(cls, ctx, stmt, idx):
+        target = stmt.targets[0]
+        if not isinstance(target, ast.Subscript):
+            raise TyError("Invalid assignment to an mlist.", target)
+        slice = target.slice
+        if isinstance(slice, ast.Index):
+            ctx.ana(slice.value, num_ty)
+            ctx.ana(stmt.value, idx)
+        elif isinstance(slice, ast.Slice):
+            for bound in (slice.lower, slice.upper, slice.step):
+                if bound is not None:
+                    ctx.ana(bound, num_ty)
+            ctx.ana(stmt.value, CanonicalTy(cls, idx))
+        else:
+            raise TyError("Invalid mlist subscript.", target)
+
+    @classmethod
+    def trans_Assign(cls, ctx, stmt, idx):
+        target = stmt.targets[0]
+        target_tr = ilist.trans_Subscript(ctx, target, idx)
+        target_tr.ctx = astx.store_ctx
+        return [ast.copy_location(
+            ast.Assign(
+                targets=[target_tr],
+                value=ctx.trans(stmt.value)),
+            stmt)]
+
+    @classmethod
+    def syn_Attribute(cls, ctx, e, idx):
+        attr = e.attr
+        if attr == "append":
+            return CanonicalTy(fn, ((idx,), unit_ty))
+        elif attr == "extend":
+            return CanonicalTy(fn, ((CanonicalTy(cls, idx),), unit_ty))
+        elif attr == "pop":
+            return CanonicalTy(fn, ((), idx))
+        else:
+            raise TyError("Invalid mlist method: " + attr, e)
+
+    @classmethod
+    def trans_Attribute(cls, ctx, e, idx):
+        attr = e.attr
+        method = ast.copy_location(
+            ast.Attribute(
+                value=ctx.trans(e.value),
+                attr=attr,
+                ctx=e.ctx),
+            e)
+        if attr == "pop":
+            return method
+        # append and extend return None rather than (), so when they are 
+        # not called directly they are wrapped in lambdas:
+        #   lambda x, _m=xs.append: _m(x) or ()
+        return ast.fix_missing_locations(ast.copy_location(
+            ast.Lambda(
+                args=ast.arguments(
+                    args=[ast.arg(arg="x", annotation=None),
+                          ast.arg(arg="_m", annotation=None)],
+                    vararg=None, kwonlyargs=[], kw_defaults=[],
+                    kwarg=None, defaults=[method]),
+                body=ast.BoolOp(op=ast.Or(), values=[
+                    astx.make_simple_Call(
+                        ast.Name(id="_m", ctx=astx.load_ctx),
+                        [ast.Name(id="x", ctx=astx.load_ctx)]),
+                    ast.Tuple(elts=[], ctx=astx.load_ctx)])),
+            e))
+
+    @classmethod
+    def trans_method_Call(cls, ctx, e, idx):
+        # xs.append(x) or (), and likewise for extend
+        func = e.func
+        if func.attr == "pop":
+            return None
+        return ast.fix_missing_locations(ast.copy_location(
+            ast.BoolOp(op=ast.Or(), values=[
+                astx.make_simple_Call(
+                    astx.make_Attribute(ctx.trans(func.value), func.attr),
+                    [ctx.trans(arg) for arg in e.args]),
+                ast.Tuple(elts=[], ctx=astx.load_ctx)]),
+            e))
+
+    @classmethod
+    def check_For(cls, ctx, stmt, idx):
+        _check_For(ctx, stmt, idx)
+
+    @classmethod
+    def trans_For(cls, ctx, stmt, idx):
+        return _trans_For(ctx, stmt)
+
+class string_in(Fragment):
+    """Strings that fully match a regex, e.g. string_in[r"\\d+"]. Literals 
+    are checked against the regex statically. T(x), where T names a 
+    string_in type and x is a string, py or string_in value, checks x 
+    against the regex at run time. The regex is compiled once, when the 
+    translated module is imported."""
+    fusable = True
+    builtin_values = True
+
+    @classmethod
+    def init_idx(cls, ctx, idx_ast):
+        if isinstance(idx_ast, ast.Index) and isinstance(idx_ast.value, ast.Str):
+            pattern = idx_ast.value.s
+            try:
+                re.compile(pattern)
+            except re.error as err:
+                raise TypeValidationError(
+                    "Invalid regex: " + str(err), idx_ast)
+            return pattern
+        else:
+            raise TypeValidationError(
+                "Invalid string_in specification.", idx_ast)
+
+    @classmethod
+    def _regex(cls, ctx, e, idx):
+        # re.compile(idx), hoisted
+        compiled = ast.fix_missing_locations(ast.copy_location(
+            astx.make_simple_Call(
+                astx.make_Attribute(
+                    ast.Name(id=ctx.add_import("re"), ctx=astx.load_ctx),
+                    "compile"),
+                [ast.Str(s=idx)]),
+            e))
+        return ast.copy_location(
+            ast.Name(id=ctx.add_hoisted("_string_in_re", compiled), 
+                     ctx=astx.load_ctx),
+            e)
+
+    @classmethod
+    def _check_literal(cls, s, idx, tree):
+        if re.fullmatch(idx, s) is None:
+            raise TyError(
+                "String literal does not match " + repr(idx) + ".", tree)
+
+    @classmethod
+    def ana_Str(cls, ctx, e, idx):
+        cls._check_literal(e.s, idx, e)
+
+    @classmethod
+    def trans_Str(cls, ctx, e, idx):
+        return astx.copy_node(e)
+
+    @classmethod
+    def ana_Call(cls, ctx, e, idx):
+        # T(x), where T is a string_in type, coerces x
+        func, args = e.func, e.args
+        try:
+            func_ty = ctx.as_type(func)
+        except Exception:
+            raise TyError("Invalid string_in constructor.", func)
+        if not ctx.ty_expr_eq(func_ty, CanonicalTy(cls, idx), TypeKind):
+            raise TyError("Invalid string_in constructor.", func)
+        if len(args) != 1 or len(e.keywords) != 0:
+            raise TyError("Coercions take a single argument.", e)
+        arg = args[0]
+        arg_fragment = ctx.canonicalize(ctx.syn(arg)).fragment
+        if arg_fragment not in (string, py, cls):
+            raise TyError(
+                "Can only coerce string, py and string_in values.", arg)
+
+    @classmethod
+    def trans_Call(cls, ctx, e, idx):
+        # coerce(regex, x)
+        return ast.fix_missing_locations(ast.copy_location(
+            astx.make_simple_Call(
+                astx.make_Attribute(
+                    ast.Name(id=ctx.add_import("typy.std._string_in"),
+                             ctx=astx.load_ctx),
+                    "coerce"),
+                [cls._regex(ctx, e, idx), ctx.trans(e.args[0])]),
+            e))
+
+    @classmethod
+    def ana_pat_Str(cls, ctx, pat, idx):
+        cls._check_literal(pat.s, idx, pat)
+        return {}
+
+    @classmethod
+    def trans_pat_Str(cls, ctx, pat, idx, scrutinee_trans):
+        return string.trans_pat_Str(ctx, pat, idx, scrutinee_trans)
+
+    @classmethod
+    def syn_Compare(cls, ctx, e):
+        left, ops, comparators = e.left, e.ops, e.comparators
+        if len(ops) != 1 or not isinstance(ops[0], (ast.Eq, ast.NotEq)):
+            raise TyError("Invalid comparison operator for string_in.", e)
+        try:
+            ty = ctx.syn(left)
+        except TyError:
+            ty = ctx.syn(comparators[0])
+        ctx.ana(left, ty)
+        ctx.ana(comparators[0], ty)
+        return boolean_ty
+
+    @classmethod
+    def trans_Compare(cls, ctx, e):
+        return string.trans_Compare(ctx, e)
+
+    @classmethod
+    def _groups_ty(cls, idx, e):
+        compiled = re.compile(idx)
+        if compiled.groups == 0:
+            raise TyError("Regex has no capture groups.", e)
+        names = dict((n, name) for name, n in compiled.groupindex.items())
+        return CanonicalTy(tpl, OrderedDict(
+            (names.get(n + 1, n), string_ty) 
+            for n in range(compiled.groups)))
+
+    @classmethod
+    def syn_Attribute(cls, ctx, e, idx):
+        attr = e.attr
+        if attr == "groups":
+            return cls._groups_ty(idx, e)
+        elif attr == "string":
+            return string_ty
+        else:
+            raise TyError("Invalid string_in attribute: " + attr, e)
+
+    @classmethod
+    def trans_Attribute(cls, ctx, e, idx):
+        value_tr = ctx.trans(e.value)
+        if e.attr == "groups":
+            # a single call, regex.fullmatch(s).groups(""); groups that do 
+            # not participate in the match are ""
+            return ast.fix_missing_locations(ast.copy_location(
+                astx.method_call(
+                    astx.method_call(
+                        cls._regex(ctx, e, idx),
+                        "fullmatch",
+                        [value_tr]),
+                    "groups",
+                    [ast.Str(s="")]),
+                e))
+        else:
+            return value_tr
+
 # TODO complex?
 # TODO decimal?
 
 # Maybe not in the standard library?
-# TODO proto
-# TODO string_in
 # TODO numpy stuff
 # TODO cl stuff
 
@@ -0,0 +1,288 @@
+"""Persistent hash maps (the runtime representation of idict values)
+
+A HAMT is a hash array mapped trie: each node consumes 5 bits of the key's
+hash and stores its present children densely, indexed by the popcount of
+a 32-bit bitmap. Lookup is O(log32 n). set and delete copy only the path to
+the affected entry, so the result shares structure with the original.
+
+Node entries are stored flattened, as [key0, value0, key1, value1, ...].
+A subnode is stored with the key _NODE in place of a key.
+"""
+
+__all__ = ('HAMT', 'hamt')
+
+_BITS = 5
+_MASK = (1 << _BITS) - 1
+
+class _Node(object):
+    __slots__ = ()
+
+_NODE = _Node()
+_missing = object()
+
+def _popcount(x):
+    return bin(x).count("1")
+
+class _BitmapNode(_Node):
+    __slots__ = ('bitmap', 'entries')
+
+    def __init__(self, bitmap, entries):
+        self.bitmap = bitmap
+        self.entries = entries
+
+    def get(self, shift, h, key, default):
+        node = self
+        while True:
+            bit = 1 << ((h >> shift) & _MASK)
+            bitmap = node.bitmap
+            if not bitmap & bit:
+                return default
+            i = 2 * _popcount(bitmap & (bit - 1))
+            entries = node.entries
+            k = entries[i]
+            if k is _NODE:
+                node = entries[i + 1]
+                if node.__class__ is _CollisionNode:
+                    return node.get(shift, h, key, default)
+                shift += _BITS
+            elif k is key or k == key:
+                return entries[i + 1]
+            else:
+                return default
+
+    def set(self, shift, h, key, value):
+        """Returns (node, added)."""
+        bit = 1 << ((h >> shift) & _MASK)
+        bitmap = self.bitmap
+        i = 2 * _popcount(bitmap & (bit - 1))
+        entries = self.entries
+        if not bitmap & bit:
+            new_entries = entries[:i]
+            new_entries.append(key)
+            new_entries.append(value)
+            new_entries.extend(entries[i:])
+            return _BitmapNode(bitmap | bit, new_entries), True
+        k, v = entries[i], entries[i + 1]
+        if k is _NODE:
+            sub, added = v.set(shift + _BITS, h, key, value)
+            if sub is v:
+                return self, False
+            new_entries = list(entries)
+            new_entries[i + 1] = sub
+            return _BitmapNode(bitmap, new_entries), added
+        elif k is key or k == key:
+            if v is value:
+                return self, False
+            new_entries = list(entries)
+            new_entries[i + 1] = value
+            return _BitmapNode(bitmap, new_entries), False
+        else:
+            sub = _make_node(shift + _BITS, k, v, h, key, value)
+            new_entries = list(entries)
+            new_entries[i] = _NODE
+            new_entries[i + 1] = sub
+            return _BitmapNode(bitmap, new_entries), True
+
+    def delete(self, shift, h, key):
+        """Returns the node without key (None if it becomes empty), or self
+        if key is not present."""
+        bit = 1 << ((h >> shift) & _MASK)
+        bitmap = self.bitmap
+        if not bitmap & bit:
+            return self
+        i = 2 * _popcount(bitmap & (bit - 1))
+        entries = self.entries
+        k, v = entries[i], entries[i + 1]
+        if k is _NODE:
+            sub = v.delete(shift + _BITS, h, key)
+            if sub is v:
+                return self
+            new_entries = list(entries)
+            if sub is None:
+                del new_entries[i:i + 2]
+                bitmap ^= bit
+            elif sub.__class__ is _BitmapNode and len(sub.entries) == 2 \
+                    and sub.entries[0] is not _NODE:
+                # a single remaining entry moves up
+                new_entries[i:i + 2] = sub.entries
+            else:
+                new_entries[i + 1] = sub
+        elif k is key or k == key:
+            new_entries = list(entries)
+            del new_entries[i:i + 2]
+            bitmap ^= bit
+        else:
+            return self
+        if not new_entries:
+            return None
+        return _BitmapNode(bitmap, new_entries)
+
+    def iteritems(self):
+        entries = self.entries
+        for i in range(0, len(entries), 2):
+            k = entries[i]
+            if k is _NODE:
+                for item in entries[i + 1].iteritems():
+                    yield item
+            else:
+                yield k, entries[i + 1]
+
+class _CollisionNode(_Node):
+    """Entries whose keys have the same hash."""
+    __slots__ = ('hash', 'entries')
+
+    def __init__(self, h, entries):
+        self.hash = h
+        self.entries = entries
+
+    def _find(self, key):
+        entries = self.entries
+        for i in range(0, len(entries), 2):
+            k = entries[i]
+            if k is key or k == key:
+                return i
+        return -1
+
+    def get(self, shift, h, key, default):
+        if h != self.hash:
+            return default
+        i = self._find(key)
+        if i < 0:
+            return default
+        return self.entries[i + 1]
+
+    def set(self, shift, h, key, value):
+        if h != self.hash:
+            # push this node down below a bitmap node
+            node = _BitmapNode(1 << ((self.hash >> shift) & _MASK),
+                               [_NODE, self])
+            return node.set(shift, h, key, value)
+        i = self._find(key)
+        new_entries = list(self.entries)
+        if i < 0:
+            new_entries.append(key)
+            new_entries.append(value)
+            return _CollisionNode(h, new_entries), True
+        if new_entries[i + 1] is value:
+            return self, False
+        new_entries[i + 1] = value
+        return _CollisionNode(h, new_entries), False
+
+    def delete(self, shift, h, key):
+        if h != self.hash:
+            return self
+        i = self._find(key)
+        if i < 0:
+            return self
+        new_entries = list(self.entries)
+        del new_entries[i:i + 2]
+        if len(new_entries) == 2:
+            return _BitmapNode(1 << ((h >> shift) & _MASK), new_entries)
+        return _CollisionNode(h, new_entries)
+
+    def iteritems(self):
+        entries = self.entries
+        for i in range(0, len(entries), 2):
+            yield entries[i], entries[i + 1]
+
+def _make_node(shift, k1, v1, h2, k2, v2):
+    h1 = hash(k1)
+    if h1 == h2:
+        return _CollisionNode(h1, [k1, v1, k2, v2])
+    node, _ = _empty_node.set(shift, h1, k1, v1)
+    node, _ = node.set(shift, h2, k2, v2)
+    return node
+
+_empty_node = _BitmapNode(0, [])
+
+class HAMT(object):
+    __slots__ = ('_count', '_root')
+
+    def __init__(self, count, root):
+        self._count = count
+        self._root = root
+
+    def __len__(self):
+        return self._count
+
+    def get(self, key, default=None):
+        return self._root.get(0, hash(key), key, default)
+
+    def __getitem__(self, key):
+        value = self._root.get(0, hash(key), key, _missing)
+        if value is _missing:
+            raise KeyError(key)
+        return value
+
+    def __contains__(self, key):
+        return self._root.get(0, hash(key), key, _missing) is not _missing
+
+    def set(self, key, value):
+        """Returns a new map where key is mapped to value."""
+        root, added = self._root.set(0, hash(key), key, value)
+        if root is self._root:
+            return self
+        return HAMT(self._count + 1 if added else self._count, root)
+
+    def delete(self, key):
+        """Returns a new map without key."""
+        root = self._root.delete(0, hash(key), key)
+        if root is self._root:
+            return self
+        if root is None:
+            return _empty
+        return HAMT(self._count - 1, root)
+
+    def update(self, items):
+        """Returns a new map with the (key, value) pairs in items, or the
+        entries of the map items, added."""
+        if isinstance(items, HAMT):
+            items = items.items()
+        m = self
+        for key, value in items:
+            m = m.set(key, value)
+        return m
+
+    def items(self):
+        return self._root.iteritems()
+
+    def keys(self):
+        for key, _ in self._root.iteritems():
+            yield key
+
+    def values(self):
+        for _, value in self._root.iteritems():
+            yield value
+
+    def __iter__(self):
+        return self.keys()
+
+    def __eq__(self, other):
+        if self is other:
+            return True
+        if not isinstance(other, HAMT):
+            return NotImplemented
+        if self._count != other._count:
+            return False
+        for key, value in self.items():
+            other_value = other.get(key, _missing)
+            if other_value is _missing or other_value != value:
+                return False
+        return True
+
+    def __ne__(self, other):
+        eq = self.__eq__(other)
+        if eq is NotImplemented:
+            return eq
+        return not eq
+
+    __hash__ = None
+
+    def __repr__(self):
+        return "hamt(" + repr(dict(self.items())) + ")"
+
+_empty = HAMT(0, _empty_node)
+
+def hamt(items=()):
+    """Returns a HAMT with the (key, value) pairs in items."""
+    return _empty.update(items)
@@ -0,0 +1,278 @@
+"""Persistent vectors (the runtime representation of ilist values)
+
+A PVector is a 32-way trie of leaves of up to 32 elements, plus a tail leaf
+that is not yet in the trie, as in Clojure's persistent vectors. Indexing
+is O(log32 n). Appending and updating copy only the path to the affected
+leaf, so the result shares structure with the original.
+
+Slicing with step 1 returns a PSlice, which is an O(1) view of the
+underlying vector.
+"""
+
+__all__ = ('PVector', 'PSlice', 'pvector')
+
+_BITS = 5
+_WIDTH = 1 << _BITS
+_MASK = _WIDTH - 1
+
+def _new_path(level, node):
+    while level > 0:
+        node = [node]
+        level -= _BITS
+    return node
+
+class _Seq(object):
+    """Operations shared by PVector and PSlice."""
+    __slots__ = ()
+
+    def __getitem__(self, i):
+        n = len(self)
+        if isinstance(i, slice):
+            start, stop, step = i.indices(n)
+            if step == 1:
+                return self._slice(start, max(start, stop))
+            return pvector([self._get(j) for j in range(start, stop, step)])
+        if i < 0:
+            i += n
+        if i < 0 or i >= n:
+            raise IndexError("ilist index out of range")
+        return self._get(i)
+
+    def __add__(self, other):
+        if not isinstance(other, _Seq):
+            return NotImplemented
+        return self.extend(other)
+
+    def __eq__(self, other):
+        if self is other:
+            return True
+        if not isinstance(other, _Seq):
+            return NotImplemented
+        if len(self) != len(other):
+            return False
+        for x, y in zip(self, other):
+            if x != y:
+                return False
+        return True
+
+    def __ne__(self, other):
+        eq = self.__eq__(other)
+        if eq is NotImplemented:
+            return eq
+        return not eq
+
+    def __hash__(self):
+        return hash(tuple(self))
+
+    def __repr__(self):
+        return "pvector(" + repr(list(self)) + ")"
+
+class PVector(_Seq):
+    __slots__ = ('_count', '_shift', '_root', '_tail')
+
+    def __init__(self, count, shift, root, tail):
+        self._count = count
+        self._shift = shift
+        self._root = root
+        self._tail = tail
+
+    def __len__(self):
+        return self._count
+
+    def __getitem__(self, i):
+        # fast path for indexing, which is the common case
+        if i.__class__ is int:
+            count = self._count
+            if i < 0:
+                i += count
+            if 0 <= i < count:
+                if i >= ((count - 1) >> _BITS) << _BITS:
+                    return self._tail[i & _MASK]
+                node = self._root
+                level = self._shift
+                while level > 0:
+                    node = node[(i >> level) & _MASK]
+                    level -= _BITS
+                return node[i & _MASK]
+        return _Seq.__getitem__(self, i)
+
+    def _tail_offset(self):
+        count = self._count
+        if count < _WIDTH:
+            return 0
+        return ((count - 1) >> _BITS) << _BITS
+
+    def _leaf_for(self, i):
+        if i >= self._tail_offset():
+            return self._tail
+        node = self._root
+        level = self._shift
+        while level > 0:
+            node = node[(i >> level) & _MASK]
+            level -= _BITS
+        return node
+
+    def _get(self, i):
+        return self._leaf_for(i)[i & _MASK]
+
+    def _slice(self, start, stop):
+        if start == 0 and stop == self._count:
+            return self
+        return PSlice(self, start, stop)
+
+    def __iter__(self):
+        tail_offset = self._tail_offset()
+        leaf_for = self._leaf_for
+        for i in range(0, tail_offset, _WIDTH):
+            for x in leaf_for(i):
+                yield x
+        for x in self._tail:
+            yield x
+
+    def append(self, x):
+        """Returns a new vector with x added at the end."""
+        count, shift, root, tail = \
+            self._count, self._shift, self._root, self._tail
+        if count - self._tail_offset() < _WIDTH:
+            return PVector(count + 1, shift, root, tail + [x])
+        # the tail is full, so it moves into the trie
+        if (count >> _BITS) > (1 << shift):
+            root = [root, _new_path(shift, tail)]
+            shift += _BITS
+        else:
+            root = self._push_tail(shift, root, tail)
+        return PVector(count + 1, shift, root, [x])
+
+    def _push_tail(self, level, parent, tail):
+        subidx = ((self._count - 1) >> level) & _MASK
+        node = list(parent)
+        if level == _BITS:
+            child = tail
+        elif subidx < len(parent):
+            child = self._push_tail(level - _BITS, parent[subidx], tail)
+        else:
+            child = _new_path(level - _BITS, tail)
+        if subidx < len(node):
+            node[subidx] = child
+        else:
+            node.append(child)
+        return node
+
+    def extend(self, xs):
+        """Returns a new vector with the elements of xs added at the end."""
+        v = self
+        xs = list(xs)
+        n_xs = len(xs)
+        i = 0
+        while i < n_xs:
+            room = _WIDTH - (v._count - v._tail_offset())
+            if room == 0:
+                v = v.append(xs[i])
+                i += 1
+            else:
+                chunk = xs[i:i + room]
+                v = PVector(v._count + len(chunk), v._shift, v._root,
+                            v._tail + chunk)
+                i += len(chunk)
+        return v
+
+    def set(self, i, x):
+        """Returns a new vector with the element at index i replaced by x."""
+        count = self._count
+        if i < 0:
+            i += count
+        if i < 0 or i >= count:
+            raise IndexError("ilist index out of range")
+        if i >= self._tail_offset():
+            tail = list(self._tail)
+            tail[i & _MASK] = x
+            return PVector(count, self._shift, self._root, tail)
+        return PVector(count, self._shift,
+                       self._assoc(self._shift, self._root, i, x),
+                       self._tail)
+
+    def _assoc(self, level, node, i, x):
+        node = list(node)
+        if level == 0:
+            node[i & _MASK] = x
+        else:
+            subidx = (i >> level) & _MASK
+            node[subidx] = self._assoc(level - _BITS, node[subidx], i, x)
+        return node
+
+class PSlice(_Seq):
+    """A view of the elements of a PVector in [start, stop)."""
+    __slots__ = ('_vec', '_start', '_stop')
+
+    def __init__(self, vec, start, stop):
+        self._vec = vec
+        self._start = start
+        self._stop = stop
+
+    def __len__(self):
+        return self._stop - self._start
+
+    def _get(self, i):
+        return self._vec._get(self._start + i)
+
+    def _slice(self, start, stop):
+        return PSlice(self._vec, self._start + start, self._start + stop)
+
+    def __iter__(self):
+        vec = self._vec
+        i, stop = self._start, self._stop
+        while i < stop:
+            leaf = vec._leaf_for(i)
+            j = i & _MASK
+            k = min(len(leaf), j + stop - i)
+            for x in leaf[j:k]:
+                yield x
+            i += k - j
+
+    def _base(self):
+        # the elements after the view can be dropped when the view ends
+        # at the end of the vector
+        vec = self._vec
+        if self._stop == vec._count:
+            return vec
+        return pvector(self)
+
+    def append(self, x):
+        base = self._base()
+        if base is self._vec:
+            return PSlice(base.append(x), self._start, self._stop + 1)
+        return base.append(x)
+
+    def extend(self, xs):
+        xs = list(xs)
+        base = self._base()
+        if base is self._vec:
+            return PSlice(base.extend(xs), self._start, self._stop + len(xs))
+        return base.extend(xs)
+
+    def set(self, i, x):
+        n = len(self)
+        if i < 0:
+            i += n
+        if i < 0 or i >= n:
+            raise IndexError("ilist index out of range")
+        return PSlice(self._vec.set(self._start + i, x),
+                      self._start, self._stop)
+
+_empty = PVector(0, _BITS, [], [])
+
+def pvector(xs=()):
+    """Returns a PVector of the elements of xs."""
+    xs = list(xs)
+    n = len(xs)
+    if n == 0:
+        return _empty
+    # the last leaf, which may be full, is the tail
+    tail_offset = ((n - 1) >> _BITS) << _BITS
+    nodes = [xs[i:i + _WIDTH] for i in range(0, tail_offset, _WIDTH)]
+    tail = xs[tail_offset:]
+    shift = _BITS
+    while len(nodes) > _WIDTH:
+        nodes = [nodes[i:i + _WIDTH] for i in range(0, len(nodes), _WIDTH)]
+        shift += _BITS
+    return PVector(n, shift, nodes, tail)
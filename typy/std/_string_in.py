@@ -0,0 +1,14 @@
+"""Run-time support for string_in values, which are represented as strings.
+
+The regexes are compiled once, when the translated module is imported, and
+passed in.
+"""
+
+__all__ = ('coerce',)
+
+def coerce(regex, s):
+    """Returns s if it is a string that fully matches regex."""
+    if not isinstance(s, str) or regex.fullmatch(s) is None:
+        raise ValueError(
+            "{0!r} does not match {1!r}".format(s, regex.pattern))
+    return s
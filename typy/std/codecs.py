@@ -0,0 +1,1214 @@
+"""Codecs derived from typy types.
+
+A codec is derived from a type member of a checked component and converts
+between the run-time representation of values of that type and a wire
+format. The code of each codec is generated once per type, specialized to
+the canonical type's index (record fields become tuple positions, variant
+cases become tag comparisons), and cached by the structure of the type.
+
+proto_codec(c, lbl) derives a compact binary codec in the style of
+protocol buffers. Messages are sequences of fields, each a varint key
+(field number << 3 | wire type) followed by a varint (num, as a zigzag
+varint, and boolean), 8 little-endian bytes (ieee) or a length and that
+many bytes (string, ibytes, unit and nested messages). record and tpl values
+and variant case arguments are messages. A variant value is a message with a
+single field, whose field number identifies the case and whose payload is
+the message of the case's arguments. A value of any other type is encoded
+as a message with that value as field 1.
+
+Record field and variant case numbers are derived from a hash of the label,
+and tpl and variant case argument numbers are positions, so that adding a
+record field, a variant case or a trailing tpl component does not change
+the numbers of the others. Decoders skip fields whose numbers they do not
+know, so values of a type with added fields can be decoded as values of
+the original type. Missing fields are an error.
+
+json_codec(c, lbl) converts values to and from the values that the json
+module reads and writes, and msgpack_codec(c, lbl) to and from msgpack
+bytes with the same structure. Both check the values they decode.
+
+validator(c, lbl) checks and converts Python values of the same structure,
+where tuples may also be used for lists, one at a time or a list of rows
+at a time.
+"""
+import operator
+import struct
+import zlib
+
+from .._errors import UsageError
+from .._ty_exprs import CanonicalTy, TyExprPrj, SingletonKind
+from . import unit, boolean, num, ieee, string, ibytes
+from . import record, tpl, variant
+
+__all__ = ('Codec', 'proto_codec', 'json_codec', 'msgpack_codec',
+           'Validator', 'validator')
+
+class Codec(object):
+    """A pair of functions converting values of ty to and from a wire
+    format. source is the generated Python source of the functions."""
+    __slots__ = ('ty', 'encode', 'decode', 'source')
+
+    def __init__(self, ty, encode, decode, source):
+        self.ty = ty
+        self.encode = encode
+        self.decode = decode
+        self.source = source
+
+def _member_ty(c, lbl):
+    """Returns the canonical type that type member lbl of c is defined as."""
+    return _canonical(TyExprPrj(None, c, lbl))
+
+def _canonical(ty):
+    while isinstance(ty, TyExprPrj):
+        ty_expr_exports, _ = ty.path_val._sealed_exports()
+        member = ty_expr_exports.get(ty.lbl)
+        if member is None:
+            raise UsageError("Not a type member: " + ty.lbl)
+        kind = member.kind
+        if not isinstance(kind, SingletonKind):
+            raise UsageError("Abstract type member: " + ty.lbl)
+        ty = kind.ty
+    if not isinstance(ty, CanonicalTy):
+        raise UsageError("Cannot derive a codec for " + repr(ty) + ".")
+    return ty
+
+def _key(x):
+    """A hashable key for the type or index x, which identifies it up to
+    the expansion of type members."""
+    if isinstance(x, (CanonicalTy, TyExprPrj)):
+        ty = _canonical(x)
+        return (ty.fragment, _key(ty.idx))
+    elif isinstance(x, dict):
+        items = tuple((k, _key(v)) for k, v in x.items())
+        if x.__class__ is dict:
+            return (dict, tuple(sorted(items)))
+        return (x.__class__, items)
+    elif isinstance(x, (tuple, list)):
+        return (x.__class__, tuple(_key(v) for v in x))
+    return x
+
+class _Source(object):
+    """The source of a module of generated functions, one per type.
+
+    Functions may be generated while generating others (those of field
+    types, say), so each is emitted into its own list of lines between
+    begin and end.
+    """
+    def __init__(self, env):
+        self.lines = [ ]
+        self.stack = [ ]
+        self.names = { }
+        self.env = env
+
+    def begin(self):
+        self.stack.append(self.lines)
+        self.lines = [ ]
+
+    def end(self):
+        lines = self.lines
+        self.lines = self.stack.pop()
+        self.lines[:0] = lines
+
+    def name(self, key, prefix):
+        """Returns the name of the function for key, and whether it is new."""
+        try:
+            return self.names[key], False
+        except KeyError:
+            name = self.names[key] = prefix + str(len(self.names))
+            return name, True
+
+    def emit(self, depth, line):
+        self.lines.append("    " * depth + line)
+
+    def compile(self):
+        source = "\n".join(self.lines) + "\n"
+        env = dict(self.env)
+        exec(compile(source, "<typy codec>", "exec"), env)
+        return source, env
+
+#
+# proto
+#
+
+_pack_d = struct.Struct("<d").pack
+_unpack_d = struct.Struct("<d").unpack_from
+
+def _varint(n):
+    out = bytearray()
+    while n >= 0x80:
+        out.append((n & 0x7f) | 0x80)
+        n >>= 7
+    out.append(n)
+    return out
+
+def _varint_from(buf, pos, x, shift):
+    """Reads the rest of a varint, of which the bits below shift, x, have
+    been read."""
+    while True:
+        b = buf[pos]
+        pos += 1
+        x |= (b & 0x7f) << shift
+        if b < 0x80:
+            return x, pos
+        shift += 7
+
+def _skip(buf, pos, key):
+    """Skips the value of an unknown field."""
+    wire = key & 7
+    if wire == 0:
+        while buf[pos] >= 0x80:
+            pos += 1
+        return pos + 1
+    elif wire == 1:
+        return pos + 8
+    elif wire == 2:
+        n = buf[pos]
+        pos += 1
+        if n >= 0x80:
+            n, pos = _varint_from(buf, pos, n & 0x7f, 7)
+        return pos + n
+    elif wire == 5:
+        return pos + 4
+    raise ValueError("Invalid wire type: " + str(wire))
+
+def _missing_field(values, lbls):
+    for value, lbl in zip(values, lbls):
+        if value is _missing:
+            return ValueError("Missing field: " + str(lbl))
+
+_missing = object()
+
+_proto_env = {
+    '_pack_d': _pack_d,
+    '_unpack_d': _unpack_d,
+    '_varint': _varint,
+    '_varint_from': _varint_from,
+    '_skip': _skip,
+    '_missing_field': _missing_field,
+    '_missing': _missing,
+    '_struct_error': struct.error
+}
+
+# field numbers up to 2 ** 18 fit, with the wire type, in 3 varint bytes
+_lbl_number_mask = (1 << 18) - 1
+
+def _lbl_number(lbl):
+    return (zlib.crc32(lbl.encode("utf-8")) & _lbl_number_mask) + 1
+
+def _lbl_numbers(ty, lbls):
+    numbers = [_lbl_number(lbl) for lbl in lbls]
+    if len(set(numbers)) != len(numbers):
+        raise UsageError(
+            "Labels have colliding field numbers in " + str(ty) + ".")
+    return numbers
+
+def _wire_type(ty):
+    fragment = ty.fragment
+    if fragment is num or fragment is boolean:
+        return 0
+    elif fragment is ieee:
+        return 1
+    elif fragment in (unit, string, ibytes, record, tpl, variant):
+        return 2
+    raise UsageError("No wire format for " + str(ty) + ".")
+
+def _proto_key(number, wire, suffix=b""):
+    return repr(bytes(_varint((number << 3) | wire)) + suffix)
+
+def _tuple_source(xs):
+    if len(xs) == 1:
+        return "(" + xs[0] + ",)"
+    return "(" + ", ".join(xs) + ")"
+
+class _ProtoGen(object):
+    def __init__(self):
+        self.src = _Source(_proto_env)
+
+    def fields(self, ty):
+        """Returns the (number, label, type) of each field of the message
+        representing a record or tpl value, in tuple order."""
+        idx = ty.idx
+        if ty.fragment is record:
+            lbls = sorted(idx.keys())
+            numbers = _lbl_numbers(ty, lbls)
+            return [(number, lbl, _canonical(idx[lbl]))
+                    for number, lbl in zip(numbers, lbls)]
+        return [(n + 1, lbl, _canonical(field_ty))
+                for n, (lbl, field_ty) in enumerate(idx.items())]
+
+    def cases(self, ty):
+        """Returns the (number, tag, argument fields) of each variant case."""
+        tags = sorted(ty.idx.keys())
+        numbers = _lbl_numbers(ty, tags)
+        return [(number, tag, [(n + 1, n, _canonical(arg_ty))
+                               for n, arg_ty in enumerate(ty.idx[tag])])
+                for number, tag in zip(numbers, tags)]
+
+    def emit_varint(self, d, out, n):
+        emit = self.src.emit
+        emit(d, "if " + n + " < 128: " + out + ".append(" + n + ")")
+        emit(d, "else: " + out + " += _varint(" + n + ")")
+
+    def emit_enc_field(self, d, out, number, ty, x):
+        emit = self.src.emit
+        fragment = ty.fragment
+        wire = _wire_type(ty)
+        key = _proto_key(number, wire)
+        if fragment is num:
+            emit(d, out + " += " + key)
+            emit(d, "n = {0} << 1 if {0} >= 0 else ({0} << 1) ^ -1".format(x))
+            self.emit_varint(d, out, "n")
+        elif fragment is boolean:
+            emit(d, "{0} += {1} if {2} else {3}".format(
+                out, _proto_key(number, wire, b"\x01"), x,
+                _proto_key(number, wire, b"\x00")))
+        elif fragment is ieee:
+            emit(d, out + " += " + key)
+            emit(d, out + " += _pack_d(" + x + ")")
+        elif fragment is unit:
+            emit(d, out + " += " + _proto_key(number, wire, b"\x00"))
+        else:
+            if fragment is string:
+                emit(d, "b = " + x + ".encode()")
+            elif fragment is ibytes:
+                emit(d, "b = " + x)
+            else:
+                emit(d, "b = bytearray()")
+                emit(d, self.encoder(ty) + "(" + x + ", b)")
+            emit(d, "n = len(b)")
+            emit(d, out + " += " + key)
+            self.emit_varint(d, out, "n")
+            emit(d, out + " += b")
+
+    def emit_unpack(self, d, xs, v):
+        if xs:
+            comma = "," if len(xs) == 1 else ""
+            self.src.emit(d, ", ".join(xs) + comma + " = " + v)
+
+    def encoder(self, ty):
+        """Returns the name of a function that appends the message
+        representing a record, tpl or variant value to a bytearray."""
+        name, new = self.src.name((_key(ty), "enc"), "_enc_")
+        if not new: return name
+        emit = self.src.emit
+        self.src.begin()
+        emit(0, "def " + name + "(v, out):")
+        if ty.fragment is variant:
+            emit(1, "tag = v[0]")
+            for number, tag, fields in self.cases(ty):
+                emit(1, "if tag == " + repr(tag) + ":")
+                key = _proto_key(number, 2)
+                if fields:
+                    xs = ["x" + str(n) for _, n, _ in fields]
+                    self.emit_unpack(2, ["_"] + xs, "v")
+                    emit(2, "p = bytearray()")
+                    for (arg_number, _, arg_ty), x in zip(fields, xs):
+                        self.emit_enc_field(2, "p", arg_number, arg_ty, x)
+                    emit(2, "n = len(p)")
+                    emit(2, "out += " + key)
+                    self.emit_varint(2, "out", "n")
+                    emit(2, "out += p")
+                else:
+                    emit(2, "out += " + _proto_key(number, 2, b"\x00"))
+                emit(2, "return")
+            emit(1, "raise ValueError('Invalid tag: ' + repr(tag))")
+        else:
+            fields = self.fields(ty)
+            xs = ["x" + str(n) for n in range(len(fields))]
+            self.emit_unpack(1, xs, "v")
+            for (number, _, field_ty), x in zip(fields, xs):
+                self.emit_enc_field(1, "out", number, field_ty, x)
+            if not fields:
+                emit(1, "pass")
+        emit(0, "")
+        self.src.end()
+        return name
+
+    def emit_read_varint(self, d, n):
+        emit = self.src.emit
+        emit(d, n + " = buf[pos]")
+        emit(d, "pos += 1")
+        emit(d, "if {0} >= 128: "
+                "{0}, pos = _varint_from(buf, pos, {0} & 127, 7)".format(n))
+
+    def emit_read_key(self, d):
+        # keys are read inline: those of record fields and variant cases
+        # take 3 bytes
+        emit = self.src.emit
+        emit(d, "key = buf[pos]")
+        emit(d, "pos += 1")
+        emit(d, "if key >= 128:")
+        emit(d + 1, "b = buf[pos]")
+        emit(d + 1, "pos += 1")
+        emit(d + 1, "key = (key & 127) | (b & 127) << 7")
+        emit(d + 1, "if b >= 128:")
+        emit(d + 2, "b = buf[pos]")
+        emit(d + 2, "pos += 1")
+        emit(d + 2, "key |= (b & 127) << 14")
+        emit(d + 2, "if b >= 128: key, pos = _varint_from(buf, pos, key, 21)")
+
+    def emit_dec_field(self, d, ty, x):
+        emit = self.src.emit
+        fragment = ty.fragment
+        if fragment is ieee:
+            emit(d, x + " = _unpack_d(buf, pos)[0]")
+            emit(d, "pos += 8")
+            return
+        self.emit_read_varint(d, "n")
+        if fragment is num:
+            emit(d, x + " = (n >> 1) ^ -(n & 1)")
+        elif fragment is boolean:
+            emit(d, x + " = n != 0")
+        else:
+            if fragment is unit:
+                emit(d, x + " = ()")
+            elif fragment is string:
+                emit(d, x + " = buf[pos:pos + n].decode()")
+            elif fragment is ibytes:
+                emit(d, x + " = buf[pos:pos + n]")
+            else:
+                emit(d, x + " = " + self.decoder(ty) +
+                        "(buf, pos, pos + n)")
+            emit(d, "pos += n")
+
+    def emit_message_decoder(self, name, fields, result):
+        """fields is a list of (number, label, type)."""
+        emit = self.src.emit
+        xs = ["x" + str(n) for n in range(len(fields))]
+        self.src.begin()
+        emit(0, "def " + name + "(buf, pos, end):")
+        if xs:
+            emit(1, " = ".join(xs) + " = _missing")
+        emit(1, "while pos < end:")
+        self.emit_read_key(2)
+        keyword = "if"
+        for (number, _, ty), x in zip(fields, xs):
+            emit(2, "{0} key == {1}:".format(
+                keyword, (number << 3) | _wire_type(ty)))
+            self.emit_dec_field(3, ty, x)
+            keyword = "elif"
+        if xs:
+            emit(2, "else:")
+            emit(3, "pos = _skip(buf, pos, key)")
+        else:
+            emit(2, "pos = _skip(buf, pos, key)")
+        emit(1, "if pos != end: raise _struct_error()")
+        if xs:
+            emit(1, "if " + " or ".join(x + " is _missing" for x in xs) + ":")
+            emit(2, "raise _missing_field({0}, {1!r})".format(
+                _tuple_source(xs), tuple(lbl for _, lbl, _ in fields)))
+        emit(1, "return " + result(xs))
+        emit(0, "")
+        self.src.end()
+
+    def decoder(self, ty):
+        """Returns the name of a function that reads the message between
+        pos and end in buf as a record, tpl or variant value."""
+        key = _key(ty)
+        name, new = self.src.name((key, "dec"), "_dec_")
+        if not new: return name
+        if ty.fragment is variant:
+            case_decoders = [ ]
+            for number, tag, fields in self.cases(ty):
+                if fields:
+                    case_name, _ = self.src.name(
+                        (key, "dec", tag), "_dec_")
+                    self.emit_message_decoder(
+                        case_name, fields,
+                        lambda xs, tag=tag: _tuple_source([repr(tag)] + xs))
+                else:
+                    case_name = None
+                case_decoders.append((number, tag, case_name))
+            emit = self.src.emit
+            self.src.begin()
+            emit(0, "def " + name + "(buf, pos, end):")
+            emit(1, "v = _missing")
+            emit(1, "while pos < end:")
+            self.emit_read_key(2)
+            keyword = "if"
+            for number, tag, case_name in case_decoders:
+                emit(2, "{0} key == {1}:".format(keyword, (number << 3) | 2))
+                self.emit_read_varint(3, "n")
+                if case_name is None:
+                    emit(3, "v = (" + repr(tag) + ",)")
+                else:
+                    emit(3, "v = " + case_name + "(buf, pos, pos + n)")
+                emit(3, "pos += n")
+                keyword = "elif"
+            emit(2, "else:")
+            emit(3, "pos = _skip(buf, pos, key)")
+            emit(1, "if pos != end: raise _struct_error()")
+            emit(1, "if v is _missing: raise ValueError('Missing case.')")
+            emit(1, "return v")
+            emit(0, "")
+            self.src.end()
+        else:
+            self.emit_message_decoder(
+                name, self.fields(ty),
+                _tuple_source)
+        return name
+
+    def codec(self, ty):
+        emit = self.src.emit
+        if ty.fragment in (record, tpl, variant):
+            enc_name, dec_name = self.encoder(ty), self.decoder(ty)
+            emit(0, "def encode(v):")
+            emit(1, "out = bytearray()")
+            emit(1, enc_name + "(v, out)")
+            emit(1, "return bytes(out)")
+        else:
+            dec_name = "_dec_value"
+            self.emit_message_decoder(
+                dec_name, [(1, 1, ty)], lambda xs: xs[0])
+            emit(0, "def encode(v):")
+            emit(1, "out = bytearray()")
+            self.emit_enc_field(1, "out", 1, ty, "v")
+            emit(1, "return bytes(out)")
+        emit(0, "")
+        emit(0, "def decode(data):")
+        emit(1, "if not isinstance(data, bytes): data = bytes(data)")
+        emit(1, "try:")
+        emit(2, "return " + dec_name + "(data, 0, len(data))")
+        emit(1, "except (IndexError, _struct_error):")
+        emit(2, "raise ValueError('Malformed message.')")
+        source, env = self.src.compile()
+        return Codec(ty, env['encode'], env['decode'], source)
+
+def _codec(codecs, gen, c, lbl):
+    ty = _member_ty(c, lbl)
+    key = _key(ty)
+    try:
+        return codecs[key]
+    except KeyError:
+        codec = codecs[key] = gen().codec(ty)
+        return codec
+
+_proto_codecs = { }
+
+def proto_codec(c, lbl):
+    """Returns the proto Codec for type member lbl of component c.
+
+    encode returns bytes. decode accepts any bytes-like object and raises
+    ValueError if it is not a message of the type.
+    """
+    return _codec(_proto_codecs, _ProtoGen, c, lbl)
+
+#
+# json
+#
+
+def _invalid(expected, x):
+    s = repr(x)
+    if len(s) > 60:
+        s = s[:57] + "..."
+    return ValueError("Expected " + expected + ", got " + s + ".")
+
+def _to_float(x):
+    if x.__class__ is int:
+        return float(x)
+    raise _invalid("ieee", x)
+
+_json_env = {
+    '_invalid': _invalid,
+    '_to_float': _to_float
+}
+
+class _JSONGen(object):
+    seq_classes = ("list",)
+
+    def __init__(self):
+        self.src = _Source(_json_env)
+
+    def enc_expr(self, ty, x):
+        """Returns an expression for the JSON value of x, of type ty.
+        Records and tpls are converted inline."""
+        fragment = ty.fragment
+        idx = ty.idx
+        if fragment is unit:
+            return "None"
+        elif fragment is record:
+            return "{" + ", ".join(
+                "{0!r}: {1}".format(lbl, self.enc_expr(
+                    _canonical(idx[lbl]), "{0}[{1}]".format(x, n)))
+                for n, lbl in enumerate(sorted(idx.keys()))) + "}"
+        elif fragment is tpl:
+            return "[" + ", ".join(
+                self.enc_expr(_canonical(field_ty), "{0}[{1}]".format(x, n))
+                for n, field_ty in enumerate(idx.values())) + "]"
+        elif fragment is variant:
+            return self.encoder(ty) + "(" + x + ")"
+        elif fragment in (boolean, num, ieee, string):
+            return x
+        raise UsageError("No JSON representation for " + str(ty) + ".")
+
+    def encoder(self, ty):
+        name, new = self.src.name((_key(ty), "enc"), "_enc_")
+        if not new: return name
+        self.src.begin()
+        emit = self.src.emit
+        emit(0, "def " + name + "(v):")
+        emit(1, "tag = v[0]")
+        for tag in sorted(ty.idx.keys()):
+            args = ["v[" + str(n + 1) + "]" for n in range(len(ty.idx[tag]))]
+            emit(1, "if tag == " + repr(tag) + ":")
+            emit(2, "return {{{0!r}: [{1}]}}".format(tag, ", ".join(
+                self.enc_expr(_canonical(arg_ty), x)
+                for arg_ty, x in zip(ty.idx[tag], args))))
+        emit(1, "raise ValueError('Invalid tag: ' + repr(tag))")
+        emit(0, "")
+        self.src.end()
+        return name
+
+    def emit_check(self, d, ty, x):
+        """Checks that x is the JSON value of a value of type ty, and
+        converts it to that value."""
+        emit = self.src.emit
+        fragment = ty.fragment
+        if fragment is num:
+            emit(d, "if {0}.__class__ is not int: raise _invalid('num', {0})"
+                    .format(x))
+        elif fragment is ieee:
+            emit(d, "if {0}.__class__ is not float: {0} = _to_float({0})"
+                    .format(x))
+        elif fragment is string:
+            emit(d, "if {0}.__class__ is not str: "
+                    "raise _invalid('string', {0})".format(x))
+        elif fragment is boolean:
+            emit(d, "if {0}.__class__ is not bool: "
+                    "raise _invalid('boolean', {0})".format(x))
+        elif fragment is unit:
+            emit(d, "if {0} is not None: raise _invalid('unit', {0})"
+                    .format(x))
+            emit(d, x + " = ()")
+        elif fragment in (record, tpl, variant):
+            emit(d, "{0} = {1}({0})".format(x, self.decoder(ty)))
+        else:
+            raise UsageError(
+                "No JSON representation for " + str(ty) + ".")
+
+    def emit_seq_check(self, d, v, n, expected):
+        not_seq = " and ".join(
+            "{0}.__class__ is not {1}".format(v, seq_class)
+            for seq_class in self.seq_classes)
+        self.src.emit(d, "if {0} or len({1}) != {2}: "
+                         "raise _invalid({3!r}, {1})".format(
+                             not_seq, v, n, expected))
+
+    def emit_fields_check(self, d, fields, xs):
+        for field_ty, x in zip(fields, xs):
+            self.emit_check(d, _canonical(field_ty), x)
+
+    def decoder(self, ty):
+        name, new = self.src.name((_key(ty), "dec"), "_dec_")
+        if not new: return name
+        self.src.begin()
+        emit = self.src.emit
+        emit(0, "def " + name + "(v):")
+        fragment, idx = ty.fragment, ty.idx
+        if fragment is record:
+            lbls = sorted(idx.keys())
+            xs = ["x" + str(n) for n in range(len(lbls))]
+            emit(1, "if not isinstance(v, dict): raise _invalid('record', v)")
+            if xs:
+                emit(1, "try:")
+                for lbl, x in zip(lbls, xs):
+                    emit(2, "{0} = v[{1!r}]".format(x, lbl))
+                emit(1, "except KeyError as e:")
+                emit(2, "raise ValueError('Missing field: ' + e.args[0])")
+            self.emit_fields_check(1, [idx[lbl] for lbl in lbls], xs)
+            emit(1, "return " + _tuple_source(xs))
+        elif fragment is tpl:
+            xs = ["x" + str(n) for n in range(len(idx))]
+            self.emit_seq_check(1, "v", len(xs), "tpl")
+            if xs:
+                emit(1, ", ".join(xs) + ("," if len(xs) == 1 else "") +
+                        " = v")
+            self.emit_fields_check(1, list(idx.values()), xs)
+            emit(1, "return " + _tuple_source(xs))
+        else:
+            emit(1, "if not isinstance(v, dict) or len(v) != 1: "
+                    "raise _invalid('variant', v)")
+            emit(1, "(tag, args), = v.items()")
+            for tag in sorted(idx.keys()):
+                xs = ["x" + str(n) for n in range(len(idx[tag]))]
+                emit(1, "if tag == " + repr(tag) + ":")
+                self.emit_seq_check(2, "args", len(xs), "arguments of " + tag)
+                if xs:
+                    emit(2, ", ".join(xs) + ("," if len(xs) == 1 else "") +
+                            " = args")
+                self.emit_fields_check(2, idx[tag], xs)
+                emit(2, "return " + _tuple_source([repr(tag)] + xs))
+            emit(1, "raise ValueError('Invalid tag: ' + repr(tag))")
+        emit(0, "")
+        self.src.end()
+        return name
+
+    def codec(self, ty):
+        emit = self.src.emit
+        emit(0, "def encode(v):")
+        emit(1, "return " + self.enc_expr(ty, "v"))
+        emit(0, "")
+        emit(0, "def decode(v):")
+        self.emit_check(1, ty, "v")
+        emit(1, "return v")
+        source, env = self.src.compile()
+        return Codec(ty, env['encode'], env['decode'], source)
+
+_json_codecs = { }
+
+def json_codec(c, lbl):
+    """Returns the JSON Codec for type member lbl of component c.
+
+    encode returns a value that json.dumps accepts: a record becomes a dict
+    from labels to field values, a tpl a list, a variant value a dict from
+    its tag to the list of its arguments and unit None. decode reverses
+    this, ignoring unknown record fields, and raises ValueError if its
+    argument does not represent a value of the type.
+    """
+    return _codec(_json_codecs, _JSONGen, c, lbl)
+
+#
+# msgpack
+#
+
+_mp_BH = struct.Struct(">BH").pack
+_mp_BI = struct.Struct(">BI").pack
+_mp_BQ = struct.Struct(">BQ").pack
+_mp_Bb = struct.Struct(">Bb").pack
+_mp_Bh = struct.Struct(">Bh").pack
+_mp_Bi = struct.Struct(">Bi").pack
+_mp_Bq = struct.Struct(">Bq").pack
+_mp_Bd = struct.Struct(">Bd").pack
+_mp_unpack_d = struct.Struct(">d").unpack_from
+_mp_unpack_f = struct.Struct(">f").unpack_from
+
+def _mp_int(n):
+    """The msgpack encoding of an int that is not a positive fixint."""
+    if n >= 0:
+        if n < 0x100: return bytes((0xcc, n))
+        elif n < 0x10000: return _mp_BH(0xcd, n)
+        elif n < 0x100000000: return _mp_BI(0xce, n)
+        elif n < 0x10000000000000000: return _mp_BQ(0xcf, n)
+    else:
+        if n >= -0x20: return bytes((n & 0xff,))
+        elif n >= -0x80: return _mp_Bb(0xd0, n)
+        elif n >= -0x8000: return _mp_Bh(0xd1, n)
+        elif n >= -0x80000000: return _mp_Bi(0xd2, n)
+        elif n >= -0x8000000000000000: return _mp_Bq(0xd3, n)
+    raise ValueError("Integer out of range for msgpack: " + str(n))
+
+def _mp_len_header(n, fix, fix_n, h8, h16, h32):
+    if n < fix_n: return bytes((fix | n,))
+    elif h8 is not None and n < 0x100: return bytes((h8, n))
+    elif n < 0x10000: return _mp_BH(h16, n)
+    elif n < 0x100000000: return _mp_BI(h32, n)
+    raise ValueError("Too long for msgpack: " + str(n))
+
+def _mp_str_header(n):
+    return _mp_len_header(n, 0xa0, 32, 0xd9, 0xda, 0xdb)
+
+def _mp_bin_header(n):
+    return _mp_len_header(n, 0, 0, 0xc4, 0xc5, 0xc6)
+
+def _mp_array_header(n):
+    return _mp_len_header(n, 0x90, 16, None, 0xdc, 0xdd)
+
+def _mp_map_header(n):
+    return _mp_len_header(n, 0x80, 16, None, 0xde, 0xdf)
+
+def _mp_str(s):
+    b = s.encode("utf-8")
+    return _mp_str_header(len(b)) + b
+
+_mp_B, _mp_H, _mp_I, _mp_Q = (
+    struct.Struct(">B"), struct.Struct(">H"),
+    struct.Struct(">I"), struct.Struct(">Q"))
+
+_mp_int_formats = {
+    0xcc: _mp_B, 0xcd: _mp_H, 0xce: _mp_I, 0xcf: _mp_Q,
+    0xd0: struct.Struct(">b"), 0xd1: struct.Struct(">h"),
+    0xd2: struct.Struct(">i"), 0xd3: struct.Struct(">q")
+}
+
+_mp_len_formats = {
+    0xd9: ("string", _mp_B), 0xda: ("string", _mp_H),
+    0xdb: ("string", _mp_I),
+    0xc4: ("bytes", _mp_B), 0xc5: ("bytes", _mp_H), 0xc6: ("bytes", _mp_I),
+    0xdc: ("array", _mp_H), 0xdd: ("array", _mp_I),
+    0xde: ("map", _mp_H), 0xdf: ("map", _mp_I)
+}
+
+# the sizes of fixed-size values after their header byte
+_mp_fixed_sizes = {
+    0xc0: 0, 0xc2: 0, 0xc3: 0,
+    0xcc: 1, 0xcd: 2, 0xce: 4, 0xcf: 8,
+    0xd0: 1, 0xd1: 2, 0xd2: 4, 0xd3: 8,
+    0xca: 4, 0xcb: 8,
+    0xd4: 2, 0xd5: 3, 0xd6: 5, 0xd7: 9, 0xd8: 17
+}
+
+_mp_ext_formats = {0xc7: _mp_B, 0xc8: _mp_H, 0xc9: _mp_I}
+
+def _mp_invalid(expected, h):
+    return ValueError(
+        "Expected " + expected + ", got msgpack type " + hex(h) + ".")
+
+def _mp_int_from(buf, pos, h):
+    """Reads an int whose header byte, h, was at pos - 1, and which is not a
+    fixint."""
+    s = _mp_int_formats.get(h)
+    if s is None:
+        raise _mp_invalid("num", h)
+    return s.unpack_from(buf, pos)[0], pos + s.size
+
+def _mp_float_from(buf, pos, h):
+    if h == 0xcb:
+        return _mp_unpack_d(buf, pos)[0], pos + 8
+    elif h == 0xca:
+        return _mp_unpack_f(buf, pos)[0], pos + 4
+    elif h < 0x80:
+        return float(h), pos
+    elif h >= 0xe0:
+        return float(h - 0x100), pos
+    s = _mp_int_formats.get(h)
+    if s is None:
+        raise _mp_invalid("ieee", h)
+    return float(s.unpack_from(buf, pos)[0]), pos + s.size
+
+def _mp_len(buf, pos, h, kind):
+    """Reads the length of a str, bin, array or map, whose header byte, h,
+    was at pos - 1, and which is not a fixstr, fixarray or fixmap."""
+    k, s = _mp_len_formats.get(h, (None, None))
+    if k != kind:
+        raise _mp_invalid(kind, h)
+    return s.unpack_from(buf, pos)[0], pos + s.size
+
+def _mp_skip(buf, pos):
+    """Skips the value at pos."""
+    h = buf[pos]
+    pos += 1
+    if h < 0x80 or h >= 0xe0:
+        return pos
+    elif h < 0x90:
+        n = 2 * (h - 0x80)
+    elif h < 0xa0:
+        n = h - 0x90
+    elif h < 0xc0:
+        return pos + h - 0xa0
+    elif h in _mp_fixed_sizes:
+        return pos + _mp_fixed_sizes[h]
+    elif h in _mp_ext_formats:
+        s = _mp_ext_formats[h]
+        return pos + s.size + 1 + s.unpack_from(buf, pos)[0]
+    else:
+        k, s = _mp_len_formats.get(h, (None, None))
+        if s is None:
+            raise _mp_invalid("a msgpack value", h)
+        n = s.unpack_from(buf, pos)[0]
+        pos += s.size
+        if k == "string" or k == "bytes":
+            return pos + n
+        elif k == "map":
+            n *= 2
+    for _ in range(n):
+        pos = _mp_skip(buf, pos)
+    return pos
+
+_msgpack_env = {
+    '_mp_int': _mp_int,
+    '_mp_Bd': _mp_Bd,
+    '_mp_str_header': _mp_str_header,
+    '_mp_bin_header': _mp_bin_header,
+    '_mp_int_from': _mp_int_from,
+    '_mp_float_from': _mp_float_from,
+    '_mp_unpack_d': _mp_unpack_d,
+    '_mp_len': _mp_len,
+    '_mp_skip': _mp_skip,
+    '_mp_invalid': _mp_invalid,
+    '_missing_field': _missing_field,
+    '_missing': _missing,
+    '_struct_error': struct.error
+}
+
+class _MsgpackGen(object):
+    def __init__(self):
+        self.src = _Source(_msgpack_env)
+        self.pending = bytearray()
+        self.n_temps = 0
+
+    def temp(self):
+        self.n_temps += 1
+        return "t" + str(self.n_temps)
+
+    def flush(self, d):
+        """Emits the constant bytes written since the last flush."""
+        if self.pending:
+            self.src.emit(d, "out += " + repr(bytes(self.pending)))
+            self.pending = bytearray()
+
+    def emit_enc(self, d, ty, x):
+        """Appends the encoding of x, of type ty, to out. Records and tpls
+        are encoded inline, and constant bytes (headers and labels) are
+        written together."""
+        emit = self.src.emit
+        fragment, idx = ty.fragment, ty.idx
+        if fragment is unit:
+            self.pending.append(0xc0)
+        elif fragment is record or fragment is tpl:
+            if fragment is record:
+                lbls = sorted(idx.keys())
+                field_tys = [idx[lbl] for lbl in lbls]
+                self.pending += _mp_map_header(len(lbls))
+            else:
+                lbls = None
+                field_tys = list(idx.values())
+                self.pending += _mp_array_header(len(field_tys))
+            xs = [self.temp() for _ in field_tys]
+            if xs:
+                emit(d, ", ".join(xs) + ("," if len(xs) == 1 else "") +
+                        " = " + x)
+            for n, (field_ty, field_x) in enumerate(zip(field_tys, xs)):
+                if lbls is not None:
+                    self.pending += _mp_str(lbls[n])
+                self.emit_enc(d, _canonical(field_ty), field_x)
+        else:
+            self.flush(d)
+            if fragment is num:
+                emit(d, "if 0 <= {0} < 128: out.append({0})".format(x))
+                emit(d, "else: out += _mp_int(" + x + ")")
+            elif fragment is ieee:
+                emit(d, "out += _mp_Bd(203, " + x + ")")
+            elif fragment is boolean:
+                emit(d, "out.append(195 if " + x + " else 194)")
+            elif fragment is string:
+                emit(d, "b = " + x + ".encode()")
+                emit(d, "n = len(b)")
+                emit(d, "if n < 32: out.append(160 | n)")
+                emit(d, "else: out += _mp_str_header(n)")
+                emit(d, "out += b")
+            elif fragment is ibytes:
+                emit(d, "out += _mp_bin_header(len(" + x + "))")
+                emit(d, "out += " + x)
+            elif fragment is variant:
+                emit(d, self.encoder(ty) + "(" + x + ", out)")
+            else:
+                raise UsageError(
+                    "No msgpack representation for " + str(ty) + ".")
+
+    def encoder(self, ty):
+        name, new = self.src.name((_key(ty), "enc"), "_enc_")
+        if not new: return name
+        self.src.begin()
+        pending, self.pending = self.pending, bytearray()
+        emit = self.src.emit
+        emit(0, "def " + name + "(v, out):")
+        emit(1, "tag = v[0]")
+        for tag in sorted(ty.idx.keys()):
+            arg_tys = ty.idx[tag]
+            emit(1, "if tag == " + repr(tag) + ":")
+            self.pending += b"\x81" + _mp_str(tag)
+            self.pending += _mp_array_header(len(arg_tys))
+            xs = [self.temp() for _ in arg_tys]
+            if xs:
+                emit(2, ", ".join(["_"] + xs) + " = v")
+            for arg_ty, x in zip(arg_tys, xs):
+                self.emit_enc(2, _canonical(arg_ty), x)
+            self.flush(2)
+            emit(2, "return")
+        emit(1, "raise ValueError('Invalid tag: ' + repr(tag))")
+        emit(0, "")
+        self.pending = pending
+        self.src.end()
+        return name
+
+    def emit_len(self, d, n, fix, fix_n, kind):
+        emit = self.src.emit
+        emit(d, "h = buf[pos]")
+        emit(d, "pos += 1")
+        emit(d, "if {0} <= h < {1}: {2} = h - {0}".format(
+            fix, fix + fix_n, n))
+        emit(d, "else: {0}, pos = _mp_len(buf, pos, h, {1!r})".format(
+            n, kind))
+
+    def emit_dec(self, d, ty, x):
+        """Reads a value of type ty at pos into x."""
+        emit = self.src.emit
+        fragment = ty.fragment
+        if fragment is num:
+            emit(d, "h = buf[pos]")
+            emit(d, "pos += 1")
+            emit(d, "if h < 128: " + x + " = h")
+            emit(d, "elif h >= 224: " + x + " = h - 256")
+            emit(d, "else: " + x + ", pos = _mp_int_from(buf, pos, h)")
+        elif fragment is ieee:
+            emit(d, "h = buf[pos]")
+            emit(d, "pos += 1")
+            emit(d, "if h == 203:")
+            emit(d + 1, x + " = _mp_unpack_d(buf, pos)[0]")
+            emit(d + 1, "pos += 8")
+            emit(d, "else: " + x + ", pos = _mp_float_from(buf, pos, h)")
+        elif fragment is boolean:
+            emit(d, "h = buf[pos]")
+            emit(d, "pos += 1")
+            emit(d, "if h == 195: " + x + " = True")
+            emit(d, "elif h == 194: " + x + " = False")
+            emit(d, "else: raise _mp_invalid('boolean', h)")
+        elif fragment is unit:
+            emit(d, "if buf[pos] != 192: raise _mp_invalid('unit', buf[pos])")
+            emit(d, "pos += 1")
+            emit(d, x + " = ()")
+        elif fragment is string:
+            self.emit_len(d, "n", 0xa0, 32, "string")
+            emit(d, x + " = buf[pos:pos + n].decode()")
+            emit(d, "pos += n")
+        elif fragment is ibytes:
+            emit(d, "h = buf[pos]")
+            emit(d, "pos += 1")
+            emit(d, "n, pos = _mp_len(buf, pos, h, 'bytes')")
+            emit(d, x + " = buf[pos:pos + n]")
+            emit(d, "pos += n")
+        elif fragment in (record, tpl, variant):
+            emit(d, "{0}, pos = {1}(buf, pos)".format(x, self.decoder(ty)))
+        else:
+            raise UsageError(
+                "No msgpack representation for " + str(ty) + ".")
+
+    def decoder(self, ty):
+        name, new = self.src.name((_key(ty), "dec"), "_dec_")
+        if not new: return name
+        self.src.begin()
+        emit = self.src.emit
+        emit(0, "def " + name + "(buf, pos):")
+        fragment, idx = ty.fragment, ty.idx
+        if fragment is record:
+            lbls = sorted(idx.keys())
+            xs = ["x" + str(n) for n in range(len(lbls))]
+            self.emit_len(1, "m", 0x80, 16, "map")
+            if xs:
+                emit(1, " = ".join(xs) + " = _missing")
+            emit(1, "for _ in range(m):")
+            self.emit_len(2, "n", 0xa0, 32, "string")
+            emit(2, "key = buf[pos:pos + n]")
+            emit(2, "pos += n")
+            keyword = "if"
+            for lbl, x in zip(lbls, xs):
+                emit(2, "{0} key == {1!r}:".format(
+                    keyword, lbl.encode("utf-8")))
+                self.emit_dec(3, _canonical(idx[lbl]), x)
+                keyword = "elif"
+            if xs:
+                emit(2, "else: pos = _mp_skip(buf, pos)")
+                emit(1, "if " + " or ".join(
+                    x + " is _missing" for x in xs) + ":")
+                emit(2, "raise _missing_field({0}, {1!r})".format(
+                    _tuple_source(xs), tuple(lbls)))
+            else:
+                emit(2, "pos = _mp_skip(buf, pos)")
+            emit(1, "return " + _tuple_source(xs) + ", pos")
+        elif fragment is tpl:
+            xs = ["x" + str(n) for n in range(len(idx))]
+            self.emit_len(1, "m", 0x90, 16, "array")
+            emit(1, "if m != {0}: raise ValueError('Expected {0} "
+                    "components.')".format(len(xs)))
+            for field_ty, x in zip(idx.values(), xs):
+                self.emit_dec(1, _canonical(field_ty), x)
+            emit(1, "return " + _tuple_source(xs) + ", pos")
+        else:
+            self.emit_len(1, "m", 0x80, 16, "map")
+            emit(1, "if m != 1: raise ValueError('Expected one case.')")
+            self.emit_len(1, "n", 0xa0, 32, "string")
+            emit(1, "tag = buf[pos:pos + n]")
+            emit(1, "pos += n")
+            self.emit_len(1, "m", 0x90, 16, "array")
+            for tag in sorted(idx.keys()):
+                arg_tys = idx[tag]
+                xs = ["x" + str(n) for n in range(len(arg_tys))]
+                emit(1, "if tag == {0!r}:".format(tag.encode("utf-8")))
+                emit(2, "if m != {0}: raise ValueError('Expected {0} "
+                        "arguments.')".format(len(xs)))
+                for arg_ty, x in zip(arg_tys, xs):
+                    self.emit_dec(2, _canonical(arg_ty), x)
+                emit(2, "return " + _tuple_source([repr(tag)] + xs) +
+                        ", pos")
+            emit(1, "raise ValueError('Invalid tag: ' + repr(tag))")
+        emit(0, "")
+        self.src.end()
+        return name
+
+    def codec(self, ty):
+        emit = self.src.emit
+        emit(0, "def encode(v):")
+        emit(1, "out = bytearray()")
+        self.emit_enc(1, ty, "v")
+        self.flush(1)
+        emit(1, "return bytes(out)")
+        emit(0, "")
+        emit(0, "def decode(data):")
+        emit(1, "if not isinstance(data, bytes): data = bytes(data)")
+        emit(1, "buf = data")
+        emit(1, "pos = 0")
+        emit(1, "try:")
+        self.emit_dec(2, ty, "v")
+        emit(1, "except (IndexError, _struct_error):")
+        emit(2, "raise ValueError('Malformed msgpack data.')")
+        emit(1, "if pos != len(buf): raise ValueError("
+                "'Malformed msgpack data.')")
+        emit(1, "return v")
+        source, env = self.src.compile()
+        return Codec(ty, env['encode'], env['decode'], source)
+
+_msgpack_codecs = { }
+
+def msgpack_codec(c, lbl):
+    """Returns the msgpack Codec for type member lbl of component c.
+
+    Values are represented as by json_codec, with bytes values as msgpack
+    bin values. encode returns bytes. decode accepts any bytes-like object,
+    ignores unknown record fields, and raises ValueError if it is not the
+    msgpack encoding of a value of the type.
+    """
+    return _codec(_msgpack_codecs, _MsgpackGen, c, lbl)
+
+#
+# validators
+#
+
+class Validator(object):
+    """Checks and converts Python values into values of ty.
+
+    validate converts a single value. validate_rows converts a list of
+    values. source is the generated Python source of the functions.
+    """
+    __slots__ = ('ty', 'validate', 'validate_rows', 'source')
+
+    def __init__(self, ty, validate, validate_rows, source):
+        self.ty = ty
+        self.validate = validate
+        self.validate_rows = validate_rows
+        self.source = source
+
+def _rows(validate, rows):
+    values = [ ]
+    append = values.append
+    for i, row in enumerate(rows):
+        try:
+            append(validate(row))
+        except ValueError as e:
+            raise ValueError("Row " + str(i) + ": " + str(e))
+    return values
+
+def _classes(xs):
+    return set(map(type, xs))
+
+_py_env = dict(_json_env)
+_py_env.update({
+    '_rows': _rows,
+    '_classes': _classes,
+    '_itemgetter': operator.itemgetter,
+    '_int': frozenset((int,)),
+    '_float': frozenset((float,)),
+    '_int_float': frozenset((int, float)),
+    '_str': frozenset((str,)),
+    '_bool': frozenset((bool,)),
+    '_dict': frozenset((dict,)),
+    '_seq': frozenset((list, tuple))
+})
+
+class _PyGen(_JSONGen):
+    seq_classes = ("list", "tuple")
+
+    def __init__(self):
+        self.src = _Source(_py_env)
+        self.n_temps = 0
+
+    def temp(self):
+        self.n_temps += 1
+        return "c" + str(self.n_temps)
+
+    def emit_column(self, d, ty, col):
+        """Checks and converts the list col of values of type ty in place,
+        a column at a time. The values of records and tpls are split into
+        a column per field, and the converted columns are zipped back
+        together. Raises ValueError, KeyError or IndexError if col is not 
+        a column of values that this accepts, so that it can be checked 
+        again one value at a time."""
+        emit = self.src.emit
+        fragment, idx = ty.fragment, ty.idx
+        if fragment is num:
+            emit(d, "if not _classes({0}) <= _int: raise ValueError".format(
+                col))
+        elif fragment is ieee:
+            emit(d, "classes = _classes(" + col + ")")
+            emit(d, "if not classes <= _float:")
+            emit(d + 1, "if not classes <= _int_float: raise ValueError")
+            emit(d + 1, "{0} = list(map(float, {0}))".format(col))
+        elif fragment is string:
+            emit(d, "if not _classes({0}) <= _str: raise ValueError".format(
+                col))
+        elif fragment is boolean:
+            emit(d, "if not _classes({0}) <= _bool: raise ValueError".format(
+                col))
+        elif fragment is unit:
+            emit(d, "if {0}.count(None) != len({0}): raise ValueError".format(
+                col))
+            emit(d, "{0} = [()] * len({0})".format(col))
+        elif fragment is record or fragment is tpl:
+            if fragment is record:
+                emit(d, "if not _classes({0}) <= _dict: raise ValueError"
+                        .format(col))
+                keys = sorted(idx.keys())
+                field_tys = [idx[lbl] for lbl in keys]
+            else:
+                emit(d, "if not _classes({0}) <= _seq: raise ValueError"
+                        .format(col))
+                emit(d, "if {0} and set(map(len, {0})) != {{{1}}}: "
+                        "raise ValueError".format(col, len(idx)))
+                keys = list(range(len(idx)))
+                field_tys = list(idx.values())
+            cols = [self.temp() for _ in keys]
+            for key, field_ty, field_col in zip(keys, field_tys, cols):
+                emit(d, "{0} = list(map(_itemgetter({1!r}), {2}))".format(
+                    field_col, key, col))
+                self.emit_column(d, _canonical(field_ty), field_col)
+            if cols:
+                emit(d, "{0} = list(zip({1}))".format(col, ", ".join(cols)))
+            else:
+                emit(d, "{0} = [()] * len({0})".format(col))
+        elif fragment is variant:
+            emit(d, "{0} = list(map({1}, {0}))".format(
+                col, self.decoder(ty)))
+        else:
+            raise UsageError("Cannot validate values of " + str(ty) + ".")
+
+    def codec(self, ty):
+        emit = self.src.emit
+        emit(0, "def validate(v):")
+        self.emit_check(1, ty, "v")
+        emit(1, "return v")
+        emit(0, "")
+        emit(0, "def validate_rows(rows):")
+        emit(1, "if rows.__class__ is not list: rows = list(rows)")
+        emit(1, "v = rows")
+        emit(1, "try:")
+        self.emit_column(2, ty, "v")
+        # a column that passes unchanged is still returned as a new list
+        emit(2, "if v is rows: v = list(v)")
+        emit(2, "return v")
+        emit(1, "except (ValueError, KeyError, IndexError):")
+        emit(2, "return _rows(validate, rows)")
+        source, env = self.src.compile()
+        return Validator(ty, env['validate'], env['validate_rows'], source)
+
+_validators = { }
+
+def validator(c, lbl):
+    """Returns the Validator for type member lbl of component c.
+
+    Values are represented as by json_codec, except that tuples may be used
+    in place of lists. Each function raises ValueError if it is given
+    something that does not represent a value (or a list of values) of the
+    type; validate_rows reports the position of the first such row.
+    validate_rows checks and converts the fields of records and tpls a
+    column at a time, so it is faster than validating each row in turn.
+    """
+    return _codec(_validators, _PyGen, c, lbl)
@@ -1,39 +1,72 @@
 # 
-# DictStack
+# ScopeStack
 # 
 
-class DictStack(object):
-    def __init__(self, stack=None):
-        if stack is None:
-            stack = []
-        self.stack = stack 
+class ScopeStack(object):
+    """A stack of scopes with O(1) lookup, binding, push and pop.
 
-    def push(self, d):
-        self.stack.append(d)
+    Each key maps to the stack of its bindings, innermost last. An undo log
+    records the order in which keys were bound, so popping a scope (or 
+    rolling back to a checkpoint) restores exactly the shadowed bindings.
+    """
+    def __init__(self, d=None):
+        self._bindings = { }
+        self._log = [ ]
+        self._frames = [ ]
+        if d is not None:
+            self.update(d)
+
+    def push(self, d=None):
+        self._frames.append(len(self._log))
+        if d is not None:
+            self.update(d)
         return self
 
     def pop(self):
-        return self.stack.pop()
+        self._unwind(self._frames.pop())
+
+    def checkpoint(self):
+        return (len(self._frames), len(self._log))
+
+    def rollback(self, checkpoint):
+        n_frames, n_log = checkpoint
+        del self._frames[n_frames:]
+        self._unwind(n_log)
+
+    def bindings_since(self, checkpoint):
+        """Returns the (key, value) bindings made since checkpoint, in 
+        order, so that they can be replayed after a rollback."""
+        return tuple(self._log[checkpoint[1]:])
+
+    def replay(self, bindings):
+        for key, value in bindings:
+            self[key] = value
+
+    def _unwind(self, n_log):
+        log, bindings = self._log, self._bindings
+        while len(log) > n_log:
+            key, _ = log.pop()
+            values = bindings[key]
+            values.pop()
+            if not values:
+                del bindings[key]
 
-    def peek(self):
-        return self.stack[-1]
+    def update(self, d):
+        for key, value in d.items():
+            self[key] = value
 
     def __getitem__(self, key):
-        for d in reversed(self.stack):
-            try:
-                return d[key]
-            except KeyError:
-                pass
-        raise KeyError(key)
+        return self._bindings[key][-1]
 
     def __setitem__(self, key, value):
-        self.peek()[key] = value
+        try:
+            self._bindings[key].append(value)
+        except KeyError:
+            self._bindings[key] = [value]
+        self._log.append((key, value))
 
     def __contains__(self, key):
-        for d in reversed(self.stack):
-            if key in d: 
-                return True
-        return False 
+        return key in self._bindings
 
 def _dict_pos_of(key, d):
     for i, k in enumerate(d.keys()):
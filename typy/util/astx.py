@@ -234,6 +234,55 @@ def isinstance_builtin_id(scrutinee, cls_name):
                     attr=cls_name,
                     ctx=load_ctx)])
 
+def referenced_ids(tree):
+    """Returns the set of identifiers that appear as Names in tree."""
+    return set(node.id for node in ast.walk(tree)
+               if isinstance(node, ast.Name))
+
+def bound_ids(tree):
+    """Returns the set of identifiers that tree binds in any scope."""
+    ids = set()
+    for node in ast.walk(tree):
+        if isinstance(node, ast.Name):
+            if not isinstance(node.ctx, ast.Load):
+                ids.add(node.id)
+        elif isinstance(node, (ast.FunctionDef, ast.AsyncFunctionDef,
+                               ast.ClassDef)):
+            ids.add(node.name)
+        elif isinstance(node, ast.arg):
+            ids.add(node.arg)
+        elif isinstance(node, (ast.Import, ast.ImportFrom)):
+            for alias in node.names:
+                ids.add(alias.asname or alias.name.split(".")[0])
+        elif isinstance(node, ast.ExceptHandler):
+            if node.name is not None:
+                ids.add(node.name)
+        elif isinstance(node, (ast.Global, ast.Nonlocal)):
+            ids.update(node.names)
+    return ids
+
+def substitute_ids(tree, substitution):
+    """Returns a copy of tree where each Name whose id is a key of
+    substitution is replaced by a copy of the corresponding expression."""
+    if isinstance(tree, ast.Name) and tree.id in substitution:
+        return ast.copy_location(
+            substitute_ids(substitution[tree.id], { }),
+            tree)
+    elif isinstance(tree, ast.AST):
+        new_tree = tree.__class__()
+        for name in tree._fields:
+            if hasattr(tree, name):
+                setattr(new_tree, name,
+                        substitute_ids(getattr(tree, name), substitution))
+        for name in tree._attributes:
+            if hasattr(tree, name):
+                setattr(new_tree, name, getattr(tree, name))
+        return new_tree
+    elif isinstance(tree, list):
+        return [substitute_ids(x, substitution) for x in tree]
+    else:
+        return tree
+
 def is_underscore(e):
     return isinstance(e, ast.Name) and e.id == "_"
 
@@ -0,0 +1,443 @@
+"""typy watch mode
+
+Keeps the components defined in a set of source files checked in memory and
+re-checks them as the files change. To run:
+
+  $ python -m typy.watch [--interval SECONDS] [--port PORT] PATH ...
+
+Each PATH is a .py file or a directory that is searched for .py files. Files
+are polled for changes. After each change, a JSON object describing the
+file's diagnostics is written to stdout, one per line:
+
+  {"file": "...", "diagnostics": [{"component": "Listing1", "line": 19,
+   "col": 12, "message": "..."}, ...]}
+
+With --port, a server on 127.0.0.1:PORT also sends the current diagnostics
+of every watched file, in the same format, to each client that connects.
+
+Modules are executed one top-level statement at a time. Definitions
+decorated with @component are not executed; they are checked directly from
+the parsed file, so unchanged components can be kept and changed components
+re-checked incrementally (see Component.recheck). When only component
+definitions change, the rest of the module is not re-executed. Files that
+import a changed watched file re-run those imports and rebuild the
+components that refer to the names they bind.
+
+Each watched file is registered in sys.modules under its dotted name
+relative to the watched directory (or its basename, for a file given on the
+command line), so watched files that import one another share the same
+module, and the same components. A file whose name is already taken, by a
+module that is not watched or by another watched file, is not run. While
+files are being checked, importing a watched file that changed since the
+last poll checks it first. Imports of other modules go through the normal
+import system.
+"""
+
+import ast
+import contextlib
+import importlib.abc
+import importlib.util
+import json
+import os
+import socketserver
+import sys
+import threading
+import time
+import types
+
+from .util import astx as _astx
+from ._errors import TypyError
+from ._components import Component, component
+from ._static_envs import StaticEnv
+
+__all__ = ('Watcher', 'main')
+
+def _is_component_decorator(decorator, namespace):
+    if isinstance(decorator, ast.Call):
+        decorator = decorator.func
+    try:
+        value = eval(compile(ast.Expression(body=decorator),
+                             "<decorator>", "eval"), namespace)
+    except Exception:
+        return False
+    return value is component
+
+def _component_options(decorator, namespace):
+    """Returns the keyword arguments given to a @component(...) decorator."""
+    def _options(f=None, sealed=False, fused=False, optimize=False):
+        return {'sealed': sealed, 'fused': fused, 'optimize': optimize}
+    if not isinstance(decorator, ast.Call):
+        return _options()
+    call = ast.Call(func=ast.Name(id='_options', ctx=ast.Load()),
+                    args=decorator.args, keywords=decorator.keywords)
+    expr = ast.fix_missing_locations(ast.Expression(body=call))
+    return eval(compile(expr, "<decorator>", "eval"), namespace,
+                {'_options': _options})
+
+def _imports(stmt, package):
+    """Returns the modules that the imports in stmt import, and the names
+    that they bind."""
+    modules, names = set(), set()
+    for node in ast.walk(stmt):
+        if isinstance(node, ast.Import):
+            for alias in node.names:
+                modules.add(alias.name)
+                names.add(alias.asname or alias.name.partition(".")[0])
+        elif isinstance(node, ast.ImportFrom):
+            module = node.module or ""
+            if node.level:
+                parts = package.split(".") if package else [ ]
+                base = ".".join(parts[:len(parts) - node.level + 1])
+                module = ".".join(m for m in (base, module) if m)
+            modules.add(module)
+            for alias in node.names:
+                modules.add(module + "." + alias.name)
+                names.add(alias.asname or alias.name)
+    return modules, names
+
+def _diagnostic(component_name, exn):
+    tree = getattr(exn, 'tree', None)
+    message = str(exn)
+    if not isinstance(exn, TypyError):
+        message = exn.__class__.__name__ + ": " + message
+    return {
+        "component": component_name,
+        "line": getattr(tree, 'lineno', None),
+        "col": getattr(tree, 'col_offset', None),
+        "message": message
+    }
+
+class _Unit(object):
+    """A top-level statement of a watched file."""
+    __slots__ = ('stmt', 'key', 'component_name')
+
+    def __init__(self, stmt, component_name):
+        self.stmt = stmt
+        self.key = ast.dump(stmt)
+        self.component_name = component_name
+
+def _module_name(root, path):
+    """Returns the dotted module name of path, relative to root."""
+    parts = os.path.splitext(os.path.relpath(path, root))[0].split(os.sep)
+    if len(parts) > 1 and parts[-1] == "__init__":
+        parts.pop()
+    return ".".join(parts)
+
+class _File(object):
+    """The state of a watched file."""
+    def __init__(self, path, name):
+        self.path = path
+        self.name = name
+        if os.path.basename(path) == "__init__.py":
+            self.package = name
+        else:
+            self.package = name.rpartition(".")[0]
+        self.module = types.ModuleType(self.name)
+        self.mtime = None
+        self.units = None
+        self.namespace = None
+        self.imports = set()
+        self.components = { }
+        self.refs = { }
+        self.diagnostics = { }
+
+    def report(self):
+        return {
+            "file": self.path,
+            "diagnostics": [d for ds in self.diagnostics.values()
+                            for d in ds]
+        }
+
+class _Importer(importlib.abc.MetaPathFinder, importlib.abc.Loader):
+    """Checks watched files that changed since the last poll when they are
+    imported by another watched file."""
+    def __init__(self, watcher):
+        self.watcher = watcher
+
+    def find_spec(self, fullname, path, target=None):
+        for f in self.watcher._stale:
+            if f.name == fullname:
+                return importlib.util.spec_from_loader(
+                    fullname, self, origin=f.path)
+        return None
+
+    def create_module(self, spec):
+        for f in self.watcher._stale:
+            if f.name == spec.name:
+                return f.module
+
+    def exec_module(self, module):
+        for f in list(self.watcher._stale):
+            if f.module is module:
+                self.watcher._check_file(f)
+
+class Watcher(object):
+    """Checks the components in a set of files, re-checking on change."""
+    def __init__(self, paths):
+        self.paths = paths
+        self.files = { }
+        self.lock = threading.Lock()
+        self._stale = set()
+        self._stale_names = set()
+        self._owners = { }
+
+    def _scan(self):
+        """Yields the path and module name of each watched file."""
+        for path in self.paths:
+            if os.path.isdir(path):
+                for dirpath, dirnames, filenames in os.walk(path):
+                    dirnames[:] = sorted(d for d in dirnames
+                                         if not d.startswith('.'))
+                    for filename in sorted(filenames):
+                        if filename.endswith(".py"):
+                            file_path = os.path.join(dirpath, filename)
+                            yield file_path, _module_name(path, file_path)
+            else:
+                yield path, _module_name(os.path.dirname(path), path)
+
+    def poll(self):
+        """Re-checks the files that changed since the last poll. Returns
+        the reports of the files that were (re-)checked."""
+        changed = [ ]
+        for path, name in self._scan():
+            try:
+                mtime = os.stat(path).st_mtime_ns
+            except OSError:
+                continue
+            f = self.files.get(path)
+            if f is None:
+                f = self.files[path] = _File(path, name)
+            if f.mtime == mtime:
+                continue
+            f.mtime = mtime
+            changed.append(f)
+        if not changed:
+            return [ ]
+        with self.lock:
+            # files that import changed files, directly or not, are 
+            # re-checked too
+            stale = list(changed)
+            stale_names = set(f.name for f in stale)
+            grew = True
+            while grew:
+                grew = False
+                for f in self.files.values():
+                    if (f not in stale and
+                            not f.imports.isdisjoint(stale_names)):
+                        stale.append(f)
+                        stale_names.add(f.name)
+                        grew = True
+            # stale files are checked when they are first imported by
+            # another stale file, or else in order
+            self._stale, self._stale_names = set(stale), stale_names
+            for f in stale:
+                if sys.modules.get(f.name) is f.module:
+                    del sys.modules[f.name]
+            importer = _Importer(self)
+            sys.meta_path.insert(0, importer)
+            try:
+                for f in stale:
+                    if f in self._stale:
+                        self._check_file(f)
+            finally:
+                sys.meta_path.remove(importer)
+                self._stale, self._stale_names = set(), set()
+            return [f.report() for f in stale]
+
+    def reports(self):
+        with self.lock:
+            return [f.report() for f in self.files.values()]
+
+    def _check_file(self, f):
+        self._stale.discard(f)
+        owner = self._owners.setdefault(f.name, f)
+        module = sys.modules.get(f.name)
+        if owner is not f or (module is not None and module is not f.module):
+            f.units = None
+            f.imports = set()
+            f.diagnostics = {None: [{
+                "component": None, "line": None, "col": None,
+                "message": "ImportError: module name " + repr(f.name) +
+                           " is already in use"}]}
+            return
+        sys.modules[f.name] = f.module
+        with open(f.path) as fp:
+            source = fp.read()
+        try:
+            tree = ast.parse(source, f.path)
+        except SyntaxError as e:
+            f.units = None
+            f.imports = set()
+            f.diagnostics = {None: [{
+                "component": None, "line": e.lineno, "col": e.offset,
+                "message": "SyntaxError: " + str(e.msg)}]}
+            return
+        old_units = f.units
+        if old_units is not None and self._same_code(old_units, tree.body):
+            self._update_components(f, tree.body)
+        else:
+            self._load(f, tree.body)
+
+    @staticmethod
+    def _same_code(old_units, stmts):
+        if len(old_units) != len(stmts):
+            return False
+        for unit, stmt in zip(old_units, stmts):
+            if unit.component_name is None:
+                if unit.key != ast.dump(stmt):
+                    return False
+            elif not (isinstance(stmt, ast.FunctionDef)
+                      and stmt.name == unit.component_name):
+                return False
+        return True
+
+    def _load(self, f, stmts):
+        """Executes the module from scratch and checks every component."""
+        namespace = f.namespace = f.module.__dict__
+        namespace.clear()
+        namespace.update({
+            '__name__': f.name,
+            '__file__': f.path,
+            '__package__': f.package,
+            '__builtins__': __builtins__
+        })
+        f.units = [ ]
+        f.imports = set()
+        f.components = { }
+        f.refs = { }
+        f.diagnostics = { }
+        for stmt in stmts:
+            if (isinstance(stmt, ast.FunctionDef)
+                    and len(stmt.decorator_list) == 1
+                    and _is_component_decorator(
+                        stmt.decorator_list[0], namespace)):
+                f.units.append(_Unit(stmt, stmt.name))
+                self._build_component(f, stmt)
+            else:
+                f.units.append(_Unit(stmt, None))
+                f.imports.update(_imports(stmt, f.package)[0])
+                module = ast.Module(body=[stmt])
+                try:
+                    exec(compile(module, f.path, "exec"), namespace)
+                except Exception as e:
+                    f.diagnostics[None] = [_diagnostic(None, e)]
+                    return
+
+    def _build_component(self, f, stmt):
+        name = stmt.name
+        f.refs[name] = _astx.referenced_ids(stmt)
+        try:
+            options = _component_options(stmt.decorator_list[0], f.namespace)
+            c = Component(stmt, StaticEnv({ }, f.namespace),
+                          options['fused'], options['optimize'])
+            with contextlib.redirect_stdout(sys.stderr):
+                c._evaluate()
+                if options['sealed']:
+                    c.seal()
+        except Exception as e:
+            f.diagnostics[name] = [_diagnostic(name, e)]
+        else:
+            f.diagnostics[name] = [ ]
+            f.namespace[name] = f.components[name] = c
+
+    def _update_components(self, f, stmts):
+        """Re-checks the changed components and rebuilds their dependents,
+        without re-executing the rest of the module. Imports of stale 
+        modules are re-run, and the components that refer to the names 
+        they bind are rebuilt."""
+        reimports, reimported = [ ], set()
+        for unit in f.units:
+            if unit.component_name is None:
+                modules, names = _imports(unit.stmt, f.package)
+                if not modules.isdisjoint(self._stale_names):
+                    reimports.append(unit)
+                    reimported.update(names)
+        # if other statements use the re-imported names, the whole module 
+        # is re-executed
+        for unit in f.units:
+            if (unit.component_name is None and unit not in reimports and
+                    not _astx.referenced_ids(unit.stmt).isdisjoint(
+                        reimported)):
+                self._load(f, stmts)
+                return
+        for unit in reimports:
+            try:
+                exec(compile(ast.Module(body=[unit.stmt]), f.path, "exec"),
+                     f.namespace)
+            except Exception as e:
+                f.diagnostics[None] = [_diagnostic(None, e)]
+                return
+        f.diagnostics.pop(None, None)
+
+        changed = set(reimported)
+        new_units = [ ]
+        for unit, stmt in zip(f.units, stmts):
+            new_unit = _Unit(stmt, unit.component_name)
+            new_units.append(new_unit)
+            name = unit.component_name
+            if name is None or unit.key == new_unit.key:
+                continue
+            changed.add(name)
+            c = f.components.get(name)
+            # sealed components, components whose decorator changed and
+            # components that refer to re-imported names are rebuilt 
+            # rather than re-checked
+            if (c is None or c._sealed or ast.dump(stmt.decorator_list[0])
+                    != ast.dump(unit.stmt.decorator_list[0]) or
+                    not _astx.referenced_ids(stmt).isdisjoint(reimported)):
+                self._build_component(f, stmt)
+                continue
+            f.refs[name] = _astx.referenced_ids(stmt)
+            try:
+                with contextlib.redirect_stdout(sys.stderr):
+                    c._recheck(stmt, StaticEnv({ }, f.namespace))
+            except Exception as e:
+                f.diagnostics[name] = [_diagnostic(name, e)]
+            else:
+                f.diagnostics[name] = [ ]
+        f.units = new_units
+
+        # components that refer to changed components or re-imported
+        # names are rebuilt
+        for unit in new_units:
+            name = unit.component_name
+            if name is None or name in changed:
+                continue
+            if not f.refs.get(name, set()).isdisjoint(changed):
+                changed.add(name)
+                self._build_component(f, unit.stmt)
+
+def _serve(watcher, port):
+    class Handler(socketserver.StreamRequestHandler):
+        def handle(self):
+            for report in watcher.reports():
+                self.wfile.write(
+                    (json.dumps(report) + "\n").encode('utf-8'))
+    server = socketserver.ThreadingTCPServer(('127.0.0.1', port), Handler)
+    server.daemon_threads = True
+    thread = threading.Thread(target=server.serve_forever)
+    thread.daemon = True
+    thread.start()
+    return server
+
+def main(argv=None):
+    import argparse
+    parser = argparse.ArgumentParser(prog="python -m typy.watch")
+    parser.add_argument('paths', nargs='+')
+    parser.add_argument('--interval', type=float, default=0.5)
+    parser.add_argument('--port', type=int, default=None)
+    args = parser.parse_args(argv)
+    watcher = Watcher(args.paths)
+    if args.port is not None:
+        _serve(watcher, args.port)
+    try:
+        while True:
+            for report in watcher.poll():
+                sys.stdout.write(json.dumps(report) + "\n")
+                sys.stdout.flush()
+            time.sleep(args.interval)
+    except KeyboardInterrupt:
+        pass
+
+if __name__ == "__main__":
+    main()